@@ -1,5 +1,14 @@
-import os
-from openai import AsyncOpenAI
 from app.config import OPENAI_API_KEY
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# OpenAI client, created on first use by get_client(), so importing the
+# pipeline needs neither the SDK nor an API key. Benchmarks and tests assign
+# a fake here before the first model call.
+client = None
+
+
+def get_client():
+    global client
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return client
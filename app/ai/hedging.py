@@ -0,0 +1,124 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from app.metrics import count
+from app.config import HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, HEDGE_WINDOW
+
+
+class RequestTimer:
+    """
+    One attempt's view of its HTTP requests, fed by `RateLimiter.call`: when
+    the first one went out, and how long each took. Limiter queueing and
+    429 pauses count toward neither.
+    """
+
+    def __init__(self, latencies: deque):
+        self.latencies = latencies
+        self.sent = asyncio.Event()
+
+    def start(self):
+        self.sent.set()
+
+    def stop(self, seconds: float):
+        self.latencies.append(seconds)
+
+
+class Hedger:
+    """
+    Speculative duplicates for slow model calls. A call whose request has
+    been out for longer than the `percentile` of recent request latencies is
+    sent again; the first valid answer wins and the other request is
+    cancelled. Both latencies and the hedge delay are measured from when the
+    request left the rate limiter, so a saturated limiter doesn't trigger
+    hedges.
+
+    Every call earns `budget` hedge credits (at most `max_credits` banked)
+    and a hedge spends one, so duplicates stay within `budget` of the calls
+    made. No hedging happens before `min_samples` latencies are known.
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = HEDGE_WINDOW, max_credits: float = 10):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.max_credits = max_credits
+        self.latencies = deque(maxlen=window)
+        self.credits = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        return {
+            "calls": self.calls, "hedged": self.hedged, "hedgeWins": self.hedge_wins,
+            "overBudget": self.over_budget, "delayMs": None if delay is None else int(delay * 1000),
+        }
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged, or None while too few calls are known."""
+        if len(self.latencies) < max(1, self.min_samples):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    @staticmethod
+    async def _overdue(timer: RequestTimer, delay: float):
+        await timer.sent.wait()
+        await asyncio.sleep(delay)
+
+    async def run(self, attempt: Callable[[bool, RequestTimer], Awaitable], valid: Callable[[object], bool] = None):
+        """
+        Returns the first valid result of `attempt(primary, timer)`, called
+        with True for the original request and False for the hedge; `timer`
+        goes to `RateLimiter.call`. Results failing `valid`, and exceptions,
+        lose to the other request; when both lose, the original's outcome is
+        returned (or raised).
+        """
+        self.calls += 1
+        self.credits = min(self.max_credits, self.credits + self.budget)
+        delay = self.delay()
+        timer = RequestTimer(self.latencies)
+        primary = asyncio.ensure_future(attempt(True, timer))
+        tasks = [primary]
+        try:
+            if delay is not None:
+                overdue = asyncio.ensure_future(self._overdue(timer, delay))
+                await asyncio.wait([primary, overdue], return_when=asyncio.FIRST_COMPLETED)
+                overdue.cancel()
+                if not primary.done():
+                    if self.credits >= 1:
+                        self.credits -= 1
+                        self.hedged += 1
+                        tasks.append(asyncio.ensure_future(attempt(False, RequestTimer(self.latencies))))
+                    else:
+                        self.over_budget += 1
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None and (valid is None or valid(task.result())):
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        if len(tasks) > 1:
+                            count("hedges", 1, outcome="won" if task is not primary else "lost")
+                        return task.result()
+            if len(tasks) > 1:
+                count("hedges", 1, outcome="failed")
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+_hedger = None
+
+
+def get_hedger() -> Optional[Hedger]:
+    """Returns the shared hedger, or None when HEDGE_PERCENTILE is 0 (hedging off)."""
+    global _hedger
+    if _hedger is None and HEDGE_PERCENTILE > 0:
+        _hedger = Hedger()
+    return _hedger
@@ -0,0 +1,244 @@
+import time
+import random
+import asyncio
+from app.metrics import count
+from app.config import (
+    OPENAI_RPM, OPENAI_TPM, OPENAI_MAX_CONCURRENCY, OPENAI_MIN_CONCURRENCY, OPENAI_MAX_RETRIES,
+)
+
+
+class TokenBucket:
+    """
+    Continuous-refill bucket holding up to `burst_seconds` worth of a
+    per-minute budget. The level may go negative when a request turns out to
+    cost more than was reserved; later callers then wait off the debt.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """Takes `amount` (clamped to the capacity), returning seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return waited
+            delay = (amount - self.level) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float):
+        """Returns (positive) or charges (negative) tokens after the fact."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def is_transient(error) -> bool:
+    """Server and network errors worth retrying (what the SDK retries, less 429s)."""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500)
+
+
+class RateLimiter:
+    """
+    Client-side throttle shared by every model call.
+
+    Each call reserves one request and its estimated tokens from the RPM/TPM
+    buckets and one in-flight slot, and the estimate is reconciled with
+    `response.usage` afterwards. The slot count is tuned AIMD-style: +1 per
+    window of successful calls, halved on a 429 (at most once per
+    `decrease_cooldown`). A 429 pauses every caller for its `Retry-After`, or
+    an exponential backoff when the header is missing, plus jitter. 5xx,
+    408/409 and connection errors (which the SDK's own retries, turned off
+    by `call_model`, would have covered) are retried by the failed call alone
+    with the same backoff, leaving the slot count and other callers as they
+    are.
+
+    A request cancelled after it was sent (a hedge's loser) is billed all
+    the same: its token reservation is kept and counted as used.
+
+    Only per-call futures are created, so one limiter can outlive event loops.
+    """
+
+    def __init__(self, rpm: float = OPENAI_RPM, tpm: float = OPENAI_TPM,
+                 max_concurrency: int = OPENAI_MAX_CONCURRENCY, min_concurrency: int = OPENAI_MIN_CONCURRENCY,
+                 max_retries: int = OPENAI_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 60.0,
+                 decrease_cooldown: float = 1.0):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(min(max_concurrency, max(min_concurrency, 8)))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.retried = 0
+        self.cancelled = 0
+        self.tokens_estimated = 0
+        self.tokens_used = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "cancelled": self.cancelled,
+            "concurrency": int(self.concurrency),
+            "tokensEstimated": self.tokens_estimated,
+            "tokensUsed": self.tokens_used,
+        }
+
+    async def _acquire_slot(self) -> float:
+        start = time.monotonic()
+        while self.in_flight >= int(self.concurrency):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic() - start
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        free = int(self.concurrency) - self.in_flight
+        for waiter in self._waiters[:max(0, free)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _wait_pause(self) -> float:
+        waited = 0.0
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+    def _on_success(self):
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def _on_throttle(self, attempt: int, retry_after):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            self._last_decrease = now
+        self._paused_until = max(self._paused_until, now + self._backoff(attempt, retry_after))
+
+    def _backoff(self, attempt: int, retry_after) -> float:
+        delay = retry_after if retry_after is not None else min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(1.0, 1.25)
+
+    async def call(self, request, estimated_tokens: int, deadline=None, timer=None):
+        """
+        Runs `await request()` under the limits and returns its response.
+        Time spent waiting on the limiter is added back to `deadline` (an
+        `asyncio.timeout` context), so queueing doesn't count as a timeout.
+        A `timer` (see `hedging.RequestTimer`) is told when each HTTP request
+        is sent and how long it took, without the limiter's waits.
+        """
+        # Loaded with the client on the first call, not when importing.
+        from openai import RateLimitError
+
+        backoff = 0.0
+        for attempt in range(self.max_retries + 1):
+            # A transient error's backoff is the call's own time, not queueing.
+            await asyncio.sleep(backoff)
+            waited = await self._wait_pause()
+            if self.requests is not None:
+                waited += await self.requests.acquire(1)
+            if self.tokens is not None:
+                waited += await self.tokens.acquire(estimated_tokens)
+            waited += await self._acquire_slot()
+            if deadline is not None and deadline.when() is not None:
+                deadline.reschedule(deadline.when() + waited)
+
+            if timer is not None:
+                timer.start()
+            sent = time.monotonic()
+            try:
+                response = await request()
+                if timer is not None:
+                    timer.stop(time.monotonic() - sent)
+            except asyncio.CancelledError:
+                # The request is out and will be billed: keep its reservation.
+                self.cancelled += 1
+                self.tokens_estimated += estimated_tokens
+                self.tokens_used += estimated_tokens
+                count("tokens", estimated_tokens, kind="cancelled")
+                if timer is not None:
+                    # How long it had run: a lower bound.
+                    timer.stop(time.monotonic() - sent)
+                raise
+            except RateLimitError as e:
+                if self.tokens is not None:
+                    self.tokens.adjust(estimated_tokens)
+                if getattr(e, "code", None) == "insufficient_quota" or attempt == self.max_retries:
+                    raise
+                self._on_throttle(attempt, retry_after_seconds(e))
+                continue
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                if self.tokens is not None:
+                    self.tokens.adjust(estimated_tokens)
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                backoff = self._backoff(attempt, retry_after_seconds(e))
+                continue
+            finally:
+                self._release_slot()
+
+            self.calls += 1
+            self._on_success()
+            used = response.usage.total_tokens if response.usage else estimated_tokens
+            self.tokens_estimated += estimated_tokens
+            self.tokens_used += used
+            if self.tokens is not None:
+                self.tokens.adjust(estimated_tokens - used)
+            return response
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
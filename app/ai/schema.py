@@ -2,7 +2,17 @@ from pydantic import BaseModel
 from typing import List, Optional
 
 
-class ModerationResult(BaseModel):
+class StageResult(BaseModel):
+    stage: str
+    framesSent: int
+    detail: str
+    moderationStatus: str
+    totalTokens: int
+    latencyMs: int
+
+
+class ModerationVerdict(BaseModel):
+    """The verdict as stored on the video (`aiVideoModerationOutput`)."""
     moderationStatus: str
     reason: str
     explicitContent: Optional[bool]
@@ -12,3 +22,20 @@ class ModerationResult(BaseModel):
     detectedObjects: List[str]
     detectedKeywords: List[str]
     totalTokens: int
+
+
+class ModerationResult(ModerationVerdict):
+    # Run metrics filled in by the pipeline, not the model: they go to the
+    # batch report and the metrics, never to the stored verdict.
+    framesSampled: Optional[int] = None
+    framesSent: Optional[int] = None
+    tokensSavedByDedup: Optional[int] = None
+    imagesSent: Optional[int] = None
+    nearDuplicateOf: Optional[str] = None
+    stages: Optional[List[StageResult]] = None
+    packSize: Optional[int] = None
+    prescreened: Optional[bool] = None
+    cached: Optional[bool] = None
+
+
+RUN_FIELDS = frozenset(ModerationResult.model_fields) - frozenset(ModerationVerdict.model_fields)
@@ -0,0 +1,40 @@
+import math
+from app.config import OPENAI_MODEL
+
+# (base tokens, tokens per 512px tile) for image inputs. gpt-4o-mini bills
+# images at ~33x the token count of gpt-4o for the same price.
+IMAGE_TOKEN_COSTS = {
+    "gpt-4o-mini": (2833, 5667),
+}
+DEFAULT_IMAGE_TOKEN_COST = (85, 170)
+
+# USD per 1M (prompt, completion) tokens.
+TOKEN_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+def image_tokens(width: int, height: int, detail: str = "high", model: str = OPENAI_MODEL) -> int:
+    """
+    Estimates the prompt tokens billed for one image, following OpenAI's
+    tiling rules: "low" is a flat base cost; "high"/"auto" fits the image in
+    2048x2048, scales the shortest side down to 768 and charges per 512px tile.
+    """
+    base, per_tile = IMAGE_TOKEN_COSTS.get(model, DEFAULT_IMAGE_TOKEN_COST)
+    if detail == "low":
+        return base
+
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return base + per_tile * tiles
+
+
+def token_cost(prompt_tokens: int, completion_tokens: int, model: str = OPENAI_MODEL) -> float:
+    """Estimated USD cost of a request; 0 for models without a known price."""
+    prompt_price, completion_price = TOKEN_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from typing import Optional
+from urllib.parse import urlsplit
+from app.ai.prompt import SYSTEM_PROMPT
+from app.config import (
+    OPENAI_MODEL, FRAME_INTERVAL, MAX_FRAMES, SAMPLING_MODE, SEEK_MODE, FRAME_MAX_SIDE,
+    DEDUP_MAX_DISTANCE, FRAME_MODE, IMAGE_DETAIL, MOSAIC_TILES, MOSAIC_MAX_SIDE, MOSAIC_MIN_TILE_SIDE,
+    MODERATION_MODE, SCREEN_FRAMES, SCREEN_DETAIL, VIDEO_TOKEN_BUDGET,
+    PRESCREEN, PRESCREEN_MIN_SECONDS, PRESCREEN_COVERAGE, PRESCREEN_FROZEN,
+    RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS,
+)
+from app.video.extractor import is_remote
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def remote_identity(url: str) -> Optional[str]:
+    """
+    Identifies the bytes behind `url` from a HEAD request, without reading
+    them: the MD5 Cloud Storage (and so Firebase Storage) reports in
+    `x-goog-hash`, which re-uploads of the same file share, else a strong
+    ETag or object generation together with the host, path and
+    Content-Length. The query string is left out, so a re-signed URL for the
+    same object keeps its key. None when the server offers neither.
+    """
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=30)
+    except requests.RequestException:
+        return None
+    if not response.ok:
+        return None
+    headers = response.headers
+    for part in headers.get("x-goog-hash", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name == "md5" and value:
+            return f"md5:{value}"
+    validator = headers.get("x-goog-generation") or headers.get("ETag")
+    if not validator or validator.startswith("W/"):
+        return None
+    parts = urlsplit(response.url)
+    identity = f"{parts.netloc}{parts.path}|{validator}|{headers.get('Content-Length', '')}"
+    return f"etag:{hashlib.sha256(identity.encode()).hexdigest()}"
+
+
+def hash_video(source: str) -> str:
+    """
+    Key for the video's bytes. Remote videos are keyed by `remote_identity`
+    when the server offers one, so streaming ingest reads them only once
+    (through ffmpeg); otherwise, and for local files, it is the SHA-256 of
+    the bytes, streamed in chunks so the file is never held in memory or
+    written anywhere.
+    """
+    digest = hashlib.sha256()
+    if is_remote(source):
+        identity = remote_identity(source)
+        if identity is not None:
+            return identity
+        with requests.get(source, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                digest.update(chunk)
+    else:
+        with open(source, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE) -> str:
+    """
+    Hash of everything besides the video that shapes a verdict. Changing the
+    prompt, model, sampling, token budget or pre-screen settings changes
+    every key, so stale entries are simply never read again and age out.
+    """
+    settings = {
+        "prompt": SYSTEM_PROMPT["content"],
+        "model": OPENAI_MODEL,
+        "sampling": [FRAME_INTERVAL, MAX_FRAMES, SAMPLING_MODE, SEEK_MODE, FRAME_MAX_SIDE, DEDUP_MAX_DISTANCE],
+        "frames": [frame_mode, IMAGE_DETAIL, MOSAIC_TILES, MOSAIC_MAX_SIDE, MOSAIC_MIN_TILE_SIDE],
+        "stages": [moderation_mode, SCREEN_FRAMES, SCREEN_DETAIL],
+        "budget": VIDEO_TOKEN_BUDGET,
+        "prescreen": [PRESCREEN, PRESCREEN_MIN_SECONDS, PRESCREEN_COVERAGE, PRESCREEN_FROZEN],
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def video_cache_key(source: str, frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE) -> str:
+    return f"{hash_video(source)}:{settings_fingerprint(frame_mode, moderation_mode)}"
+
+
+class ResultCache:
+    """
+    Persistent moderation-result cache in SQLite, bounded to `max_entries`
+    with least-recently-used eviction and a `ttl_seconds` expiry.
+    """
+
+    def __init__(self, path: str, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        self._conn.close()
+
+
+_cache = None
+
+
+def get_cache() -> Optional[ResultCache]:
+    """Returns the shared cache, opening it on first use; None when disabled."""
+    global _cache
+    if _cache is None and RESULT_CACHE_PATH:
+        _cache = ResultCache(RESULT_CACHE_PATH)
+    return _cache
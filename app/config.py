@@ -6,13 +6,140 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+# --- Rate Limits ---
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", 500))  # requests per minute, 0 = unlimited
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", 2000000))  # tokens per minute, 0 = unlimited
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 64))  # AIMD ceiling for calls in flight
+OPENAI_MIN_CONCURRENCY = int(os.getenv("OPENAI_MIN_CONCURRENCY", 1))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 6))  # retries after a 429, 5xx or connection error
+# Hedging: a model request still unanswered at this percentile of recent
+# request latencies (rate-limiter waits excluded) is sent again and the first
+# valid answer wins; 0 turns it off.
+# Hedges stay within HEDGE_BUDGET extra requests per call
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0))  # e.g. 0.95
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.05))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))  # latencies seen before hedging starts
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 500))  # recent latencies the percentile is taken over
+
 # --- Video Processing ---
 FRAME_INTERVAL = float(os.getenv("FRAME_INTERVAL", 0.1))  # every 10s
 MAX_FRAMES = int(os.getenv("MAX_FRAMES", 30))
-TIMEOUT_SECONDS = int(os.getenv("TIMEOUT_SECONDS", 45))
+SAMPLING_MODE = os.getenv("SAMPLING_MODE", "even")  # "even" | "stratified"
+SEEK_MODE = os.getenv("SEEK_MODE", "accurate")  # "accurate" | "keyframe"
+FRAME_MAX_SIDE = int(os.getenv("FRAME_MAX_SIDE", 768))  # longest edge sent to the model
+# ffmpeg/ffprobe processes running at once per worker, and how long probing
+# and decoding one video's frames may take before ffmpeg is killed
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", 2 * (os.cpu_count() or 1)))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("PROBE_TIMEOUT_SECONDS", 30))
+DECODE_TIMEOUT_SECONDS = float(os.getenv("DECODE_TIMEOUT_SECONDS", 120))
+# Local pre-screen before any model call: ffprobe settles audio-only and
+# near-empty videos, then one ffmpeg pass over the already sampled frames
+# settles undecodable, black and blank ones. Frozen ones (often narrated
+# slides or a whiteboard) go on to the model unless PRESCREEN_FROZEN is "review"
+PRESCREEN = os.getenv("PRESCREEN", "on")  # "on" | "off"
+PRESCREEN_MIN_SECONDS = float(os.getenv("PRESCREEN_MIN_SECONDS", 1.0))
+PRESCREEN_COVERAGE = float(os.getenv("PRESCREEN_COVERAGE", 0.95))  # share of sampled frames that must qualify
+PRESCREEN_FROZEN = os.getenv("PRESCREEN_FROZEN", "model")  # "model" | "review"
+# Frames whose 64-bit perceptual hashes differ by at most this many bits are
+# sent once; -1 disables deduplication
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", 6))
+# "frames": one image per frame; "mosaic": MOSAIC_TILES frames per grid image
+FRAME_MODE = os.getenv("FRAME_MODE", "frames")
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto")  # detail for per-frame images
+MOSAIC_TILES = int(os.getenv("MOSAIC_TILES", 4))
+MOSAIC_MAX_SIDE = int(os.getenv("MOSAIC_MAX_SIDE", 1024))
+# Sheets go out at detail=low when every tile keeps at least this many
+# pixels on its longest edge after the 512px low-detail downscale
+MOSAIC_MIN_TILE_SIDE = int(os.getenv("MOSAIC_MIN_TILE_SIDE", 256))
+# "single": one request with every frame; "progressive": screen with
+# SCREEN_FRAMES frames at SCREEN_DETAIL first, escalating unless the answer
+# is a clear approved/rejected
+MODERATION_MODE = os.getenv("MODERATION_MODE", "single")
+SCREEN_FRAMES = int(os.getenv("SCREEN_FRAMES", 4))
+SCREEN_DETAIL = os.getenv("SCREEN_DETAIL", "low")
+TIMEOUT_SECONDS = int(os.getenv("TIMEOUT_SECONDS", 45))  # model requests per video
+# Token budgets (prompt + completion, by the image tiling rules) for one
+# video's requests and for a whole batch run; 0 turns either off. Within
+# them the planner lowers the frame size, then the detail, before sending
+# fewer frames (mosaic sheets are not planned)
+VIDEO_TOKEN_BUDGET = int(os.getenv("VIDEO_TOKEN_BUDGET", 0))  # e.g. 100000 for gpt-4o-mini
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", 0))
+# Videos per packed request (1 disables packing) and the estimated prompt
+# tokens (frames + text, excluding the system prompt) one pack may carry.
+# A pack that has not filled after PACK_MAX_WAIT_SECONDS (e.g. a daemon fed
+# one document at a time) is sent as it is.
+# Packed videos are pre-screened, checked against the near-duplicate index
+# and planned to VIDEO_TOKEN_BUDGET; BATCH_TOKEN_BUDGET and the job journal
+# only cover unpacked runs
+PACK_MAX_VIDEOS = int(os.getenv("PACK_MAX_VIDEOS", 1))
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 60000))
+PACK_MAX_WAIT_SECONDS = float(os.getenv("PACK_MAX_WAIT_SECONDS", 2))
+# "stream": ffmpeg reads the video URL directly; "download": save to disk first
+INGEST_MODE = os.getenv("INGEST_MODE", "stream")
+
+# --- Result Cache ---
+# Empty path disables the cache
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite3")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 100000))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+
+# --- Near-duplicate Index ---
+# Empty path disables the index
+NEAR_DUP_INDEX_PATH = os.getenv("NEAR_DUP_INDEX_PATH", "cache/near_dup.sqlite3")
+NEAR_DUP_CAPACITY = int(os.getenv("NEAR_DUP_CAPACITY", 1000000))  # videos kept in memory
+SIGNATURE_FRAMES = int(os.getenv("SIGNATURE_FRAMES", 8))  # frame hashes per video signature
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", 3))  # bits per frame hash
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", 0.8))  # share of signature matched
+# "reuse": return the matched verdict; "flag": send to manual review
+NEAR_DUP_ACTION = os.getenv("NEAR_DUP_ACTION", "reuse")
+
+# --- Document Store ---
+# Where UserVideos live: "firestore" (Firebase, with the service account
+# JSON), "sqlite" (a local file at STORE_PATH) or "memory" (this process only)
+STORE = os.getenv("STORE", "firestore")
+STORE_PATH = os.getenv("STORE_PATH", "cache/store.sqlite3")
 
 # --- Batch Processing ---
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 8))
+SCAN_PAGE_SIZE = int(os.getenv("SCAN_PAGE_SIZE", 200))  # Firestore documents per page
+# Last scanned document id, so an interrupted scan resumes; empty disables
+SCAN_CHECKPOINT_PATH = os.getenv("SCAN_CHECKPOINT_PATH", "cache/scan_checkpoint.json")
+# Workers per stage of the staged pipeline, which hands documents on
+# through queues of STAGE_QUEUE_SIZE so a slow stage holds the others back
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 8))  # eligibility, cache lookup, download
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", os.cpu_count() or 1))  # processes for hashing/encoding; 0 = threads
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", 32))  # videos waiting on the model (see OPENAI_*)
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", 4))
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", 16))
+# Seconds a worker's claim on a document lasts without renewal; 0 turns
+# claiming off (one worker at a time only)
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", 300))
+
+# --- Job Journal ---
+# Per-document progress and dead letters, so reruns resume; empty disables
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "cache/journal.sqlite3")
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", 5))  # transient failures before dead-lettering
+JOURNAL_RETRY_SECONDS = float(os.getenv("JOURNAL_RETRY_SECONDS", 60))  # first backoff, doubled per attempt
+
+# --- Daemon ---
+DAEMON_MODE = os.getenv("DAEMON_MODE", "listen")  # "listen": on_snapshot; "poll": updatedAt watermark
+DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", 30))
+
+# --- Offline Batch API ---
+OFFLINE_JOB_DIR = os.getenv("OFFLINE_JOB_DIR", "cache/offline")
+OFFLINE_SHARD_MAX_REQUESTS = int(os.getenv("OFFLINE_SHARD_MAX_REQUESTS", 50000))  # Batch API limit per file
+OFFLINE_SHARD_MAX_MB = float(os.getenv("OFFLINE_SHARD_MAX_MB", 190))  # Batch API limit is 200 MB
+OFFLINE_POLL_SECONDS = float(os.getenv("OFFLINE_POLL_SECONDS", 60))
+
+# --- Result Writes ---
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 100))  # documents per WriteBatch (max 500)
+WRITE_FLUSH_SECONDS = float(os.getenv("WRITE_FLUSH_SECONDS", 2))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 5))  # per document, after a failed batch
+
+# --- Metrics ---
+METRICS_PATH = os.getenv("METRICS_PATH", "")  # Prometheus text file, rewritten during runs; empty disables
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # serve /metrics on this port; 0 disables
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 15))
 
 # --- Firebase ---
 SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
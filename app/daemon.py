@@ -0,0 +1,191 @@
+import signal
+import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+from app.eligibility import skip_reason
+from app.lease import lease_expiry, lease_holder
+from app.firestore import failed_videos_query, SOURCE_INFO
+from app.scan import aiter_documents
+from app.worker import process_batch_async
+from app.config import DAEMON_MODE, DAEMON_POLL_SECONDS, SCAN_PAGE_SIZE
+
+
+def _wanted(data: dict, initial: bool) -> bool:
+    """
+    Eligible documents, except (after the initial backlog) ones whose last
+    write was this worker's own result: a video that failed again, e.g. on a
+    timeout, would otherwise be queued straight back. Those wait for the
+    next batch run or daemon restart.
+    """
+    if skip_reason(data) is not None:
+        return False
+    return initial or data.get("updateSourceCF") != SOURCE_INFO["updateSourceCF"]
+
+
+class _Feed:
+    """
+    Documents waiting to be handed out: the newest snapshot per id, oldest id
+    first. Documents under another worker's lease are looked at again once
+    the lease would have expired, so a crashed worker's videos come back.
+    """
+
+    def __init__(self):
+        self._docs = {}
+        self._ready = asyncio.Event()
+        self._rechecks = {}
+
+    def offer(self, doc, initial: bool):
+        data = doc.to_dict() or {}
+        if skip_reason(data) is None and lease_holder(data) is not None:
+            self._recheck_after(doc, lease_expiry(data))
+        elif _wanted(data, initial):
+            self._docs[doc.id] = doc
+            self._ready.set()
+
+    def discard(self, doc_id: str):
+        self._docs.pop(doc_id, None)
+        handle = self._rechecks.pop(doc_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _recheck_after(self, doc, expiry: datetime):
+        self.discard(doc.id)
+        delay = (expiry - datetime.now(timezone.utc)).total_seconds() + 1
+        self._rechecks[doc.id] = asyncio.get_running_loop().call_later(
+            max(0, delay), lambda: asyncio.ensure_future(self._recheck(doc)))
+
+    async def _recheck(self, doc):
+        self._rechecks.pop(doc.id, None)
+        fresh = await asyncio.to_thread(doc.reference.get)
+        if fresh.exists:
+            # The lease ran out without a result write: whoever held it is gone.
+            self.offer(fresh, initial=True)
+
+    async def get(self, *stops: asyncio.Event):
+        """The next document, or None once any of `stops` is set."""
+        while not self._docs and not any(stop.is_set() for stop in stops):
+            self._ready.clear()
+            waiters = {asyncio.ensure_future(event.wait()) for event in (self._ready, *stops)}
+            _, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in pending:
+                waiter.cancel()
+        if any(stop.is_set() for stop in stops):
+            return None
+        return self._docs.pop(next(iter(self._docs)))
+
+    def close(self):
+        for handle in self._rechecks.values():
+            handle.cancel()
+        self._rechecks.clear()
+
+
+async def watch_documents(query, stop: asyncio.Event) -> AsyncIterator:
+    """
+    Yields the eligible documents of `query` as its snapshot listener reports
+    them: the current matches first, then each one added or changed, until
+    `stop` is set. Documents that leave the query before their turn (another
+    worker got there first) are dropped.
+    """
+    from google.cloud.firestore_v1.watch import ChangeType
+
+    loop = asyncio.get_running_loop()
+    feed = _Feed()
+    first = True
+
+    def _apply(changes, initial):
+        for change in changes:
+            if change.type == ChangeType.REMOVED:
+                feed.discard(change.document.id)
+            else:
+                feed.offer(change.document, initial)
+
+    def _on_snapshot(docs, changes, read_time):
+        # Called on the listener's thread.
+        nonlocal first
+        initial, first = first, False
+        loop.call_soon_threadsafe(_apply, changes, initial)
+
+    watch = query.on_snapshot(_on_snapshot)
+    try:
+        while (doc := await feed.get(stop)) is not None:
+            yield doc
+    finally:
+        watch.unsubscribe()
+        feed.close()
+
+
+async def poll_documents(query, stop: asyncio.Event, interval: float = DAEMON_POLL_SECONDS,
+                         page_size: int = SCAN_PAGE_SIZE) -> AsyncIterator:
+    """
+    Polling alternative to `watch_documents` for where listeners are not an
+    option: one full scan of `query`, then every `interval` seconds the
+    documents whose `updatedAt` is past the watermark, oldest first (this
+    needs a composite index on aiVideoModerationStatus + updatedAt).
+    """
+    feed = _Feed()
+
+    async def _poll():
+        watermark = datetime.now(timezone.utc)
+        async for doc in aiter_documents(query, page_size):
+            feed.offer(doc, initial=True)
+        while True:
+            try:
+                page = await asyncio.to_thread(
+                    lambda: list(query.where("updatedAt", ">", watermark).order_by("updatedAt").limit(page_size).get()))
+            except Exception as e:
+                print(f"⚠️ Poll failed ({e}); retrying in {interval}s")
+                page = []
+            for doc in page:
+                watermark = max(watermark, doc.get("updatedAt"))
+                feed.offer(doc, initial=False)
+            if len(page) < page_size:
+                await asyncio.sleep(interval)
+
+    failed = asyncio.Event()
+    poller = asyncio.ensure_future(_poll())
+    # A scan that fails for good ends the feed with its error.
+    poller.add_done_callback(lambda task: task.cancelled() or task.exception() is None or failed.set())
+    try:
+        while (doc := await feed.get(stop, failed)) is not None:
+            yield doc
+        if failed.is_set():
+            raise poller.exception()
+    finally:
+        poller.cancel()
+        feed.close()
+
+
+async def serve(mode: str = DAEMON_MODE, concurrency: int = None, report_path=None,
+                stop: Optional[asyncio.Event] = None) -> dict:
+    """
+    Moderates `failed` videos as they arrive until SIGINT/SIGTERM (or `stop`
+    is set), then stops taking new ones, finishes the videos already in the
+    pipeline, flushes their writes and returns the counts. A second signal
+    aborts without draining.
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGINT, signal.SIGTERM)
+
+    def _remove_handlers():
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+
+    def _shutdown():
+        print("🛑 Stopping: finishing the videos in flight (signal again to abort)")
+        stop.set()
+        _remove_handlers()
+
+    try:
+        for sig in signals:
+            loop.add_signal_handler(sig, _shutdown)
+    except (NotImplementedError, RuntimeError):
+        pass  # no signal handlers on Windows or off the main thread; `stop` still works
+
+    query = failed_videos_query()
+    docs = watch_documents(query, stop) if mode == "listen" else poll_documents(query, stop)
+    print(f"👂 Waiting for videos ({mode} mode)")
+    try:
+        return await process_batch_async(docs, concurrency, report_path)
+    finally:
+        _remove_handlers()
@@ -0,0 +1,16 @@
+from typing import Optional
+
+
+def skip_reason(data: dict) -> Optional[str]:
+    """
+    Why a UserVideos document should not be moderated, or None if it should.
+    """
+    if data.get("aiVideoModerationStatus") != "failed":
+        return "Already Processed"
+    if data.get("isDeleted") is not False:
+        return "deleted"
+    if data.get("initialSize") == 0:
+        return "initial size is 0"
+    if data.get("videoUrl") is None:
+        return "video Url not present"
+    return None
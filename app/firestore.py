@@ -1,6 +1,9 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+from app.config import SCAN_PAGE_SIZE, SCAN_CHECKPOINT_PATH, STORE, STORE_PATH
+from app.scan import ScanCheckpoint, iter_documents, aiter_documents
+from app.sink import ResultSink
+from app.lease import LeaseManager, LEASE_FIELD
+from app.ai.schema import RUN_FIELDS
 
 # ---- STAGE ----
 SERVICE_ACCOUNT_FILE = os.path.join(
@@ -9,35 +12,97 @@ SERVICE_ACCOUNT_FILE = os.path.join(
 )
 
 
-# Initialize Firebase Admin SDK
-if not firebase_admin._apps:  # Prevent re-initialization
-    cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
-    firebase_admin.initialize_app(cred)
+# Document store, created on first use by get_db(): the Firestore client,
+# or a local store (app.local_store) when STORE is "sqlite" or "memory".
+# Benchmarks and tests assign a fake here before anything touches it.
+db = None
 
-# Firestore client
-db = firestore.client()
 
-SERVER_TIMESTAMP = firestore.firestore.SERVER_TIMESTAMP
+def get_db():
+    global db
+    if db is None:
+        if STORE == "firestore":
+            # The Firebase SDK takes a while to import; only load it when used.
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+
+            if not firebase_admin._apps:  # Prevent re-initialization
+                cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
+                firebase_admin.initialize_app(cred)
+            db = firestore.client()
+        else:
+            from app.local_store import LocalFirestore
+            db = LocalFirestore(STORE_PATH if STORE == "sqlite" else ":memory:")
+    return db
+
+
+def __getattr__(name):
+    # Firestore's sentinel (the local store understands it too), imported on
+    # first use like the rest of the Firestore types.
+    if name == "SERVER_TIMESTAMP":
+        from google.cloud.firestore_v1 import transforms
+        return transforms.SERVER_TIMESTAMP
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 SOURCE_INFO = {
     "updateSourceCF": "ai-video-moderation",
     "updateSource": "script",
-    "version": firestore.firestore.Increment(1)
 }
 
 
-def fetch_failed_videos():
-    return list(
-        db.collection("UserVideos")
-        .where("aiVideoModerationStatus", "==", "failed")
-        .get()
-    )
+def failed_videos_query():
+    return get_db().collection("UserVideos").where("aiVideoModerationStatus", "==", "failed")
 
 
-def update_video_result(doc_id: str, moderation_result: dict):
-    db.collection("UserVideos").document(doc_id).update({
-        "aiVideoModerationOutput": moderation_result,
+def scan_checkpoint():
+    return ScanCheckpoint(SCAN_CHECKPOINT_PATH) if SCAN_CHECKPOINT_PATH else None
+
+
+def fetch_failed_videos(page_size: int = SCAN_PAGE_SIZE):
+    """
+    Yields `failed` videos page by page, resuming from the last checkpoint.
+    """
+    return iter_documents(failed_videos_query(), page_size, scan_checkpoint())
+
+
+def stream_failed_videos(page_size: int = SCAN_PAGE_SIZE):
+    """
+    Async variant of `fetch_failed_videos` for the event loop.
+    """
+    return aiter_documents(failed_videos_query(), page_size, scan_checkpoint())
+
+
+def result_update(moderation_result: dict) -> dict:
+    """
+    The document update for a result. Only the verdict is stored; the run
+    metrics (`RUN_FIELDS`) stay in the batch report.
+    """
+    from google.cloud.firestore_v1 import transforms
+
+    return {
+        "aiVideoModerationOutput": {k: v for k, v in moderation_result.items() if k not in RUN_FIELDS},
         "aiVideoModerationStatus": moderation_result["moderationStatus"],
-        "updatedAt": SERVER_TIMESTAMP,
-        **SOURCE_INFO
-    })
\ No newline at end of file
+        "updatedAt": transforms.SERVER_TIMESTAMP,
+        LEASE_FIELD: transforms.DELETE_FIELD,
+        **SOURCE_INFO,
+        "version": transforms.Increment(1),
+    }
+
+
+def update_video_result(doc_id: str, moderation_result: dict):
+    get_db().collection("UserVideos").document(doc_id).update(result_update(moderation_result))
+
+
+def result_sink(**kwargs) -> ResultSink:
+    """
+    Write-behind sink that batches `result_update` writes to UserVideos.
+    """
+    return ResultSink(get_db(), "UserVideos", **kwargs)
+
+
+def lease_manager(**kwargs) -> LeaseManager:
+    """
+    Claims UserVideos documents for this worker (see app.lease).
+    """
+    return LeaseManager(get_db(), "UserVideos", **kwargs)
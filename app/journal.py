@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import threading
+from typing import List, Optional
+import requests
+from app.config import JOURNAL_PATH, JOURNAL_MAX_ATTEMPTS, JOURNAL_RETRY_SECONDS
+
+# ffmpeg/ffprobe messages meaning the video itself is unusable; retrying
+# the same file can only fail the same way.
+POISON_MARKERS = (
+    "Invalid data found when processing input",
+    "moov atom not found",
+    "does not contain any stream",
+    "Server returned 404",
+    "Server returned 403",
+    "No such file or directory",
+    "No JPEG start-of-frame",
+)
+# requests' HTTPError text, e.g. "404 Client Error: Not Found for url: ...".
+CLIENT_ERROR = re.compile(r"\b4(?!08|29)\d\d Client Error")
+
+
+def is_poison(error: BaseException) -> bool:
+    """
+    Whether `error` comes from the video rather than the moment: corrupt or
+    missing files, URLs that answer 4xx, requests the model rejects outright.
+    Everything else (timeouts, connection errors, 5xx, 429) is transient.
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return 400 <= error.response.status_code < 500 and error.response.status_code not in (408, 429)
+    # openai is only imported once a model call has been made.
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.BadRequestError):
+        return True
+    message = str(error)
+    return any(marker in message for marker in POISON_MARKERS) or CLIENT_ERROR.search(message) is not None
+
+
+class Journal:
+    """
+    Per-document progress in SQLite, so a crashed or repeated run picks up
+    where the last one stopped: the stage reached, attempts, the verdict once
+    the model has answered, and whether it was written back. Transient
+    failures wait `retry_seconds * 2**(attempts - 1)` (with jitter) before the
+    next attempt; poison videos, and any video that failed `max_attempts`
+    times, move to the `dead_letters` table with the error and stay there
+    until requeued or their `videoUrl` changes.
+    """
+
+    def __init__(self, path: str, max_attempts: int = JOURNAL_MAX_ATTEMPTS,
+                 retry_seconds: float = JOURNAL_RETRY_SECONDS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " doc_id TEXT PRIMARY KEY, video_url TEXT, stage TEXT NOT NULL, attempts INTEGER NOT NULL,"
+            " verdict TEXT, written INTEGER NOT NULL DEFAULT 0, last_error TEXT, next_attempt_at REAL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            " doc_id TEXT PRIMARY KEY, video_url TEXT, stage TEXT, attempts INTEGER, error TEXT,"
+            " poison INTEGER NOT NULL, created_at REAL NOT NULL);"
+        )
+        self._conn.commit()
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+        return rows
+
+    def skip_reason(self, doc_id: str, video_url: str) -> Optional[str]:
+        """Why the document should not be attempted now, or None."""
+        dead = self._execute("SELECT video_url, error FROM dead_letters WHERE doc_id = ?", (doc_id,))
+        if dead:
+            if dead[0][0] == video_url:
+                return f"dead-lettered: {dead[0][1]}"
+            # A new upload gets a fresh start.
+            self._execute("DELETE FROM dead_letters WHERE doc_id = ?", (doc_id,))
+            self._execute("DELETE FROM jobs WHERE doc_id = ?", (doc_id,))
+        job = self._execute("SELECT next_attempt_at FROM jobs WHERE doc_id = ?", (doc_id,))
+        if job and job[0][0] is not None and job[0][0] > time.time():
+            return f"retry backoff until {time.strftime('%H:%M:%S', time.localtime(job[0][0]))}"
+        return None
+
+    def start(self, doc_id: str, video_url: str) -> Optional[dict]:
+        """
+        Records a new attempt. Returns the verdict of an earlier attempt that
+        got an answer from the model but was never written, so it can be
+        written without asking again.
+        """
+        now = time.time()
+        rows = self._execute("SELECT video_url, verdict, written FROM jobs WHERE doc_id = ?", (doc_id,))
+        if rows and (rows[0][0] != video_url or (rows[0][2] and rows[0][1])):
+            # A different video, or a written verdict someone has reset to
+            # `failed` since: moderate it from scratch.
+            self._execute("DELETE FROM jobs WHERE doc_id = ?", (doc_id,))
+            rows = []
+        self._execute(
+            "INSERT INTO jobs (doc_id, video_url, stage, attempts, updated_at) VALUES (?, ?, 'fetch', 1, ?)"
+            " ON CONFLICT (doc_id) DO UPDATE SET stage = 'fetch', attempts = attempts + 1, updated_at = ?",
+            (doc_id, video_url, now, now),
+        )
+        return json.loads(rows[0][1]) if rows and rows[0][1] else None
+
+    def stage(self, doc_id: str, stage: str):
+        self._execute("UPDATE jobs SET stage = ?, updated_at = ? WHERE doc_id = ?", (stage, time.time(), doc_id))
+
+    def moderated(self, doc_id: str, verdict: dict) -> bool:
+        """
+        Records the model's verdict. A `failed` one (a model timeout) is a
+        failed attempt like any other (see `failed`); returns whether it
+        dead-lettered the video.
+        """
+        if verdict.get("moderationStatus") == "failed":
+            # Written back as `failed`, so the document comes back: retry it
+            # after the backoff until attempts run out.
+            self.stage(doc_id, "moderated")
+            return self.failed(doc_id, TimeoutError(verdict.get("reason") or "failed"))
+        self._execute(
+            "UPDATE jobs SET stage = 'moderated', verdict = ?, updated_at = ? WHERE doc_id = ?",
+            (json.dumps(verdict), time.time(), doc_id),
+        )
+        return False
+
+    def written(self, doc_ids: List[str]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET stage = 'written', written = 1, updated_at = ? WHERE doc_id = ?",
+                [(now, doc_id) for doc_id in doc_ids],
+            )
+            self._conn.commit()
+
+    def _backoff(self, doc_id: str, error: str):
+        attempts = self._execute("SELECT attempts FROM jobs WHERE doc_id = ?", (doc_id,))[0][0]
+        delay = self.retry_seconds * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+        self._execute(
+            "UPDATE jobs SET last_error = ?, next_attempt_at = ?, updated_at = ? WHERE doc_id = ?",
+            (error, time.time() + delay, time.time(), doc_id),
+        )
+
+    def failed(self, doc_id: str, error: BaseException) -> bool:
+        """
+        Records a failed attempt: schedules the retry, or dead-letters the
+        video when the error is poison or attempts ran out. Returns whether
+        it was dead-lettered.
+        """
+        rows = self._execute("SELECT video_url, stage, attempts FROM jobs WHERE doc_id = ?", (doc_id,))
+        if not rows:
+            return False
+        video_url, stage, attempts = rows[0]
+        poison = is_poison(error)
+        if not poison and attempts < self.max_attempts:
+            self._backoff(doc_id, str(error))
+            return False
+        self._execute(
+            "INSERT OR REPLACE INTO dead_letters (doc_id, video_url, stage, attempts, error, poison, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, video_url, stage, attempts, str(error), int(poison), time.time()),
+        )
+        self._execute("DELETE FROM jobs WHERE doc_id = ?", (doc_id,))
+        return True
+
+    def dead_letters(self) -> List[dict]:
+        rows = self._execute(
+            "SELECT doc_id, video_url, stage, attempts, error, poison, created_at FROM dead_letters ORDER BY created_at")
+        keys = ("id", "videoUrl", "stage", "attempts", "error", "poison", "createdAt")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def requeue(self, doc_id: str) -> bool:
+        """Lets a dead-lettered document be attempted again."""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM dead_letters WHERE doc_id = ?", (doc_id,)).rowcount
+            self._conn.commit()
+        return bool(deleted)
+
+    def stats(self) -> dict:
+        rows = self._execute("SELECT stage, COUNT(*) FROM jobs GROUP BY stage")
+        stats = dict(rows)
+        stats["deadLetters"] = self._execute("SELECT COUNT(*) FROM dead_letters")[0][0]
+        return stats
+
+    def close(self):
+        self._conn.close()
+
+
+_journal = None
+
+
+def get_journal() -> Optional[Journal]:
+    """Returns the shared journal, opening it on first use; None when disabled."""
+    global _journal
+    if _journal is None and JOURNAL_PATH:
+        _journal = Journal(JOURNAL_PATH)
+    return _journal
@@ -0,0 +1,134 @@
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from google.api_core.exceptions import FailedPrecondition
+from app.eligibility import skip_reason
+from app.config import LEASE_SECONDS
+
+# Field on UserVideos holding {"owner": worker id, "expiresAt": timestamp}.
+LEASE_FIELD = "aiModerationLease"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def lease_expiry(data: dict) -> Optional[datetime]:
+    """When the document's current lease runs out, or None if it has none."""
+    lease = data.get(LEASE_FIELD)
+    return lease["expiresAt"] if lease else None
+
+
+def lease_holder(data: dict) -> Optional[str]:
+    """Owner of the document's lease while it has not expired."""
+    expiry = lease_expiry(data)
+    if expiry is None or expiry <= datetime.now(timezone.utc):
+        return None
+    return data[LEASE_FIELD]["owner"]
+
+
+class LeaseManager:
+    """
+    Claims UserVideos documents for this worker so that several workers can
+    share the backlog without moderating a video twice. A claim writes a
+    lease with this worker's id and an expiry, conditional on the document
+    not having changed since it was read, so of two workers racing for the
+    same document exactly one wins. Held leases are renewed every third of
+    `ttl_seconds` while the video is processed; the result write removes the
+    lease. A worker that dies stops renewing, and once its leases expire the
+    documents can be claimed again.
+    """
+
+    def __init__(self, db, collection: str = "UserVideos", owner: str = None,
+                 ttl_seconds: float = LEASE_SECONDS, max_attempts: int = 3):
+        self.db = db
+        self.collection = collection
+        self.owner = owner or worker_id()
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self.held = set()
+        self.claimed = 0
+        self.lost = 0
+        self._renewer = None
+
+    async def __aenter__(self):
+        self._renewer = asyncio.create_task(self._renew_periodically())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._renewer.cancel()
+        self._renewer = None
+
+    def _lease(self) -> dict:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        return {"owner": self.owner, "expiresAt": expires_at}
+
+    def _reference(self, doc_id: str):
+        return self.db.collection(self.collection).document(doc_id)
+
+    def claim(self, snapshot) -> Optional[str]:
+        """
+        Leases the document for this worker. Returns None once claimed,
+        otherwise why not (ineligible by now, or leased elsewhere).
+        """
+        reference = self._reference(snapshot.id)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # Someone wrote in between; decide again on a fresh read.
+                snapshot = reference.get()
+            if snapshot.id in self.held:
+                return "already claimed by this worker"
+            data = snapshot.to_dict() or {}
+            reason = skip_reason(data)
+            if reason is not None:
+                return reason
+            holder = lease_holder(data)
+            if holder is not None:
+                return f"leased by {holder}"
+            try:
+                reference.update({LEASE_FIELD: self._lease()},
+                                 option=self.db.write_option(last_update_time=snapshot.update_time))
+            except FailedPrecondition:
+                continue
+            self.held.add(snapshot.id)
+            self.claimed += 1
+            return None
+        return "lease contended"
+
+    def holds(self, doc_id: str) -> bool:
+        return doc_id in self.held
+
+    def release(self, doc_id: str):
+        """Stops renewing; the result write removes the lease field itself."""
+        self.held.discard(doc_id)
+
+    def _renew(self, doc_id: str):
+        reference = self._reference(doc_id)
+        snapshot = reference.get()
+        lease = (snapshot.to_dict() or {}).get(LEASE_FIELD)
+        if not lease or lease["owner"] != self.owner:
+            # Expired and taken over (e.g. this worker stalled past the TTL).
+            print(f"⚠️ Lost the lease on {doc_id}")
+            self.held.discard(doc_id)
+            self.lost += 1
+            return
+        try:
+            reference.update({LEASE_FIELD: self._lease()},
+                             option=self.db.write_option(last_update_time=snapshot.update_time))
+        except FailedPrecondition:
+            pass  # written meanwhile; the next round tries again
+
+    async def renew(self):
+        for doc_id in list(self.held):
+            await asyncio.to_thread(self._renew, doc_id)
+
+    async def _renew_periodically(self):
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            await self.renew()
+
+    def stats(self) -> dict:
+        return {"owner": self.owner, "claimed": self.claimed, "held": len(self.held), "lost": self.lost}
@@ -0,0 +1,323 @@
+"""
+A local store implementing the slice of the Firestore client this repo uses:
+collections, documents, where/order_by/limit/start_after queries, write
+batches, SERVER_TIMESTAMP/Increment/DELETE_FIELD transforms, `on_snapshot`
+listeners and `write_option(last_update_time=...)` preconditions. Documents
+live in SQLite, in memory or in a file; a file is shared by every process
+that opens it. Scanning, result writes, leases and the daemon run on it
+unchanged, without Firebase credentials or a network (see STORE).
+
+Firestore's own types are only imported once a write or a listener needs
+them, so opening a store stays cheap.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in the local store")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class Snapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return None if self._data is None else json.loads(json.dumps(self._data, default=_encode), object_hook=_decode)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, **kwargs):
+        return self._db._get(self)
+
+    def set(self, data, merge=False):
+        self._db._write(self, data, merge=merge, create=True)
+
+    def update(self, data, option=None):
+        self._db._write(self, data, merge=True, create=False, option=option)
+
+    def delete(self):
+        self._db._delete(self)
+
+
+class Query:
+    def __init__(self, db, collection, filters=(), orders=(), limit=None, cursor=None):
+        self._db = db
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, cursor=self._cursor)
+        state.update(changes)
+        return Query(self._db, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        cursor = document_fields_or_snapshot
+        if isinstance(cursor, Snapshot):
+            cursor = {"__name__": cursor.id, **(cursor.to_dict() or {})}
+        return self._copy(cursor=cursor)
+
+    def _key(self, snapshot):
+        return tuple(
+            snapshot.id if field == "__name__" else snapshot.get(field)
+            for field, _ in self._orders
+        )
+
+    def get(self, **kwargs):
+        return list(self.stream(**kwargs))
+
+    def stream(self, **kwargs):
+        self._db._call("query")
+        return iter(self._matching())
+
+    def on_snapshot(self, callback):
+        return Watch(self, callback)
+
+    def _matching(self) -> list:
+        docs = [
+            snap for snap in self._db._all(self._collection)
+            if all(_OPS[op](snap.get(field), value) for field, op, value in self._filters)
+        ]
+        if self._orders:
+            docs.sort(key=self._key, reverse=self._orders[0][1] == "DESCENDING")
+        if self._cursor is not None:
+            after = tuple(self._cursor[field] for field, _ in self._orders)
+            docs = [snap for snap in docs if self._key(snap) > after]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+
+class Watch:
+    """
+    Polls a query every `interval` seconds on a background thread and calls
+    `callback(docs, changes, read_time)` like Firestore's Watch: once with
+    every match as ADDED, then whenever something was added, modified or
+    removed. Writes from other processes sharing the file are seen too.
+    """
+
+    def __init__(self, query, callback, interval: float = 0.05):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(query, callback, interval), daemon=True)
+        self._thread.start()
+
+    def _run(self, query, callback, interval):
+        from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+        known, first = {}, True
+        while not self._stop.is_set():
+            docs = query._matching()
+            changes = []
+            for index, doc in enumerate(docs):
+                if doc.id not in known:
+                    changes.append(DocumentChange(ChangeType.ADDED, doc, -1, index))
+                elif known[doc.id].update_time != doc.update_time:
+                    changes.append(DocumentChange(ChangeType.MODIFIED, doc, index, index))
+            current = {doc.id for doc in docs}
+            changes += [DocumentChange(ChangeType.REMOVED, doc, -1, -1) for doc_id, doc in known.items()
+                        if doc_id not in current]
+            if changes or first:
+                callback(docs, changes, datetime.now(timezone.utc))
+            known, first = {doc.id: doc for doc in docs}, False
+            self._stop.wait(interval)
+
+    def unsubscribe(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Collection(Query):
+    def __init__(self, db, name):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id):
+        return DocumentReference(self._db, self.id, doc_id)
+
+
+class WriteBatch:
+    """Up to 500 writes applied atomically in one round trip on `commit()`."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append((reference, document_data, merge, True, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append((reference, field_updates, True, False, option))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A write batch can contain at most 500 writes")
+        self._db._call("commit")
+        self._db._commit(self._writes)
+        self._writes = []
+
+
+class LocalFirestore:
+    """
+    A Firestore-compatible client over SQLite at `path` (":memory:" for a
+    store that lives as long as the process). `calls` counts the round trips
+    a real Firestore would make, by op: "query", "get", "write", "commit".
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.calls = Counter()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " collection TEXT, id TEXT, data TEXT, update_time REAL,"
+            " PRIMARY KEY (collection, id))"
+        )
+
+    def collection(self, name):
+        return Collection(self, name)
+
+    def _call(self, op):
+        self.calls[op] += 1
+
+    def _snapshot(self, collection, doc_id, data, update_time):
+        ref = DocumentReference(self, collection, doc_id)
+        stamp = datetime.fromtimestamp(update_time, timezone.utc) if update_time is not None else None
+        return Snapshot(ref, None if data is None else json.loads(data, object_hook=_decode), stamp)
+
+    def _all(self, collection):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data, update_time FROM docs WHERE collection = ?", (collection,)
+            ).fetchall()
+        return [self._snapshot(collection, *row) for row in rows]
+
+    def _get(self, ref):
+        self._call("get")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, update_time FROM docs WHERE collection = ? AND id = ?", (ref._collection, ref.id)
+            ).fetchone()
+        return self._snapshot(ref._collection, ref.id, *(row or (None, None)))
+
+    def batch(self):
+        return WriteBatch(self)
+
+    @staticmethod
+    def write_option(last_update_time=None):
+        return _LastUpdateOption(last_update_time)
+
+    def _write(self, ref, data, merge, create, option=None):
+        self._call("write")
+        self._commit([(ref, data, merge, create, option)])
+
+    def _commit(self, writes):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for ref, data, merge, create, option in writes:
+                    self._apply(ref, data, merge, create, option)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _apply(self, ref, data, merge, create, option=None):
+        from google.cloud.firestore_v1 import transforms
+
+        row = self._conn.execute(
+            "SELECT data, update_time FROM docs WHERE collection = ? AND id = ?", (ref._collection, ref.id)
+        ).fetchone()
+        if row is None and not create:
+            raise _not_found(ref)
+        if option is not None and (row is None or abs(row[1] - option.last_update_time.timestamp()) > 5e-7):
+            raise _failed_precondition(ref)
+        current = json.loads(row[0], object_hook=_decode) if (row and merge) else {}
+        for field, value in data.items():
+            if value is transforms.DELETE_FIELD:
+                current.pop(field, None)
+            elif value is transforms.SERVER_TIMESTAMP:
+                current[field] = datetime.now(timezone.utc)
+            elif isinstance(value, transforms.Increment):
+                current[field] = (current.get(field) or 0) + value.value
+            else:
+                current[field] = value
+        # Strictly increasing across processes, like Firestore's commit times.
+        previous = self._conn.execute("SELECT MAX(update_time) FROM docs").fetchone()[0] or 0
+        # Microseconds, so the datetime on a snapshot round-trips exactly.
+        update_time = round(max(time.time(), previous + 1e-6), 6)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO docs (collection, id, data, update_time) VALUES (?, ?, ?, ?)",
+            (ref._collection, ref.id, json.dumps(current, default=_encode), update_time),
+        )
+
+    def _delete(self, ref):
+        self._call("write")
+        with self._lock:
+            self._conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", (ref._collection, ref.id))
+
+
+class _LastUpdateOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+def _failed_precondition(ref):
+    from google.api_core.exceptions import FailedPrecondition
+    return FailedPrecondition(f"{ref.path} was modified since it was read")
+
+
+def _not_found(ref):
+    from google.api_core.exceptions import NotFound
+    return NotFound(f"No document to update: {ref.path}")
@@ -0,0 +1,243 @@
+import os
+import time
+import bisect
+import asyncio
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from app.config import METRICS_PATH, METRICS_PORT, METRICS_FLUSH_SECONDS
+
+# Upper bounds (seconds) of the stage-duration histogram buckets.
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class VideoStats:
+    """What one video (or one pack of videos) cost, stage by stage."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(float)
+
+    def as_row(self, share: float = 1.0) -> dict:
+        """Report columns; `share` scales them for one video of a pack."""
+        row = {f"{stage}Seconds": round(value * share, 3) for stage, value in self.seconds.items()}
+        row.update({
+            name: round(value * share, 6) if name == "costUsd" else int(value * share)
+            for name, value in self.counts.items()
+        })
+        return row
+
+
+_current: contextvars.ContextVar[Optional[VideoStats]] = contextvars.ContextVar("video_stats", default=None)
+
+
+class Registry:
+    """
+    Process-wide counters and a stage-duration histogram, rendered in the
+    Prometheus text format. Safe to update from worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)  # (name, label tuple) -> value
+        self.buckets = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.sums = defaultdict(float)
+        self.maxes = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self.buckets[stage][bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.sums[stage] += seconds
+            self.maxes[stage] = max(self.maxes[stage], seconds)
+
+    def _quantile(self, stage: str, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation.
+        counts = self.buckets[stage]
+        rank, seen = q * sum(counts), 0
+        for bound, count in zip(BUCKETS + (self.maxes[stage],), counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.maxes[stage])
+        return self.maxes[stage]
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {}
+            for stage, counts in self.buckets.items():
+                total = sum(counts)
+                stages[stage] = {
+                    "count": total,
+                    "totalSeconds": round(self.sums[stage], 3),
+                    "meanSeconds": round(self.sums[stage] / total, 4) if total else 0,
+                    "p95Seconds": round(self._quantile(stage, 0.95), 4),
+                    "maxSeconds": round(self.maxes[stage], 4),
+                }
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                key = name + "".join(f"_{v}" for _, v in labels)
+                counters[key] = round(value, 6)
+        return {"stages": stages, "counters": counters}
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"{name}{{{label_text}}} {value:g}" if labels else f"{name} {value:g}")
+            if self.buckets:
+                lines.append("# TYPE moderation_stage_seconds histogram")
+            for stage, counts in sorted(self.buckets.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, counts):
+                    cumulative += count
+                    lines.append(f'moderation_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'moderation_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {sum(counts)}')
+                lines.append(f'moderation_stage_seconds_sum{{stage="{stage}"}} {self.sums[stage]:.6f}')
+                lines.append(f'moderation_stage_seconds_count{{stage="{stage}"}} {sum(counts)}')
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Plain-data copy of the registry, e.g. to send from a worker process."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters), "buckets": {k: list(v) for k, v in self.buckets.items()},
+                "sums": dict(self.sums), "maxes": dict(self.maxes),
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] += value
+            for stage, counts in snapshot["buckets"].items():
+                self.buckets[stage] = [a + b for a, b in zip(self.buckets[stage], counts)]
+            for stage, value in snapshot["sums"].items():
+                self.sums[stage] += value
+            for stage, value in snapshot["maxes"].items():
+                self.maxes[stage] = max(self.maxes[stage], value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.buckets.clear()
+            self.sums.clear()
+            self.maxes.clear()
+
+
+registry = Registry()
+
+
+@contextmanager
+def video(stats: VideoStats = None):
+    """
+    Collects the spans and counts recorded inside the block for one video;
+    pass the same `stats` to blocks that handle one video in several steps.
+    """
+    stats = stats if stats is not None else VideoStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str):
+    """Times the block as `stage`, globally and for the current video."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(stage, elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.seconds[stage] += elapsed
+
+
+def count(name: str, value: float, field: str = None, **labels):
+    """
+    Adds `value` to the `moderation_<name>_total` counter and, under `field`,
+    to the current video's stats.
+    """
+    registry.inc(f"moderation_{name}_total", value, **labels)
+    stats = _current.get()
+    if stats is not None and field is not None:
+        stats.counts[field] += value
+
+
+def isolated(fn, *args):
+    """
+    Runs `fn(*args)` in a worker process against a fresh registry; returns its
+    value with the video's stats and a registry snapshot for `absorb`.
+    """
+    registry.reset()
+    with video() as stats:
+        value = fn(*args)
+    return value, stats, registry.snapshot()
+
+
+def absorb(stats: VideoStats, snapshot: dict):
+    """Merges what `isolated` recorded into this process and the current video."""
+    registry.merge(snapshot)
+    current = _current.get()
+    if current is not None:
+        for stage, seconds in stats.seconds.items():
+            current.seconds[stage] += seconds
+        for name, value in stats.counts.items():
+            current.counts[name] += value
+
+
+def write_textfile(path: str = METRICS_PATH):
+    """Atomically writes the registry for a node_exporter textfile collector."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+async def export_periodically(path: str = METRICS_PATH, interval: float = METRICS_FLUSH_SECONDS):
+    """Rewrites the metrics file every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(write_textfile, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+
+
+def start_http_server(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serves /metrics on `port` from a daemon thread (once per process)."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import sqlite3
+from array import array
+from typing import List, NamedTuple, Optional
+from app.cache import settings_fingerprint
+from app.config import (
+    NEAR_DUP_INDEX_PATH, NEAR_DUP_CAPACITY, NEAR_DUP_MAX_DISTANCE, NEAR_DUP_THRESHOLD, SIGNATURE_FRAMES,
+)
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Hashes of flat frames (black, white, solid colour) are near 0 or all ones
+# and match every other flat video, so they never go into a signature.
+MIN_HASH_BITS = 4
+
+
+class Match(NamedTuple):
+    video_id: str
+    score: float    # fraction of the query signature found in the match
+    verdict: dict
+
+
+def video_signature(hashes: List[int], size: int = SIGNATURE_FRAMES) -> List[int]:
+    """
+    Compact fingerprint of a video: up to `size` distinct, informative frame
+    hashes spread evenly over the sampled frames.
+    """
+    informative = []
+    for value in hashes:
+        if MIN_HASH_BITS <= value.bit_count() <= 64 - MIN_HASH_BITS and value not in informative:
+            informative.append(value)
+    if len(informative) <= size:
+        return informative
+    step = len(informative) / size
+    return [informative[int(i * step)] for i in range(size)]
+
+
+class NearDupIndex:
+    """
+    Multi-index hashing over video signatures. Every frame hash is split into
+    four 16-bit bands, each with its own lookup table, so any stored hash
+    within 3 bits of a query hash shares at least one band with it and is
+    found by exact lookups; larger `max_distance` values still work but may
+    miss some matches.
+
+    Memory is fixed by `capacity`: signatures live in preallocated arrays and
+    once full the oldest video's slot is reused. Signatures and verdicts are
+    persisted in SQLite and the tables are rebuilt from it on open.
+
+    Each verdict is stored with the settings fingerprint it was given under
+    (see `cache.settings_fingerprint`, the current settings by default), and
+    only matches under the same fingerprint are returned: after a prompt,
+    model or sampling change, old verdicts are never reused and age out.
+    """
+
+    def __init__(self, path: str = ":memory:", capacity: int = NEAR_DUP_CAPACITY,
+                 signature_size: int = SIGNATURE_FRAMES, max_distance: int = NEAR_DUP_MAX_DISTANCE):
+        self.capacity = capacity
+        self.signature_size = signature_size
+        self.max_distance = max_distance
+        self.hashes = array("Q", bytes(8 * capacity * signature_size))
+        self.lengths = array("B", bytes(capacity))
+        # Settings fingerprints as small ids, so each slot costs four bytes
+        # however many videos are added; id 0 is "" (rows from before
+        # fingerprints were stored).
+        self.fingerprints = array("I", bytes(4 * capacity))
+        self.fingerprint_ids = {"": 0}
+        self.bands = [{} for _ in range(BANDS)]
+        self.size = 0
+        self.next_slot = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            " slot INTEGER PRIMARY KEY, video_id TEXT NOT NULL, signature BLOB NOT NULL,"
+            " verdict TEXT NOT NULL, inserted_at REAL NOT NULL, fingerprint TEXT NOT NULL DEFAULT '')"
+        )
+        # Indexes written before fingerprints were stored; their rows never match.
+        if "fingerprint" not in [row[1] for row in self._conn.execute("PRAGMA table_info(videos)")]:
+            self._conn.execute("ALTER TABLE videos ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT slot, signature, fingerprint FROM videos WHERE slot < ? ORDER BY inserted_at", (self.capacity,)
+        ).fetchall()
+        for slot, blob, fingerprint in rows:
+            self._store(slot, array("Q", blob).tolist(), fingerprint)
+            self.next_slot = (slot + 1) % self.capacity
+
+    def _fingerprint_id(self, fingerprint: str) -> int:
+        return self.fingerprint_ids.setdefault(fingerprint, len(self.fingerprint_ids))
+
+    def _store(self, slot: int, signature: List[int], fingerprint: str):
+        if self.lengths[slot]:
+            self._unindex(slot)
+        else:
+            self.size += 1
+        base = slot * self.signature_size
+        for position, value in enumerate(signature, start=base):
+            self.hashes[position] = value
+            for band in range(BANDS):
+                key = (value >> (band * BAND_BITS)) & BAND_MASK
+                self.bands[band].setdefault(key, array("I")).append(position)
+        self.lengths[slot] = len(signature)
+        self.fingerprints[slot] = self._fingerprint_id(fingerprint)
+
+    def _unindex(self, slot: int):
+        base = slot * self.signature_size
+        for position in range(base, base + self.lengths[slot]):
+            value = self.hashes[position]
+            for band in range(BANDS):
+                key = (value >> (band * BAND_BITS)) & BAND_MASK
+                bucket = self.bands[band][key]
+                bucket.remove(position)
+                if not bucket:
+                    del self.bands[band][key]
+
+    def add(self, video_id: str, hashes: List[int], verdict: dict, fingerprint: str = None) -> bool:
+        """Indexes a moderated video. Returns False if it has no usable signature."""
+        signature = video_signature(hashes, self.signature_size)
+        if not signature:
+            return False
+        fingerprint = fingerprint or settings_fingerprint()
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        self._store(slot, signature, fingerprint)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO videos (slot, video_id, signature, verdict, inserted_at, fingerprint)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (slot, video_id, array("Q", signature).tobytes(), json.dumps(verdict), time.time(), fingerprint),
+        )
+        self._conn.commit()
+        return True
+
+    def query(self, hashes: List[int], threshold: float = NEAR_DUP_THRESHOLD,
+              fingerprint: str = None) -> Optional[Match]:
+        """
+        Returns the video indexed under `fingerprint` covering the largest
+        share of this video's signature, if that share is at least `threshold`.
+        """
+        signature = video_signature(hashes, self.signature_size)
+        if not signature:
+            return None
+        wanted = self.fingerprint_ids.get(fingerprint or settings_fingerprint())
+        if wanted is None:
+            return None  # nothing indexed under these settings
+
+        # Bucket entries point at individual stored hashes, so each candidate
+        # costs one XOR + popcount rather than a whole signature comparison.
+        matched = {}
+        for i, value in enumerate(signature):
+            for band in range(BANDS):
+                bucket = self.bands[band].get((value >> (band * BAND_BITS)) & BAND_MASK)
+                if not bucket:
+                    continue
+                for position in bucket:
+                    if (value ^ self.hashes[position]).bit_count() <= self.max_distance:
+                        matched.setdefault(position // self.signature_size, set()).add(i)
+
+        best_slot, best_score = None, 0.0
+        for slot, found in matched.items():
+            if self.fingerprints[slot] != wanted:
+                continue
+            score = len(found) / len(signature)
+            if score > best_score:
+                best_slot, best_score = slot, score
+        if best_slot is None or best_score < threshold:
+            return None
+
+        video_id, verdict = self._conn.execute(
+            "SELECT video_id, verdict FROM videos WHERE slot = ?", (best_slot,)
+        ).fetchone()
+        return Match(video_id, best_score, json.loads(verdict))
+
+    def close(self):
+        self._conn.close()
+
+
+_index = None
+
+
+def get_near_dup_index() -> Optional[NearDupIndex]:
+    """Returns the shared index, loading it on first use; None when disabled."""
+    global _index
+    if _index is None and NEAR_DUP_INDEX_PATH:
+        _index = NearDupIndex(NEAR_DUP_INDEX_PATH)
+    return _index
@@ -0,0 +1,301 @@
+import os
+import json
+import shutil
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from app.cache import get_cache, video_cache_key
+from app.eligibility import skip_reason
+from app.scheduler import run_sliding_window
+from app.pipeline import select_frames, build_content, chat_request, parse_verdict, cached_result
+from app.ai.schema import ModerationResult
+from app.ai.tokens import token_cost
+from app.metrics import count
+from app.video.extractor import sample_frames_async
+from app.video.dedup import frame_hashes_async
+from app.video.mosaic import build_sheets_async
+from app.config import (
+    OPENAI_MODEL, FRAME_MODE, DEDUP_MAX_DISTANCE, MOSAIC_TILES, MOSAIC_MAX_SIDE,
+    OFFLINE_SHARD_MAX_REQUESTS, OFFLINE_SHARD_MAX_MB, OFFLINE_POLL_SECONDS,
+)
+
+ENDPOINT = "/v1/chat/completions"
+# Batch API requests are billed at half the synchronous price.
+BATCH_PRICE_FACTOR = 0.5
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class OfflineJob:
+    """
+    One offline run kept in `job_dir`: the request shards, a `.meta.jsonl`
+    per shard with what the pipeline knows about each video before the model
+    answers, and `state.json` recording how far every shard has got (uploaded
+    file, batch, status, ingested). Each step skips what the state says is
+    done, so re-running an interrupted job picks up where it stopped.
+    """
+
+    def __init__(self, job_dir: str):
+        self.job_dir = job_dir
+        self.state_path = os.path.join(job_dir, "state.json")
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {"prepared": False, "shards": []}
+
+    @property
+    def shards(self) -> list:
+        return self.state["shards"]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.job_dir, name)
+
+    def save(self):
+        os.makedirs(self.job_dir, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def prepared_ids(self) -> set:
+        ids = set()
+        for shard in self.shards:
+            with open(self.path(shard["meta"]), encoding="utf-8") as f:
+                ids.update(json.loads(line)["id"] for line in f)
+        return ids
+
+    def clear(self):
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+
+
+async def _prepare_video(doc_id: str, video_url: str, frame_mode: str, cache_key: str = None) -> tuple[dict, dict]:
+    """
+    Extracts frames and builds the batch request line and its metadata,
+    which keeps the `cache_key` the answer is stored under. ffmpeg runs
+    under the FFMPEG_CONCURRENCY cap and the probe/decode deadlines.
+    """
+    sampled = await sample_frames_async(video_url)
+    hashes = None
+    if DEDUP_MAX_DISTANCE >= 0 and len(sampled) > 1:
+        hashes = await frame_hashes_async([f.data for f in sampled])
+    frames, tokens_saved = select_frames(sampled, hashes)
+    sheets = None
+    if frame_mode == "mosaic":
+        sheets = await build_sheets_async(frames, MOSAIC_TILES, MOSAIC_MAX_SIDE)
+    content, images_sent = await asyncio.to_thread(build_content, frames, frame_mode, sheets=sheets)
+    line = {"custom_id": doc_id, "method": "POST", "url": ENDPOINT, "body": chat_request(content)}
+    meta = {
+        "id": doc_id,
+        "framesSampled": len(sampled),
+        "framesSent": len(frames),
+        "tokensSavedByDedup": tokens_saved,
+        "imagesSent": images_sent,
+    }
+    if cache_key is not None:
+        meta["cacheKey"] = cache_key
+    return line, meta
+
+
+class _ShardWriter:
+    def __init__(self, job: OfflineJob, max_requests: int, max_bytes: int):
+        self.job = job
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self._requests = self._meta = None
+        self._count = self._bytes = 0
+
+    def write(self, line: dict, meta: dict):
+        encoded = (json.dumps(line) + "\n").encode()
+        if self._requests is not None and (
+                self._count >= self.max_requests or self._bytes + len(encoded) > self.max_bytes):
+            self.close()
+        if self._requests is None:
+            # Anything left over from an interrupted run is overwritten.
+            self.name = f"shard-{len(self.job.shards) + 1:04d}"
+            self._requests = open(self.job.path(f"{self.name}.jsonl"), "wb")
+            self._meta = open(self.job.path(f"{self.name}.meta.jsonl"), "w", encoding="utf-8")
+            self._count = self._bytes = 0
+        self._requests.write(encoded)
+        self._meta.write(json.dumps(meta) + "\n")
+        self._count += 1
+        self._bytes += len(encoded)
+
+    def close(self):
+        if self._requests is None:
+            return
+        self._requests.close()
+        self._meta.close()
+        self.job.shards.append({
+            "name": self.name, "input": f"{self.name}.jsonl", "meta": f"{self.name}.meta.jsonl",
+            "requests": self._count, "fileId": None, "batchId": None, "status": None, "ingested": False,
+        })
+        self.job.save()
+        self._requests = self._meta = None
+
+
+async def prepare_shards(docs, job: OfflineJob, write: Callable[[str, dict], Awaitable], concurrency: int,
+                         frame_mode: str = FRAME_MODE, max_requests: int = OFFLINE_SHARD_MAX_REQUESTS,
+                         max_bytes: int = int(OFFLINE_SHARD_MAX_MB * 1024 * 1024)) -> AsyncIterator[dict]:
+    """
+    Builds request shards for every eligible document, extracting frames for
+    `concurrency` videos at a time. Videos already in a finished shard are
+    skipped; cache hits are written straight away and yielded as results,
+    as are videos that cannot be prepared.
+    """
+    os.makedirs(job.job_dir, exist_ok=True)
+    done = job.prepared_ids()
+    cache = get_cache()
+
+    async def _prepare(doc):
+        data = doc.to_dict()
+        reason = skip_reason(data)
+        if reason is not None:
+            return {"id": doc.id, "status": "failed", "error": reason}
+        try:
+            cache_key = None
+            if cache is not None:
+                cache_key = await asyncio.to_thread(video_cache_key, data["videoUrl"], frame_mode, "single")
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    cached = cached_result(cached)
+                    await write(doc.id, cached)
+                    return {"id": doc.id, "status": "success", "moderation": cached}
+            line, meta = await _prepare_video(doc.id, data["videoUrl"], frame_mode, cache_key)
+            return {"id": doc.id, "status": "prepared", "line": line, "meta": meta}
+        except Exception as e:
+            return {"id": doc.id, "status": "failed", "error": str(e)}
+
+    async def _pending():
+        if hasattr(docs, "__aiter__"):
+            async for doc in docs:
+                if doc.id not in done:
+                    yield doc
+        else:
+            for doc in docs:
+                if doc.id not in done:
+                    yield doc
+
+    shards = _ShardWriter(job, max_requests, max_bytes)
+    async for r in run_sliding_window(_pending(), _prepare, concurrency):
+        if r["status"] == "prepared":
+            shards.write(r["line"], r["meta"])
+        else:
+            yield r
+    # Only a completed pass closes the last shard, so an interrupted one is
+    # rebuilt on resume rather than submitted half-written.
+    shards.close()
+    job.state["prepared"] = True
+    job.save()
+
+
+async def submit_shards(client, job: OfflineJob):
+    for shard in job.shards:
+        if shard["fileId"] is None:
+            with open(job.path(shard["input"]), "rb") as f:
+                uploaded = await client.files.create(file=(shard["input"], f), purpose="batch")
+            shard["fileId"] = uploaded.id
+            job.save()
+        if shard["batchId"] is None:
+            batch = await client.batches.create(
+                input_file_id=shard["fileId"], endpoint=ENDPOINT, completion_window="24h",
+                metadata={"job": os.path.basename(job.job_dir), "shard": shard["name"]},
+            )
+            shard["batchId"], shard["status"] = batch.id, batch.status
+            job.save()
+            print(f"📤 Submitted {shard['name']} ({shard['requests']} videos) as {batch.id}")
+
+
+async def wait_for_batches(client, job: OfflineJob, poll_seconds: float = OFFLINE_POLL_SECONDS):
+    while True:
+        pending = [s for s in job.shards if s["status"] not in TERMINAL_STATUSES]
+        if not pending:
+            return
+        for shard in pending:
+            batch = await client.batches.retrieve(shard["batchId"])
+            if batch.status != shard["status"]:
+                print(f"⏳ {shard['name']}: {batch.status}")
+            shard.update(status=batch.status, outputFileId=batch.output_file_id, errorFileId=batch.error_file_id)
+        job.save()
+        if any(s["status"] not in TERMINAL_STATUSES for s in job.shards):
+            await asyncio.sleep(poll_seconds)
+
+
+async def _lines(client, file_id: Optional[str]) -> AsyncIterator[dict]:
+    if file_id is None:
+        return
+    async with client.files.with_streaming_response.content(file_id) as response:
+        async for line in response.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def _result(record: dict, meta: dict) -> dict:
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or response.get("body", {}).get("error")
+        raise ValueError(f"Batch request failed: {error}")
+    body = response["body"]
+    data = parse_verdict(body["choices"][0]["message"]["content"])
+    usage = body.get("usage") or {}
+    data["totalTokens"] = usage.get("total_tokens", 0)
+    prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    count("tokens", prompt, kind="prompt")
+    count("tokens", completion, kind="completion")
+    count("cost_usd", token_cost(prompt, completion, OPENAI_MODEL) * BATCH_PRICE_FACTOR)
+    data.update({k: v for k, v in meta.items() if k not in ("id", "cacheKey")})
+    return ModerationResult.model_validate(data).model_dump()
+
+
+async def ingest_results(client, job: OfflineJob, write: Callable[[str, dict], Awaitable],
+                         flush: Callable[[], Awaitable] = None) -> AsyncIterator[dict]:
+    """
+    Streams each finished shard's output and error files, validating every
+    answer, storing it in the result cache and writing it through `write`.
+    Videos the batch never answered (expired or failed batches) are reported
+    failed and left for the next run.
+    """
+    cache = get_cache()
+    for shard in job.shards:
+        if shard["ingested"] or shard["status"] not in TERMINAL_STATUSES:
+            continue
+        with open(job.path(shard["meta"]), encoding="utf-8") as f:
+            metas = {m["id"]: m for m in map(json.loads, f)}
+
+        answered = set()
+        for file_id in (shard.get("outputFileId"), shard.get("errorFileId")):
+            async for record in _lines(client, file_id):
+                doc_id = record["custom_id"]
+                answered.add(doc_id)
+                try:
+                    meta = metas.get(doc_id, {})
+                    result = _result(record, meta)
+                    if cache is not None and meta.get("cacheKey"):
+                        cache.put(meta["cacheKey"], result)
+                    await write(doc_id, result)
+                    yield {"id": doc_id, "status": "success", "moderation": result}
+                except Exception as e:
+                    yield {"id": doc_id, "status": "failed", "error": str(e)}
+        for doc_id in metas.keys() - answered:
+            yield {"id": doc_id, "status": "failed", "error": f"Batch {shard['status']} without an answer"}
+
+        if flush is not None:
+            await flush()
+        shard["ingested"] = True
+        job.save()
+
+
+async def run_offline_job(docs, job: OfflineJob, client, write: Callable[[str, dict], Awaitable],
+                          flush: Callable[[], Awaitable] = None, concurrency: int = 8,
+                          poll_seconds: float = OFFLINE_POLL_SECONDS, **shard_limits) -> AsyncIterator[dict]:
+    """
+    Runs (or resumes) an offline job end to end: prepare shards, submit them
+    to the Batch API, poll until every batch finishes and ingest the results.
+    The job directory is removed once everything has been ingested.
+    """
+    if not job.state["prepared"]:
+        async for r in prepare_shards(docs, job, write, concurrency, **shard_limits):
+            yield r
+    await submit_shards(client, job)
+    await wait_for_batches(client, job, poll_seconds)
+    async for r in ingest_results(client, job, write, flush):
+        yield r
+    job.clear()
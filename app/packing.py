@@ -0,0 +1,188 @@
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.cache import get_cache, settings_fingerprint
+from app.near_dup import get_near_dup_index
+from app.ai.schema import ModerationResult
+from app.video.extractor import sample_frames_async
+from app.video.dedup import frame_hashes_async
+from app.video.mosaic import build_sheets_async
+from app.video.prescreen import prescreen_frames
+from app.pipeline import (
+    build_content, select_frames, estimate_tokens, call_model, moderate_frames, near_duplicate_result,
+    FramePlan, MAX_COMPLETION_TOKENS, TIMEOUT_RESULT,
+)
+from app.config import (
+    FRAME_MODE, IMAGE_DETAIL, DEDUP_MAX_DISTANCE, TIMEOUT_SECONDS, PACK_MAX_VIDEOS, PACK_TOKEN_BUDGET,
+    MOSAIC_TILES, MOSAIC_MAX_SIDE,
+)
+
+PACK_NOTE = (
+    "This request contains {count} separate videos. Each starts with a \"Video <id>\" line "
+    "followed by its frames. Moderate every video independently with the rules above and "
+    "return a JSON array with exactly one object per video: the usual JSON shape plus a "
+    "\"videoId\" field holding the id from its \"Video\" line."
+)
+
+
+class PackItem(NamedTuple):
+    video_id: str
+    cache_key: Optional[str]
+    sampled: list
+    frames: list
+    tokens_saved: int
+    parts: list  # user-message parts for this video, without the intro
+    images: int
+    tokens: int  # estimated prompt tokens of `parts`
+    hashes: Optional[list] = None  # for the near-duplicate index
+    detail: str = IMAGE_DETAIL
+
+
+async def _prepare(video_id: str, source: str, cache_key: Optional[str], frame_mode: str,
+                   plan: Optional[FramePlan] = None, need_hashes: bool = False, screen: bool = False):
+    # Every ffmpeg runs as a capped subprocess with a deadline (see run_ffmpeg).
+    if plan is None:
+        sampled, detail = await sample_frames_async(source), IMAGE_DETAIL
+    else:
+        sampled, detail = await sample_frames_async(source, plan.frames, max_side=plan.max_side), plan.detail
+    if screen:
+        verdict = await prescreen_frames(sampled)
+        if verdict is not None:
+            return verdict
+    hashes = None
+    if need_hashes or (DEDUP_MAX_DISTANCE >= 0 and len(sampled) > 1):
+        hashes = await frame_hashes_async([f.data for f in sampled])
+    frames, tokens_saved = select_frames(sampled, hashes)
+    sheets = await build_sheets_async(frames, MOSAIC_TILES, MOSAIC_MAX_SIDE) if frame_mode == "mosaic" else None
+    content, images = build_content(frames, frame_mode, detail, sheets)
+    parts = [{"type": "text", "text": f"Video {video_id}:"}, *content[1:]]
+    tokens = estimate_tokens([{"role": "user", "content": parts}], 0)
+    return PackItem(video_id, cache_key, sampled, frames, tokens_saved, parts, images, tokens, hashes, detail)
+
+
+def plan_packs(items: List[PackItem], token_budget: int = PACK_TOKEN_BUDGET,
+               max_videos: int = PACK_MAX_VIDEOS) -> List[List[PackItem]]:
+    """
+    Greedily groups consecutive items while their estimated prompt tokens
+    stay within `token_budget`; an item over the budget goes alone.
+    """
+    packs, current, tokens = [], [], 0
+    for item in items:
+        if current and (len(current) >= max_videos or tokens + item.tokens > token_budget):
+            packs.append(current)
+            current, tokens = [], 0
+        current.append(item)
+        tokens += item.tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _finish(item: PackItem, data: dict, frame_mode: str, **fields) -> dict:
+    data.update(fields, framesSampled=len(item.sampled), framesSent=len(item.frames),
+                tokensSavedByDedup=item.tokens_saved)
+    validated = ModerationResult.model_validate(data).model_dump()
+    cache = get_cache()
+    if cache is not None and item.cache_key is not None:
+        cache.put(item.cache_key, validated)
+    index = get_near_dup_index()
+    if index is not None and item.hashes is not None:
+        index.add(item.video_id, item.hashes, validated, settings_fingerprint(frame_mode))
+    return validated
+
+
+async def _moderate_alone(item: PackItem, frame_mode: str, extra_tokens: int = 0) -> dict:
+    try:
+        async with asyncio.timeout(TIMEOUT_SECONDS) as deadline:
+            data = await moderate_frames(item.frames, frame_mode, deadline=deadline, detail=item.detail)
+    except TimeoutError:
+        return dict(TIMEOUT_RESULT)
+    return _finish(item, data, frame_mode, totalTokens=data["totalTokens"] + extra_tokens, packSize=1)
+
+
+def _answers(verdict) -> Dict[str, dict]:
+    if isinstance(verdict, dict):
+        verdict = verdict.get("results", [verdict])
+    return {str(a.get("videoId")): a for a in verdict if isinstance(a, dict)}
+
+
+async def _moderate_pack(pack: List[PackItem], frame_mode: str) -> Dict[str, dict]:
+    content = [{"type": "text", "text": PACK_NOTE.format(count=len(pack))}]
+    for item in pack:
+        content.extend(item.parts)
+
+    answers, tokens = {}, 0
+    try:
+        async with asyncio.timeout(TIMEOUT_SECONDS) as deadline:
+            verdict, tokens, _ = await call_model(content, deadline, MAX_COMPLETION_TOKENS * len(pack))
+        answers = _answers(verdict)
+    except TimeoutError:
+        pass
+    except ValueError as e:  # unparseable JSON
+        print(f"⚠️ Packed request for {len(pack)} videos returned invalid JSON: {e}")
+
+    # The request's tokens are shared out by each video's share of the prompt.
+    estimated = sum(item.tokens for item in pack) or 1
+    results = {}
+    for item in pack:
+        share = round(tokens * item.tokens / estimated)
+        answer = answers.get(item.video_id)
+        if answer is not None:
+            answer = {k: v for k, v in answer.items() if k != "videoId"}
+            try:
+                results[item.video_id] = _finish(item, answer, frame_mode, totalTokens=share,
+                                                 imagesSent=item.images, packSize=len(pack))
+                continue
+            except ValueError:
+                pass
+        # Missing or invalid answer: ask again for this video on its own.
+        try:
+            results[item.video_id] = await _moderate_alone(item, frame_mode, extra_tokens=share)
+        except Exception as e:
+            results[item.video_id] = e
+    return results
+
+
+async def moderate_packed(videos: List[Tuple[str, str, Optional[str]]], frame_mode: str = FRAME_MODE,
+                          token_budget: int = PACK_TOKEN_BUDGET, max_videos: int = PACK_MAX_VIDEOS,
+                          plans: Dict[str, FramePlan] = None, screen: bool = False) -> dict:
+    """
+    Moderates several `(video_id, source, cache_key)` videos, packing the
+    ones that fit `token_budget` together so the system prompt is paid once
+    per pack instead of once per video. Each result's `totalTokens` is its
+    share of the request it rode in, and `packSize` says how many videos
+    shared it. `plans` (see `plan_frames`) sets a video's frame count, size
+    and detail. Near-duplicates of moderated videos, and with `screen` the
+    videos `prescreen_frames` settles, are resolved without a request. Returns
+    `{video_id: result or exception}`; a failed request fails only the
+    videos it carried.
+    """
+    plans = plans or {}
+    index = get_near_dup_index()
+    prepared = await asyncio.gather(
+        *(_prepare(video_id, source, cache_key, frame_mode, plans.get(video_id), index is not None, screen)
+          for video_id, source, cache_key in videos),
+        return_exceptions=True,
+    )
+    # Failures and screened verdicts are final.
+    results = {video_id: p for (video_id, _, _), p in zip(videos, prepared) if not isinstance(p, PackItem)}
+    items = []
+    for item in prepared:
+        if not isinstance(item, PackItem):
+            continue
+        match = index.query(item.hashes, fingerprint=settings_fingerprint(frame_mode)) if index is not None else None
+        if match is not None:
+            results[item.video_id] = near_duplicate_result(match)
+        else:
+            items.append(item)
+
+    async def _run(pack):
+        try:
+            if len(pack) == 1:
+                return {pack[0].video_id: await _moderate_alone(pack[0], frame_mode)}
+            return await _moderate_pack(pack, frame_mode)
+        except Exception as e:
+            return {item.video_id: e for item in pack}
+
+    for outcome in await asyncio.gather(*(_run(pack) for pack in plan_packs(items, token_budget, max_videos))):
+        results.update(outcome)
+    return results
@@ -1,62 +1,573 @@
-import os
 import json
+import math
+import time
 import base64
 import asyncio
-import shutil
-import tempfile
-from app.ai.client import client
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from app.ai.client import get_client
+from app.cache import get_cache, video_cache_key, settings_fingerprint
+from app.near_dup import get_near_dup_index
 from app.ai.prompt import SYSTEM_PROMPT
 from app.ai.schema import ModerationResult
-from app.video.extractor import extract_frames
-from app.config import OPENAI_MODEL, TIMEOUT_SECONDS
+from app.ai.tokens import image_tokens, token_cost
+from app.ai.ratelimit import get_rate_limiter
+from app.ai.hedging import get_hedger
+from app import metrics
+from app.metrics import span, count
+from app.video.extractor import (
+    sample_frames_async, format_timestamp, jpeg_size, probe_async, duration_from_probe,
+)
+from app.video.dedup import frame_hashes_async, dedup_frames
+from app.video.prescreen import prescreen, prescreen_frames
+from app.video.mosaic import build_sheets_async
+from app.config import (
+    OPENAI_MODEL, TIMEOUT_SECONDS, DEDUP_MAX_DISTANCE, FRAME_MODE, IMAGE_DETAIL,
+    MOSAIC_TILES, MOSAIC_MAX_SIDE, MOSAIC_MIN_TILE_SIDE, NEAR_DUP_ACTION,
+    MODERATION_MODE, SCREEN_FRAMES, SCREEN_DETAIL, PRESCREEN, MAX_FRAMES, FRAME_INTERVAL, FRAME_MAX_SIDE,
+    VIDEO_TOKEN_BUDGET,
+)
 
+MAX_COMPLETION_TOKENS = 500
+# Verdicts a screening stage may settle on its own.
+CONFIDENT_STATUSES = {"approved", "rejected"}
+TIMEOUT_RESULT = {
+    "moderationStatus": "failed",
+    "reason": "Timeout",
+    "explicitContent": None,
+    "stemContent": None,
+    "piiDetected": None,
+    "copyrightRisk": None,
+    "detectedObjects": [],
+    "detectedKeywords": [],
+    "totalTokens": 0
+}
+SCREEN_NOTE = (
+    "These are only a few low-resolution frames from the video. Answer approved or rejected "
+    "only if they make the verdict clear; if a closer look could change it (small text, "
+    "possible personal information, logos, anything ambiguous), answer needsManualReview."
+)
+INTRO = "Analyze these video frames."
+# The "Frame at 00:00" line sent before each frame.
+FRAME_LABEL_TOKENS = len("Frame at 00:00") // 4
 
-async def moderate_video(video_path: str) -> dict:
 
-    async def _run():
-        temp_dir = tempfile.mkdtemp()
-        try:
-            frames = extract_frames(video_path, temp_dir)
+def image_part(data: bytes, detail: str = "auto") -> dict:
+    b64 = base64.b64encode(data).decode()
+    count("bytes", len(b64), "imageBytes", kind="images")
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": detail}
+    }
 
-            content = [{"type": "text", "text": "Analyze these video frames."}]
-            for f in frames:
-                with open(f, "rb") as img:
-                    b64 = base64.b64encode(img.read()).decode()
+
+def sheet_detail(sheet) -> str:
+    """
+    Picks detail=low when the 512px low-detail rendition still leaves each
+    tile at least MOSAIC_MIN_TILE_SIDE pixels on its longest edge.
+    """
+    shrink = min(1.0, 512 / max(sheet.width, sheet.height))
+    tile_side = max(sheet.width / sheet.columns, sheet.height / sheet.rows) * shrink
+    return "low" if tile_side >= MOSAIC_MIN_TILE_SIDE else "high"
+
+
+def build_content(frames, frame_mode: str = FRAME_MODE, detail: str = IMAGE_DETAIL,
+                  sheets: list = None) -> tuple[list, int]:
+    """
+    Builds the user message parts for `frames`, either one image per frame or
+    packed into contact sheets. Returns the parts and the image count. In
+    mosaic mode, pass the `sheets` built from `frames` by
+    `build_sheets_async`, so ffmpeg runs under its cap and deadline.
+    """
+    if frame_mode == "mosaic" and sheets is None:
+        raise ValueError("mosaic content needs the frames' contact sheets (see build_sheets_async)")
+    with span("encode"):
+        content = [{"type": "text", "text": INTRO}]
+        if frame_mode == "mosaic":
+            for i, sheet in enumerate(sheets, start=1):
+                tiles = ", ".join(
+                    f"tile {n} at {format_timestamp(t)}" for n, t in enumerate(sheet.timestamps, start=1)
+                )
                 content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
+                    "type": "text",
+                    "text": f"Contact sheet {i}: {sheet.columns}x{sheet.rows} grid of frames, "
+                            f"read left to right, top to bottom; {tiles}"
                 })
+                content.append(image_part(sheet.data, sheet_detail(sheet)))
+            return content, len(sheets)
+
+        for frame in frames:
+            content.append({"type": "text", "text": f"Frame at {format_timestamp(frame.timestamp)}"})
+            content.append(image_part(frame.data, detail))
+        return content, len(frames)
+
+
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    """
+    Upper estimate of the tokens a request counts against TPM: ~4 characters
+    per text token, images by their tiling cost, plus the completion budget.
+    """
+    tokens = max_tokens
+    for message in messages:
+        parts = message["content"]
+        if isinstance(parts, str):
+            parts = [{"type": "text", "text": parts}]
+        for part in parts:
+            if part["type"] == "image_url":
+                url, detail = part["image_url"]["url"], part["image_url"].get("detail", "auto")
+                data = base64.b64decode(url.split(",", 1)[1])
+                tokens += image_tokens(*jpeg_size(data), detail)
+            else:
+                tokens += len(part["text"]) // 4
+    return tokens
+
+
+class FramePlan(NamedTuple):
+    frames: int  # at most; short videos sample fewer
+    max_side: int
+    detail: str
+    tokens: int  # predicted tokens of every request, completions included
+
+
+def predict_tokens(frames: int, width: Optional[int], height: Optional[int], max_side: int = FRAME_MAX_SIDE,
+                   detail: str = IMAGE_DETAIL, moderation_mode: str = MODERATION_MODE) -> int:
+    """
+    Tokens the requests for `frames` frames of a `width` x `height` video,
+    scaled down to `max_side`, are expected to take, counted the way
+    `estimate_tokens` counts an encoded request. An unknown size is taken
+    as square, the most tiles a frame of `max_side` can cost.
+    """
+    if not width or not height:
+        width = height = max_side
+    scale = min(1.0, max_side / max(width, height))
+    size = max(1, round(width * scale)), max(1, round(height * scale))
+
+    request = estimate_tokens([SYSTEM_PROMPT], MAX_COMPLETION_TOKENS) + len(INTRO) // 4
+    tokens = request + frames * (image_tokens(*size, detail) + FRAME_LABEL_TOKENS)
+    if moderation_mode == "progressive":
+        screened = min(frames, SCREEN_FRAMES)
+        tokens += request + len(SCREEN_NOTE) // 4 + screened * (image_tokens(*size, SCREEN_DETAIL) + FRAME_LABEL_TOKENS)
+    return tokens
+
+
+def plan_frames(duration: Optional[float], width: Optional[int], height: Optional[int],
+                token_budget: float = VIDEO_TOKEN_BUDGET, moderation_mode: str = MODERATION_MODE,
+                max_frames: int = MAX_FRAMES, frame_rate: float = FRAME_INTERVAL) -> FramePlan:
+    """
+    Picks how many frames to send, how large and at which detail, so a
+    video's requests fit `token_budget` by `predict_tokens`. Coverage comes
+    first: every frame sampling would take is kept while the frames step
+    down from FRAME_MAX_SIDE at IMAGE_DETAIL to a single 512px tile and then
+    to detail=low. Only then are frames dropped, keeping at least one even
+    when that is over budget.
+    """
+    wanted = max_frames if duration is None else min(max_frames, max(1, math.ceil(duration * frame_rate)))
+    settings = [(FRAME_MAX_SIDE, IMAGE_DETAIL)]
+    if IMAGE_DETAIL != "low":
+        if FRAME_MAX_SIDE > 512:
+            settings.append((512, IMAGE_DETAIL))
+        settings.append((min(FRAME_MAX_SIDE, 512), "low"))
+
+    for max_side, detail in settings:
+        tokens = predict_tokens(wanted, width, height, max_side, detail, moderation_mode)
+        if tokens <= token_budget:
+            return FramePlan(wanted, max_side, detail, tokens)
+    frames = next((n for n in range(wanted - 1, 0, -1)
+                   if predict_tokens(n, width, height, max_side, detail, moderation_mode) <= token_budget), 1)
+    return FramePlan(frames, max_side, detail, predict_tokens(frames, width, height, max_side, detail, moderation_mode))
+
+
+def plan_from_probe(info: dict, token_budget: float, moderation_mode: str = MODERATION_MODE) -> FramePlan:
+    """`plan_frames` for a video from its ffprobe output (see `probe_async`)."""
+    stream = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"
+                   and not s.get("disposition", {}).get("attached_pic")), {})
+    plan = plan_frames(duration_from_probe(info), stream.get("width"), stream.get("height"),
+                       token_budget, moderation_mode)
+    count("planned_tokens", plan.tokens, "plannedTokens")
+    return plan
+
+
+class TokenBudget:
+    """
+    The tokens a batch run may spend. Each video claims the cheapest request
+    it could make before it starts, grows the claim to its plan once probed
+    and settles it to the tokens it actually used, so spent plus reserved
+    never passes `total` by prediction.
+    """
 
-            response = await client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": content},
-                ],
-                max_tokens=500
-            )
+    def __init__(self, total: int):
+        self.total = total
+        self.reserved = 0
+        self.spent = 0
+        self.refused = 0
 
-            raw = response.choices[0].message.content
-            data = json.loads(raw.strip().replace("```json", "").replace("```", ""))
-            data["totalTokens"] = response.usage.total_tokens if response.usage else 0
+    @property
+    def available(self) -> int:
+        return self.total - self.reserved - self.spent
 
-            validated = ModerationResult.model_validate(data)
-            return validated.model_dump()
+    def claim(self, tokens: int) -> bool:
+        if tokens > self.available:
+            self.refused += 1
+            return False
+        self.reserved += tokens
+        return True
 
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+    def resize(self, reserved: int, tokens: int) -> int:
+        """Replaces a claim of `reserved` tokens with one of `tokens`; returns the new claim."""
+        self.reserved += tokens - reserved
+        return tokens
 
+    def settle(self, reserved: int, used: int):
+        self.reserved -= reserved
+        self.spent += used
+
+    def stats(self) -> dict:
+        return {"total": self.total, "spent": self.spent, "reserved": self.reserved, "refused": self.refused}
+
+
+def select_frames(sampled, hashes) -> tuple[list, int]:
+    """
+    Drops near-duplicate frames; returns the kept frames and the image tokens
+    the dropped ones would have cost.
+    """
+    if DEDUP_MAX_DISTANCE < 0 or len(sampled) < 2:
+        return sampled, 0
+    frames = dedup_frames(sampled, hashes, DEDUP_MAX_DISTANCE)
+    kept = {f.timestamp for f in frames}
+    return frames, sum(image_tokens(*jpeg_size(f.data)) for f in sampled if f.timestamp not in kept)
+
+
+def chat_request(content: list, max_tokens: int = MAX_COMPLETION_TOKENS) -> dict:
+    """Keyword arguments of the chat completion for one video."""
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            SYSTEM_PROMPT,
+            {"role": "user", "content": content},
+        ],
+        "max_tokens": max_tokens,
+    }
+
+
+def parse_verdict(raw: str) -> dict:
+    return json.loads(raw.strip().replace("```json", "").replace("```", ""))
+
+
+def screen_frames(frames: list, count: int = SCREEN_FRAMES) -> list:
+    """`count` frames spread evenly over `frames`, first and last included."""
+    if len(frames) <= count:
+        return frames
+    if count == 1:
+        return [frames[len(frames) // 2]]
+    return [frames[round(i * (len(frames) - 1) / (count - 1))] for i in range(count)]
+
+
+async def call_model(content: list, deadline=None, max_tokens: int = MAX_COMPLETION_TOKENS) -> tuple[dict, int, int]:
+    """
+    Sends one moderation request; returns the parsed verdict, its total
+    tokens and the latency in milliseconds (including limiter waits). With
+    hedging on (see app.ai.hedging) a slow request may be sent twice.
+    """
+    request = chat_request(content, max_tokens)
+    # Recorded next to the billed prompt tokens, to calibrate the estimate.
+    predicted = estimate_tokens(request["messages"], 0)
+    count("predicted_tokens", predicted, "predictedPromptTokens", kind="prompt")
+    estimated = predicted + max_tokens
+
+    async def _attempt(primary: bool, timer=None):
+        # The limiter owns retries (429s, 5xx, connection errors), so the
+        # SDK's own are turned off.
+        # Only the original request's limiter waits extend the deadline.
+        response = await get_rate_limiter().call(
+            lambda: get_client().with_options(max_retries=0).chat.completions.create(**request),
+            estimated,
+            deadline if primary else None,
+            timer,
+        )
+        return response, parse_verdict(response.choices[0].message.content)
+
+    start = time.perf_counter()
+    hedger = get_hedger()
+    with span("model"):
+        if hedger is None:
+            response, verdict = await _attempt(True)
+        else:
+            response, verdict = await hedger.run(_attempt, valid=lambda answer: _valid_verdict(answer[1]))
+    latency_ms = int((time.perf_counter() - start) * 1000)
+    tokens = response.usage.total_tokens if response.usage else 0
+    if response.usage:
+        prompt, completion = response.usage.prompt_tokens, response.usage.completion_tokens
+        count("tokens", prompt, "promptTokens", kind="prompt")
+        count("tokens", completion, "completionTokens", kind="completion")
+        count("cost_usd", token_cost(prompt, completion, OPENAI_MODEL), "costUsd")
+    return verdict, tokens, latency_ms
+
+
+def _valid_verdict(verdict) -> bool:
+    # Packed answers hold several verdicts, checked per video later on.
+    if not isinstance(verdict, dict) or "results" in verdict:
+        return True
     try:
-        return await asyncio.wait_for(_run(), timeout=TIMEOUT_SECONDS)
-    except asyncio.TimeoutError:
-        return {
-            "moderationStatus": "failed",
-            "reason": "Timeout",
-            "explicitContent": None,
-            "stemContent": None,
-            "piiDetected": None,
-            "copyrightRisk": None,
-            "detectedObjects": [],
-            "detectedKeywords": [],
-            "totalTokens": 0
-        }
+        ModerationResult.model_validate(dict(verdict, totalTokens=0))
+    except ValueError:
+        return False
+    return True
+
+
+class StagePlan(NamedTuple):
+    stage: str  # "screen" or "full"
+    frames_sent: int
+    detail: str
+    content: list
+    images: int
+
+
+def stage_plans(frames: list, frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE,
+                detail: str = IMAGE_DETAIL, sheets: list = None) -> Iterator[StagePlan]:
+    """
+    The requests `moderate_plans` may send for `frames`, built as they are
+    consumed: in progressive mode a few frames at SCREEN_DETAIL, then the
+    full set at `detail` (as `sheets` in mosaic mode).
+    """
+    stages = []
+    if moderation_mode == "progressive":
+        screen = screen_frames(frames)
+        if len(screen) < len(frames) or SCREEN_DETAIL != detail or frame_mode != "frames":
+            stages.append(("screen", screen, "frames", SCREEN_DETAIL))
+    stages.append(("full", frames, frame_mode, detail))
+
+    for stage, stage_frames, stage_mode, detail in stages:
+        content, images = build_content(stage_frames, stage_mode, detail, sheets if stage == "full" else None)
+        if stage == "screen":
+            content.insert(1, {"type": "text", "text": SCREEN_NOTE})
+        yield StagePlan(stage, len(stage_frames), detail, content, images)
+
+
+async def moderate_plans(plans: Iterable[StagePlan], deadline=None, record_stages: bool = False) -> dict:
+    """
+    Sends the planned requests in order until one answers with a clear
+    approved/rejected (or none are left). `imagesSent` and `totalTokens`
+    cover every request made; `record_stages` lists them in `stages`.
+    """
+    records, images_sent = [], 0
+    for plan in plans:
+        data, tokens, latency_ms = await call_model(plan.content, deadline)
+        images_sent += plan.images
+        records.append({
+            "stage": plan.stage, "framesSent": plan.frames_sent, "detail": plan.detail,
+            "moderationStatus": data.get("moderationStatus"), "totalTokens": tokens, "latencyMs": latency_ms,
+        })
+        if data.get("moderationStatus") in CONFIDENT_STATUSES:
+            break
+
+    data["totalTokens"] = sum(r["totalTokens"] for r in records)
+    data["framesSent"] = records[-1]["framesSent"]
+    data["imagesSent"] = images_sent
+    if record_stages:
+        data["stages"] = records
+    return data
+
+
+async def moderate_frames(frames: list, frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE,
+                          deadline=None, detail: str = IMAGE_DETAIL) -> dict:
+    """
+    Asks the model for a verdict on `frames`. In progressive mode a few
+    frames at SCREEN_DETAIL go first, and the full set is only sent when the
+    screening answer is not a clear approved/rejected. Every request made is
+    recorded in `stages`; `imagesSent` and `totalTokens` cover all of them.
+    Contact sheets are built by ffmpeg subprocesses, without blocking the loop.
+    """
+    sheets = None
+    if frame_mode == "mosaic":
+        with span("encode"):
+            sheets = await build_sheets_async(frames, MOSAIC_TILES, MOSAIC_MAX_SIDE)
+    plans = stage_plans(frames, frame_mode, moderation_mode, detail, sheets)
+    return await moderate_plans(plans, deadline, record_stages=moderation_mode == "progressive")
+
+
+def cached_result(cached: dict) -> dict:
+    """
+    Resolves a video from its result cache entry: the stored verdict, marked
+    `cached`, with no tokens or images spent on it this time.
+    """
+    return ModerationResult.model_validate(dict(cached, totalTokens=0, imagesSent=0, cached=True)).model_dump()
+
+
+def near_duplicate_result(match, action: str = NEAR_DUP_ACTION) -> dict:
+    """
+    Resolves a video from a near-duplicate match without calling the model:
+    either reusing the matched verdict or sending it to manual review.
+    """
+    result = dict(match.verdict, totalTokens=0, imagesSent=0, nearDuplicateOf=match.video_id)
+    if action == "flag":
+        result["moderationStatus"] = "needsManualReview"
+        result["reason"] = (
+            f"nearDuplicate: matches previously moderated video {match.video_id} "
+            f"({match.score:.0%} of sampled frames), which was {match.verdict['moderationStatus']}"
+        )
+    return ModerationResult.model_validate(result).model_dump()
+
+
+async def moderate_video(video_path: str, frame_mode: str = FRAME_MODE, cache_key: str = None,
+                         video_id: str = None, moderation_mode: str = MODERATION_MODE) -> dict:
+    """
+    Moderates one video. Results are looked up in and stored to the result
+    cache; callers that already looked the video up pass its `cache_key` so
+    it is stored without hashing the video again. Videos that look like a
+    re-encode or trim of one already moderated are resolved from the
+    near-duplicate index; `video_id` names this one there. Unless PRESCREEN
+    is off, junk videos are settled locally, from their metadata and then
+    their sampled frames (see app.video.prescreen).
+    With a VIDEO_TOKEN_BUDGET, frames are sent as `plan_frames` decides.
+
+    Probing, frame decoding (and hashing) and the model requests each have
+    their own deadline (PROBE_TIMEOUT_SECONDS, DECODE_TIMEOUT_SECONDS,
+    TIMEOUT_SECONDS); missing one returns the timeout result, killing ffmpeg
+    if it is running. Every ffmpeg runs under the FFMPEG_CONCURRENCY cap.
+    """
+    cache = get_cache()
+    if cache is not None and cache_key is None:
+        cache_key = await asyncio.to_thread(video_cache_key, video_path, frame_mode, moderation_mode)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached_result(cached)
+
+    try:
+        info = None
+        if PRESCREEN == "on":
+            screen = await prescreen(video_path)
+            if screen.verdict is not None:
+                return screen.verdict
+            info = screen.info
+        plan = None
+        if VIDEO_TOKEN_BUDGET > 0 and frame_mode == "frames":
+            info = info or await probe_async(video_path)
+            plan = plan_from_probe(info, VIDEO_TOKEN_BUDGET, moderation_mode)
+        sampled = await _sample(video_path, plan, info)
+        if PRESCREEN == "on":
+            verdict = await prescreen_frames(sampled)
+            if verdict is not None:
+                return verdict
+        index = get_near_dup_index()
+        hashes = None
+        if index is not None or (DEDUP_MAX_DISTANCE >= 0 and len(sampled) > 1):
+            with span("hash"):
+                hashes = await frame_hashes_async([f.data for f in sampled])
+    except TimeoutError:
+        return dict(TIMEOUT_RESULT)
+
+    fingerprint = settings_fingerprint(frame_mode, moderation_mode)
+    if index is not None:
+        match = index.query(hashes, fingerprint=fingerprint)
+        if match is not None:
+            return near_duplicate_result(match)
+
+    frames, tokens_saved = select_frames(sampled, hashes)
+    try:
+        # Time queued in the rate limiter extends the deadline.
+        async with asyncio.timeout(TIMEOUT_SECONDS) as deadline:
+            data = await moderate_frames(frames, frame_mode, moderation_mode, deadline,
+                                         plan.detail if plan else IMAGE_DETAIL)
+    except TimeoutError:
+        return dict(TIMEOUT_RESULT)
+    data["framesSampled"] = len(sampled)
+    data["tokensSavedByDedup"] = tokens_saved
+
+    validated = ModerationResult.model_validate(data).model_dump()
+    if cache is not None:
+        cache.put(cache_key, validated)
+    if index is not None:
+        index.add(video_id or video_path, hashes, validated, fingerprint)
+    return validated
+
+
+async def _sample(video_path: str, plan: Optional[FramePlan], info: Optional[dict]) -> list:
+    if plan is None:
+        return await sample_frames_async(video_path, info=info)
+    return await sample_frames_async(video_path, plan.frames, max_side=plan.max_side, info=info)
+
+
+class PreparedVideo(NamedTuple):
+    frames_sampled: int
+    hashes: Optional[list]
+    tokens_saved: int
+    plans: List[StagePlan]
+    verdict: Optional[dict] = None  # set when `prescreen_frames` settled the video
+
+
+def plan_video(frames: list, frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE,
+               detail: str = IMAGE_DETAIL, sheets: list = None) -> List[StagePlan]:
+    """
+    The CPU half of `moderate_video` for selected frames (and, in mosaic
+    mode, their `sheets`): encodes every request that may be sent. Takes and
+    returns plain data, so it can run in a worker process.
+    """
+    return list(stage_plans(frames, frame_mode, moderation_mode, detail, sheets))
+
+
+async def prepare_video_async(video_path: str, frame_mode: str = FRAME_MODE, moderation_mode: str = MODERATION_MODE,
+                              need_hashes: bool = False, pool=None, info: dict = None,
+                              plan: FramePlan = None, screen: bool = False) -> PreparedVideo:
+    """
+    Samples, hashes and deduplicates the video's frames and builds any
+    contact sheets, every ffmpeg run on the event loop under the
+    FFMPEG_CONCURRENCY cap and its deadline (TimeoutError past it), then
+    runs `plan_video` on `pool`, or a thread when it is None. `info` is the
+    video's ffprobe output, if it has been probed already; a `plan` (see
+    `plan_frames`) sets the frame count, size and detail. With `screen`, a
+    video `prescreen_frames` settles comes back with its `verdict` and no
+    plans.
+    """
+    sampled = await _sample(video_path, plan, info)
+    if screen:
+        verdict = await prescreen_frames(sampled)
+        if verdict is not None:
+            return PreparedVideo(len(sampled), None, 0, [], verdict)
+    hashes = None
+    if need_hashes or (DEDUP_MAX_DISTANCE >= 0 and len(sampled) > 1):
+        with span("hash"):
+            hashes = await frame_hashes_async([f.data for f in sampled])
+    frames, tokens_saved = select_frames(sampled, hashes)
+    sheets = None
+    if frame_mode == "mosaic":
+        with span("encode"):
+            sheets = await build_sheets_async(frames, MOSAIC_TILES, MOSAIC_MAX_SIDE)
+    args = (frames, frame_mode, moderation_mode, plan.detail if plan else IMAGE_DETAIL, sheets)
+    if pool is None:
+        plans = await asyncio.to_thread(plan_video, *args)
+    else:
+        plans, stats, snapshot = await asyncio.get_running_loop().run_in_executor(
+            pool, metrics.isolated, plan_video, *args)
+        metrics.absorb(stats, snapshot)
+    return PreparedVideo(len(sampled), hashes, tokens_saved, plans)
+
+
+async def moderate_prepared(prepared: PreparedVideo, moderation_mode: str = MODERATION_MODE,
+                            cache_key: str = None, video_id: str = None) -> dict:
+    """
+    The network half of `moderate_video` for a `prepare_video_async` result:
+    near-duplicate lookup, the model requests and the cache/index updates.
+    `prepared.hashes` must be set when the near-duplicate index is enabled.
+    """
+    index = get_near_dup_index()
+    # Prepared with the configured FRAME_MODE (see `prepare_video_async`).
+    fingerprint = settings_fingerprint(FRAME_MODE, moderation_mode)
+    if index is not None:
+        match = index.query(prepared.hashes, fingerprint=fingerprint)
+        if match is not None:
+            return near_duplicate_result(match)
+
+    try:
+        async with asyncio.timeout(TIMEOUT_SECONDS) as deadline:
+            data = await moderate_plans(prepared.plans, deadline, record_stages=moderation_mode == "progressive")
+    except TimeoutError:
+        return dict(TIMEOUT_RESULT)
+    data["framesSampled"] = prepared.frames_sampled
+    data["tokensSavedByDedup"] = prepared.tokens_saved
+
+    validated = ModerationResult.model_validate(data).model_dump()
+    cache = get_cache()
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, validated)
+    if index is not None:
+        index.add(video_id, prepared.hashes, validated, fingerprint)
+    return validated
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Iterator, Optional
+from google.api_core.exceptions import DeadlineExceeded
+from app.config import SCAN_PAGE_SIZE
+
+
+class ScanCheckpoint:
+    """
+    Remembers the id of the last document handed out by a scan in a small
+    JSON file, so an interrupted run resumes after it instead of starting over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[str]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("lastDocumentId")
+        except FileNotFoundError:
+            return None
+
+    def save(self, doc_id: str):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"lastDocumentId": doc_id, "updatedAt": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _page_query(query, page_size: int, last_id: Optional[str]):
+    page = query.limit(page_size)
+    if last_id is not None:
+        page = page.start_after({"__name__": last_id})
+    return page
+
+
+def _fetch_page(page_query, max_retries: int, retry_delay_seconds: float) -> list:
+    for attempt in range(max_retries):
+        try:
+            return list(page_query.get())
+        except DeadlineExceeded as e:
+            # Only this page is retried; pages already handed out stay done.
+            print(f"🚨 A DeadlineExceeded error occurred while fetching a page: {e}")
+            if attempt == max_retries - 1:
+                raise
+            print(f"⏳ Retrying in {retry_delay_seconds} seconds...")
+            time.sleep(retry_delay_seconds)
+
+
+def iter_documents(query, page_size: int = SCAN_PAGE_SIZE, checkpoint: ScanCheckpoint = None,
+                   max_retries: int = 3, retry_delay_seconds: float = 5) -> Iterator:
+    """
+    Yields the documents matching `query` page by page, ordered by document
+    id and paginated with `start_after`, so memory stays at one page.
+
+    With a `checkpoint`, the cursor is saved once every document of a page has
+    been handed out (i.e. when the next page is requested) and removed when
+    the scan completes. Documents still in flight when a run dies keep their
+    status and are picked up by the next full scan.
+    """
+    query = query.order_by("__name__")
+    last_id = checkpoint.load() if checkpoint else None
+    if last_id is not None:
+        print(f"↪️ Resuming scan after document {last_id}")
+
+    while True:
+        page = _fetch_page(_page_query(query, page_size, last_id), max_retries, retry_delay_seconds)
+        yield from page
+        if len(page) < page_size:
+            break
+        last_id = page[-1].id
+        if checkpoint:
+            checkpoint.save(last_id)
+
+    if checkpoint:
+        checkpoint.clear()
+
+
+async def aiter_documents(query, page_size: int = SCAN_PAGE_SIZE, checkpoint: ScanCheckpoint = None,
+                          max_retries: int = 3, retry_delay_seconds: float = 5) -> AsyncIterator:
+    """
+    Async version of `iter_documents`: pages are fetched on a worker thread so
+    the event loop keeps processing videos while the next page loads.
+    """
+    pages = iter_documents(query, page_size, checkpoint, max_retries, retry_delay_seconds)
+    sentinel = object()
+    while True:
+        doc = await asyncio.to_thread(next, pages, sentinel)
+        if doc is sentinel:
+            return
+        yield doc
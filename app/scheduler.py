@@ -0,0 +1,187 @@
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, NamedTuple, Union
+
+_DONE = object()
+
+
+async def run_sliding_window(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+) -> AsyncIterator[Any]:
+    """
+    Runs `worker(item)` for every item on the current event loop with at most
+    `concurrency` coroutines in flight, and yields each result as soon as it
+    finishes. A new item is started the moment any slot frees up, so one slow
+    video never holds the other slots idle. `items` may be an async iterable
+    (e.g. a paginated scan), which is only pulled when a slot is free.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    if hasattr(items, "__aiter__"):
+        iterator = aiter(items)
+    else:
+        iterator = iter(items)
+    pending = set()
+
+    async def _next():
+        if hasattr(iterator, "__anext__"):
+            return await anext(iterator, _DONE)
+        return next(iterator, _DONE)
+
+    async def _fill():
+        while len(pending) < concurrency:
+            item = await _next()
+            if item is _DONE:
+                return
+            pending.add(asyncio.ensure_future(worker(item)))
+
+    try:
+        await _fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            await _fill()
+            for task in done:
+                yield task.result()
+    finally:
+        # Only reached with work still pending if the consumer stopped early
+        # or a worker raised; don't leave orphaned tasks on the loop.
+        for task in pending:
+            task.cancel()
+
+
+async def batched(items: Union[Iterable[Any], AsyncIterable[Any]], size: int,
+                  max_wait: float = None) -> AsyncIterator[list]:
+    """
+    Groups `items` (sync or async) into lists of at most `size`. With
+    `max_wait`, a partial batch from an async source is yielded once its
+    first item has waited that many seconds, so a slow feed (e.g. a daemon's
+    listener) never holds a document back until the batch fills.
+    """
+    batch = []
+    if hasattr(items, "__aiter__") and max_wait is not None:
+        loop = asyncio.get_running_loop()
+        iterator = aiter(items)
+        pending = deadline = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(iterator, _DONE))
+                timeout = max(0.0, deadline - loop.time()) if batch else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    # The next item is still on its way; it starts the next batch.
+                    yield batch
+                    batch = []
+                    continue
+                item, pending = pending.result(), None
+                if item is _DONE:
+                    break
+                if not batch:
+                    deadline = loop.time() + max_wait
+                batch.append(item)
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+        finally:
+            if pending is not None:
+                pending.cancel()
+    elif hasattr(items, "__aiter__"):
+        async for item in items:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    else:
+        for item in items:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class Stage(NamedTuple):
+    name: str
+    worker: Callable[[Any], Awaitable[Any]]
+    concurrency: int
+
+
+class Finished(NamedTuple):
+    """Returned by a stage worker to skip the remaining stages."""
+    result: Any
+
+
+class _Failed(NamedTuple):
+    error: BaseException
+
+
+async def run_stages(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    stages: List[Stage],
+    queue_size: int,
+) -> AsyncIterator[Any]:
+    """
+    Pushes every item through `stages` in order. Each stage runs
+    `concurrency` workers pulling from a queue of at most `queue_size` items,
+    so a slow stage fills its queue and holds the earlier ones (and the pull
+    from `items`) back instead of buffering without bound. Yields what the
+    last stage returns, or a `Finished` result as soon as any stage returns
+    one, in completion order. A worker error stops everything and is raised.
+    """
+    if queue_size < 1 or any(stage.concurrency < 1 for stage in stages):
+        raise ValueError("queue_size and every stage's concurrency must be at least 1")
+
+    queues = [asyncio.Queue(queue_size) for _ in stages]
+    results = asyncio.Queue(queue_size)
+
+    async def _feed():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await queues[0].put(item)
+        else:
+            for item in items:
+                await queues[0].put(item)
+        await queues[0].put(_DONE)
+
+    async def _work(i, stage):
+        while True:
+            item = await queues[i].get()
+            if item is _DONE:
+                # Leave it for this stage's other workers.
+                queues[i].put_nowait(item)
+                return
+            item = await stage.worker(item)
+            if isinstance(item, Finished):
+                await results.put(item.result)
+            elif i + 1 < len(stages):
+                await queues[i + 1].put(item)
+            else:
+                await results.put(item)
+
+    async def _run_stage(i, stage):
+        await asyncio.gather(*(_work(i, stage) for _ in range(stage.concurrency)))
+        await (queues[i + 1] if i + 1 < len(stages) else results).put(_DONE)
+
+    async def _guard(coro):
+        try:
+            await coro
+        except Exception as e:
+            await results.put(_Failed(e))
+
+    tasks = [asyncio.ensure_future(_guard(_feed()))]
+    tasks += [asyncio.ensure_future(_guard(_run_stage(i, stage))) for i, stage in enumerate(stages)]
+    try:
+        while True:
+            result = await results.get()
+            if result is _DONE:
+                return
+            if isinstance(result, _Failed):
+                raise result.error
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
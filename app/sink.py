@@ -0,0 +1,111 @@
+import time
+import random
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+from google.api_core.exceptions import Aborted, DeadlineExceeded, InternalServerError, ServiceUnavailable, TooManyRequests
+from app.metrics import registry
+from app.config import WRITE_BATCH_SIZE, WRITE_FLUSH_SECONDS, WRITE_MAX_RETRIES
+
+# Contention and transient backend errors; anything else (e.g. NotFound) is
+# permanent for that document.
+RETRYABLE_ERRORS = (Aborted, DeadlineExceeded, InternalServerError, ServiceUnavailable, TooManyRequests)
+
+
+class ResultSink:
+    """
+    Write-behind buffer for moderation results. `add` only queues the update;
+    buffered updates are committed in WriteBatches of up to `max_batch`
+    documents when the buffer fills or every `flush_interval` seconds, on a
+    worker thread so the event loop never waits on Firestore.
+
+    A batch that fails to commit is retried document by document with
+    jittered exponential backoff, so one contended document cannot sink the
+    rest. Use as `async with`: leaving the block flushes everything left.
+    `on_commit`, if given, is called (on the worker thread) with the ids of
+    every group of documents once their writes are committed.
+    """
+
+    def __init__(self, db, collection: str = "UserVideos", max_batch: int = WRITE_BATCH_SIZE,
+                 flush_interval: float = WRITE_FLUSH_SECONDS, max_retries: int = WRITE_MAX_RETRIES,
+                 retry_delay_seconds: float = 0.5, on_commit: Optional[Callable[[List[str]], None]] = None):
+        self.db = db
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay_seconds = retry_delay_seconds
+        self.on_commit = on_commit
+        self.written = 0
+        self.batches = 0
+        self.failed: Dict[str, str] = {}
+        self._buffer: List[Tuple[str, dict]] = []
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    async def __aenter__(self):
+        self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def add(self, doc_id: str, data: dict):
+        self._buffer.append((doc_id, data))
+        if len(self._buffer) >= self.max_batch:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            items, self._buffer = self._buffer, []
+            if items:
+                await asyncio.to_thread(self._commit, items)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def _commit(self, items: List[Tuple[str, dict]]):
+        collection = self.db.collection(self.collection)
+        for start in range(0, len(items), self.max_batch):
+            chunk = items[start:start + self.max_batch]
+            batch = self.db.batch()
+            for doc_id, data in chunk:
+                batch.update(collection.document(doc_id), data)
+            try:
+                # Timed globally only: the commit holds many videos' writes.
+                t0 = time.perf_counter()
+                batch.commit()
+                registry.observe("firestore_commit", time.perf_counter() - t0)
+                self.written += len(chunk)
+                self.batches += 1
+            except Exception as e:
+                print(f"⚠️ Batch of {len(chunk)} writes failed ({e}); retrying per document")
+                for doc_id, data in chunk:
+                    self._write_one(collection, doc_id, data)
+            else:
+                if self.on_commit is not None:
+                    self.on_commit([doc_id for doc_id, _ in chunk])
+
+    def _write_one(self, collection, doc_id: str, data: dict):
+        for attempt in range(self.max_retries):
+            try:
+                collection.document(doc_id).update(data)
+            except RETRYABLE_ERRORS as e:
+                error = e
+                time.sleep(self.retry_delay_seconds * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            except Exception as e:
+                error = e
+                break
+            self.written += 1
+            if self.on_commit is not None:
+                self.on_commit([doc_id])
+            return
+        self.failed[doc_id] = str(error)
@@ -0,0 +1,86 @@
+import asyncio
+import ffmpeg
+from typing import List
+from app.config import DEDUP_MAX_DISTANCE, DECODE_TIMEOUT_SECONDS
+from app.video.extractor import Frame, run_ffmpeg
+
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+
+def _hash_pipe():
+    return (
+        ffmpeg
+        .input("pipe:", format="image2pipe", vcodec="mjpeg")
+        .filter("scale", HASH_WIDTH, HASH_HEIGHT, flags="area")
+        .output("pipe:", format="rawvideo", pix_fmt="gray")
+        .global_args("-loglevel", "error")
+    )
+
+
+def frame_hashes(frames: List[bytes]) -> List[int]:
+    """
+    Computes a 64-bit difference hash (dHash) for each JPEG frame. All frames
+    go through one ffmpeg process that shrinks them to 9x8 grayscale; each
+    bit records whether a pixel is brighter than its right-hand neighbour.
+    """
+    if not frames:
+        return []
+    try:
+        out, _ = _hash_pipe().run(input=b"".join(frames), capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"FFmpeg failed: {e.stderr.decode(errors='replace')}")
+    return _hashes(out, len(frames))
+
+
+async def frame_hashes_async(frames: List[bytes], timeout: float = DECODE_TIMEOUT_SECONDS) -> List[int]:
+    """
+    `frame_hashes` on the event loop, under the ffmpeg cap (see
+    `run_ffmpeg`); ffmpeg is killed and TimeoutError raised after `timeout`.
+    """
+    if not frames:
+        return []
+    try:
+        async with asyncio.timeout(timeout):
+            out = await run_ffmpeg(_hash_pipe().compile(), input=b"".join(frames))
+    except TimeoutError:
+        raise TimeoutError(f"Hashing frames took over {timeout:g}s") from None
+    return _hashes(out, len(frames))
+
+
+def _hashes(out: bytes, count: int) -> List[int]:
+    size = HASH_WIDTH * HASH_HEIGHT
+    if len(out) != size * count:
+        raise RuntimeError(f"FFmpeg returned {len(out) // size} hash images for {count} frames")
+
+    hashes = []
+    for offset in range(0, len(out), size):
+        pixels = out[offset:offset + size]
+        value = 0
+        for row in range(HASH_HEIGHT):
+            start = row * HASH_WIDTH
+            for col in range(HASH_WIDTH - 1):
+                value = (value << 1) | (pixels[start + col] > pixels[start + col + 1])
+        hashes.append(value)
+    return hashes
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def dedup_frames(frames: List[Frame], hashes: List[int], max_distance: int = DEDUP_MAX_DISTANCE) -> List[Frame]:
+    """
+    Drops frames within `max_distance` bits of a frame already kept, so a
+    static slide or whiteboard shot is sent once with its first timestamp.
+    A negative `max_distance` disables deduplication.
+    """
+    if max_distance < 0:
+        return list(frames)
+
+    kept, kept_hashes = [], []
+    for frame, value in zip(frames, hashes):
+        if all(hamming(value, other) > max_distance for other in kept_hashes):
+            kept.append(frame)
+            kept_hashes.append(value)
+    return kept
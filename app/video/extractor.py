@@ -1,16 +1,32 @@
 import os
+import re
+import json
+import math
+import random
 import shutil
+import asyncio
+import weakref
+import contextlib
+import subprocess
 import ffmpeg
-from typing import List
-from app.config import FRAME_INTERVAL, MAX_FRAMES
+from itertools import islice
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+from app.metrics import span, count
+from app.config import (
+    FRAME_INTERVAL, MAX_FRAMES, SAMPLING_MODE, SEEK_MODE, FRAME_MAX_SIDE,
+    FFMPEG_CONCURRENCY, PROBE_TIMEOUT_SECONDS, DECODE_TIMEOUT_SECONDS,
+)
 
 
-def extract_frames(video_path: str, output_dir: str, frame_rate: float) -> list[str]:
-    """
-    Extracts frames from a video file using ffmpeg-python.
-    """
-    #print(f"⏳ Starting frame extraction for {os.path.basename(video_path)}...")
-    
+JPEG_EOI = b"\xff\xd9"
+
+
+class Frame(NamedTuple):
+    timestamp: float  # seconds from the start of the video
+    data: bytes       # JPEG-encoded image
+
+
+def require_ffmpeg():
     # Ensure ffmpeg binary is available on PATH before attempting extraction.
     if shutil.which("ffmpeg") is None:
         raise RuntimeError(
@@ -18,15 +34,41 @@ def extract_frames(video_path: str, output_dir: str, frame_rate: float) -> list[
             "On Windows you can install via Chocolatey (`choco install ffmpeg`) or download a static build from https://ffmpeg.org/download.html."
         )
 
+
+def is_remote(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def input_stream(source: str, **kwargs):
+    """
+    Opens `source` as an ffmpeg input. Remote URLs are read by ffmpeg's own
+    HTTP client, which streams the body and issues Range requests when it
+    needs to seek (e.g. to reach a trailing moov atom), so the file is never
+    written to disk.
+    """
+    if is_remote(source):
+        kwargs.setdefault("reconnect", 1)
+        kwargs.setdefault("reconnect_on_network_error", 1)
+        kwargs.setdefault("reconnect_delay_max", 5)
+    return ffmpeg.input(source, **kwargs)
+
+
+def extract_frames(video_path: str, output_dir: str, frame_rate: float = FRAME_INTERVAL) -> list[str]:
+    """
+    Extracts frames from a video file or http(s) URL using ffmpeg-python.
+    """
+    #print(f"⏳ Starting frame extraction for {os.path.basename(video_path)}...")
+    require_ffmpeg()
+
     output_pattern = os.path.join(output_dir, "frame-%04d.jpg")
     
     try:
-        (
-            ffmpeg
-            .input(video_path)
-            .output(output_pattern, r=frame_rate)
-            .run(capture_stdout=True, capture_stderr=True, quiet=True)
-        )
+        with span("extract"):
+            (
+                input_stream(video_path)
+                .output(output_pattern, r=frame_rate)
+                .run(capture_stdout=True, capture_stderr=True, quiet=True)
+            )
         #print(f"✅ Frame extraction finished for {os.path.basename(video_path)}.")
         files = sorted([os.path.join(output_dir, f) for f in os.listdir(output_dir)])
         return files
@@ -36,3 +78,326 @@ def extract_frames(video_path: str, output_dir: str, frame_rate: float) -> list[
         raise RuntimeError(f"FFmpeg failed: {e.stderr.decode()}")
 
 
+class _JpegSplitter:
+    """Cuts a concatenated MJPEG stream into images as chunks arrive."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        # Entropy-coded JPEG data escapes 0xFF, so FFD9 only ever marks the
+        # end of an image.
+        images = []
+        search_from = max(len(self.buffer) - 1, 0)
+        self.buffer += chunk
+        while True:
+            end = self.buffer.find(JPEG_EOI, search_from)
+            if end < 0:
+                return images
+            images.append(bytes(self.buffer[:end + 2]))
+            del self.buffer[:end + 2]
+            search_from = 0
+
+
+def _frame_pipe(video_path: str, frame_rate: float):
+    return (
+        input_stream(video_path)
+        .output("pipe:", format="image2pipe", vcodec="mjpeg", r=frame_rate)
+        .global_args("-loglevel", "error")
+    )
+
+
+def iter_frame_bytes(video_path: str, frame_rate: float = FRAME_INTERVAL) -> Iterator[bytes]:
+    """
+    Yields JPEG-encoded frames read straight from ffmpeg's stdout
+    (image2pipe/MJPEG) as they are decoded, without touching the filesystem.
+    """
+    require_ffmpeg()
+
+    process = _frame_pipe(video_path, frame_rate).run_async(pipe_stdout=True, pipe_stderr=True)
+    splitter = _JpegSplitter()
+    try:
+        while True:
+            chunk = process.stdout.read(64 * 1024)
+            if not chunk:
+                break
+            yield from splitter.feed(chunk)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='replace')}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def extract_frame_bytes(video_path: str, frame_rate: float = FRAME_INTERVAL) -> List[bytes]:
+    """
+    Returns every sampled frame of `video_path` as in-memory JPEG bytes.
+    """
+    return list(iter_frame_bytes(video_path, frame_rate))
+
+
+def probe_duration(video_path: str) -> Optional[float]:
+    """
+    Returns the duration of `video_path` in seconds using ffprobe, or None if
+    the container does not report one.
+    """
+    try:
+        info = ffmpeg.probe(video_path)
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"FFprobe failed: {e.stderr.decode(errors='replace')}")
+    return duration_from_probe(info)
+
+
+def duration_from_probe(info: dict) -> Optional[float]:
+    candidates = [info.get("format", {}).get("duration")]
+    candidates += [s.get("duration") for s in info.get("streams", []) if s.get("codec_type") == "video"]
+    for value in candidates:
+        try:
+            duration = float(value)
+        except (TypeError, ValueError):
+            continue
+        if duration > 0:
+            return duration
+    return None
+
+
+def sample_timestamps(duration: float, max_frames: int = MAX_FRAMES, frame_rate: float = FRAME_INTERVAL,
+                      mode: str = SAMPLING_MODE, seed: Optional[int] = None) -> List[float]:
+    """
+    Picks up to `max_frames` timestamps covering the whole video: one per
+    `1 / frame_rate` seconds, spread wider once the cap is reached. "even"
+    takes the midpoint of each equal slice, "stratified" a random point in it.
+    """
+    count = min(max_frames, max(1, math.ceil(duration * frame_rate)))
+    step = duration / count
+    if mode == "stratified":
+        rng = random.Random(seed)
+        return [(i + rng.random()) * step for i in range(count)]
+    return [(i + 0.5) * step for i in range(count)]
+
+
+def _scale(stream, max_side: int):
+    return stream.filter(
+        "scale",
+        w=f"min(iw,{max_side})",
+        h=f"min(ih,{max_side})",
+        force_original_aspect_ratio="decrease",
+    )
+
+
+def _frame_at(video_path: str, timestamp: float, seek_mode: str, max_side: int):
+    if seek_mode != "keyframe":
+        stream = input_stream(video_path, ss=f"{timestamp:.3f}").video
+        global_args = ("-loglevel", "error")
+    else:
+        stream = input_stream(video_path, ss=f"{timestamp:.3f}", skip_frame="nokey", noaccurate_seek=None).video
+        # showinfo logs the keyframe's pts; -copyts keeps it on the video's
+        # timeline instead of relative to the seek point.
+        stream = stream.filter("showinfo")
+        global_args = ("-copyts", "-start_at_zero", "-hide_banner", "-loglevel", "info")
+    return (
+        _scale(stream, max_side)
+        .output("pipe:", format="image2pipe", vcodec="mjpeg", vframes=1, **{"q:v": 3})
+        .global_args(*global_args)
+    )
+
+
+def _decoded(out: bytes, err: bytes, timestamp: float) -> Optional[Frame]:
+    # The decoded frame's own pts when showinfo logged it (keyframe seeks),
+    # else the requested timestamp, which an accurate seek lands on.
+    if not out:
+        return None
+    shown = re.search(rb"Parsed_showinfo.*?pts_time:\s*(-?[\d.]+)", err)
+    return Frame(max(0.0, float(shown.group(1))) if shown else timestamp, out)
+
+
+def extract_frame_at(video_path: str, timestamp: float, seek_mode: str = SEEK_MODE,
+                     max_side: int = FRAME_MAX_SIDE) -> Optional[Frame]:
+    """
+    Decodes a single frame at `timestamp` by seeking the input, so only the
+    GOP around it is read (for URLs, via a Range request). With
+    seek_mode="keyframe" only keyframes are decoded and the nearest one at or
+    before `timestamp` is returned, trading accuracy for speed; the frame
+    then carries that keyframe's own timestamp.
+    """
+    try:
+        out, err = _frame_at(video_path, timestamp, seek_mode, max_side).run(capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"FFmpeg failed: {e.stderr.decode(errors='replace')}")
+    return _decoded(out, err, timestamp)
+
+
+def sample_frames(video_path: str, max_frames: int = MAX_FRAMES, frame_rate: float = FRAME_INTERVAL,
+                  mode: str = SAMPLING_MODE, seek_mode: str = SEEK_MODE,
+                  max_side: int = FRAME_MAX_SIDE) -> List[Frame]:
+    """
+    Samples at most `max_frames` frames spread across the video, with their
+    timestamps. Cost grows with the number of frames rather than the length
+    of the video: each frame is a separate seek + single-frame decode.
+    """
+    require_ffmpeg()
+    with span("extract"):
+        duration = probe_duration(video_path)
+
+        if duration is None:
+            # No duration to plan around (e.g. a live-style stream): fall back to
+            # fixed-rate decoding, stopping as soon as the cap is reached.
+            frames = islice(iter_frame_bytes(video_path, frame_rate), max_frames)
+            frames = [Frame(i / frame_rate, data) for i, data in enumerate(frames)]
+        else:
+            frames = []
+            for timestamp in sample_timestamps(duration, max_frames, frame_rate, mode):
+                frame = extract_frame_at(video_path, timestamp, seek_mode, max_side)
+                if frame is not None:
+                    frames.append(frame)
+    count("frames", len(frames), "framesExtracted", kind="extracted")
+    return frames
+
+
+# --- asyncio variants ---
+# ffmpeg runs as an asyncio subprocess, so the event loop keeps serving
+# other videos while it decodes, and a cancelled or timed-out video kills
+# its ffmpeg instead of leaving it running.
+
+_slots = weakref.WeakKeyDictionary()
+
+
+def _ffmpeg_slots() -> asyncio.Semaphore:
+    # One cap per event loop; tests and scripts may run several in turn.
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+    return _slots[loop]
+
+
+@contextlib.asynccontextmanager
+async def _spawn(args: List[str], stdin: int = subprocess.DEVNULL):
+    """
+    Starts `args` once fewer than FFMPEG_CONCURRENCY ffmpeg processes are
+    running; the process is killed if the block is left before it exits.
+    """
+    async with _ffmpeg_slots():
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            yield process
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+async def run_ffmpeg(args: List[str], tool: str = "FFmpeg", input: bytes = None) -> bytes:
+    """
+    Runs an ffmpeg/ffprobe command line under the cap, feeding it `input` on
+    stdin if given, and returns its stdout.
+    """
+    async with _spawn(args, subprocess.DEVNULL if input is None else subprocess.PIPE) as process:
+        out, err = await process.communicate(input)
+    if process.returncode != 0:
+        raise RuntimeError(f"{tool} failed: {err.decode(errors='replace')}")
+    return out
+
+
+async def probe_async(video_path: str, timeout: float = PROBE_TIMEOUT_SECONDS) -> dict:
+    """`ffmpeg.probe` without blocking the loop; ffprobe is killed after `timeout` seconds."""
+    args = ["ffprobe", "-show_format", "-show_streams", "-of", "json", video_path]
+    try:
+        async with asyncio.timeout(timeout):
+            out = await run_ffmpeg(args, "FFprobe")
+    except TimeoutError:
+        raise TimeoutError(f"FFprobe took over {timeout:g}s") from None
+    return json.loads(out)
+
+
+async def probe_duration_async(video_path: str, timeout: float = PROBE_TIMEOUT_SECONDS) -> Optional[float]:
+    """`probe_duration` without blocking the loop."""
+    return duration_from_probe(await probe_async(video_path, timeout))
+
+
+async def extract_frame_at_async(video_path: str, timestamp: float, seek_mode: str = SEEK_MODE,
+                                 max_side: int = FRAME_MAX_SIDE) -> Optional[Frame]:
+    """`extract_frame_at` without blocking the loop."""
+    async with _spawn(_frame_at(video_path, timestamp, seek_mode, max_side).compile()) as process:
+        out, err = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed: {err.decode(errors='replace')}")
+    return _decoded(out, err, timestamp)
+
+
+async def aiter_frame_bytes(video_path: str, frame_rate: float = FRAME_INTERVAL) -> AsyncIterator[bytes]:
+    """
+    `iter_frame_bytes` without blocking the loop: frames are yielded as
+    ffmpeg writes them. Closing the iterator early kills ffmpeg.
+    """
+    require_ffmpeg()
+    async with _spawn(_frame_pipe(video_path, frame_rate).compile()) as process:
+        splitter = _JpegSplitter()
+        while chunk := await process.stdout.read(64 * 1024):
+            for frame in splitter.feed(chunk):
+                yield frame
+        stderr = await process.stderr.read()
+        if await process.wait() != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='replace')}")
+
+
+async def sample_frames_async(video_path: str, max_frames: int = MAX_FRAMES, frame_rate: float = FRAME_INTERVAL,
+                              mode: str = SAMPLING_MODE, seek_mode: str = SEEK_MODE, max_side: int = FRAME_MAX_SIDE,
+                              probe_timeout: float = PROBE_TIMEOUT_SECONDS,
+                              decode_timeout: float = DECODE_TIMEOUT_SECONDS, info: dict = None) -> List[Frame]:
+    """
+    `sample_frames` on the event loop. The probe and the frame decoding have
+    their own deadlines; past either, ffmpeg is killed and TimeoutError raised.
+    Pass the `probe_async` output as `info` if the video was probed already.
+    """
+    require_ffmpeg()
+    frames = []
+    with span("extract"):
+        duration = duration_from_probe(info) if info is not None else await probe_duration_async(video_path, probe_timeout)
+        try:
+            async with asyncio.timeout(decode_timeout):
+                if duration is None:
+                    async with contextlib.aclosing(aiter_frame_bytes(video_path, frame_rate)) as decoded:
+                        async for data in decoded:
+                            frames.append(Frame(len(frames) / frame_rate, data))
+                            if len(frames) >= max_frames:
+                                break
+                else:
+                    for timestamp in sample_timestamps(duration, max_frames, frame_rate, mode):
+                        frame = await extract_frame_at_async(video_path, timestamp, seek_mode, max_side)
+                        if frame is not None:
+                            frames.append(frame)
+        except TimeoutError:
+            raise TimeoutError(f"Decoding frames took over {decode_timeout:g}s") from None
+    count("frames", len(frames), "framesExtracted", kind="extracted")
+    return frames
+
+
+def jpeg_size(data: bytes) -> tuple[int, int]:
+    """
+    Reads (width, height) from a JPEG's start-of-frame header without decoding it.
+    """
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    raise ValueError("No JPEG start-of-frame header found")
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
@@ -0,0 +1,85 @@
+import math
+import asyncio
+import ffmpeg
+from typing import List, NamedTuple
+from app.config import DECODE_TIMEOUT_SECONDS
+from app.video.extractor import Frame, jpeg_size, run_ffmpeg
+
+
+class Sheet(NamedTuple):
+    data: bytes              # JPEG of the whole grid
+    timestamps: List[float]  # one per tile, row-major
+    columns: int
+    rows: int
+    width: int
+    height: int
+
+
+def grid_shape(count: int) -> tuple[int, int]:
+    columns = math.ceil(math.sqrt(count))
+    return columns, math.ceil(count / columns)
+
+
+def _layout(frames: List[Frame], max_side: int) -> tuple[int, int, int, int]:
+    """Columns, rows and tile size of the sheet for `frames`."""
+    columns, rows = grid_shape(len(frames))
+    frame_width, frame_height = jpeg_size(frames[0].data)
+    # Cells keep the source aspect ratio; even sizes keep the encoder happy.
+    scale = min(max_side / (columns * frame_width), max_side / (rows * frame_height), 1.0)
+    tile_width = max(2, int(frame_width * scale) // 2 * 2)
+    tile_height = max(2, int(frame_height * scale) // 2 * 2)
+    return columns, rows, tile_width, tile_height
+
+
+def _sheet_pipe(columns: int, rows: int, tile_width: int, tile_height: int):
+    return (
+        ffmpeg
+        .input("pipe:", format="image2pipe", vcodec="mjpeg")
+        .filter("scale", tile_width, tile_height, force_original_aspect_ratio="decrease")
+        .filter("pad", tile_width, tile_height, "(ow-iw)/2", "(oh-ih)/2")
+        .filter("tile", f"{columns}x{rows}")
+        .output("pipe:", format="image2pipe", vcodec="mjpeg", vframes=1, **{"q:v": 3})
+        .global_args("-loglevel", "error")
+    )
+
+
+def build_sheet(frames: List[Frame], max_side: int) -> Sheet:
+    """
+    Tiles `frames` into one near-square grid whose longest edge is at most
+    `max_side`. Each frame is downscaled and letterboxed into its cell, all in
+    a single ffmpeg pass over the in-memory JPEGs.
+    """
+    columns, rows, tile_width, tile_height = _layout(frames, max_side)
+    try:
+        out, _ = _sheet_pipe(columns, rows, tile_width, tile_height).run(
+            input=b"".join(f.data for f in frames), capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"FFmpeg failed: {e.stderr.decode(errors='replace')}")
+
+    return Sheet(out, [f.timestamp for f in frames], columns, rows, columns * tile_width, rows * tile_height)
+
+
+def build_sheets(frames: List[Frame], per_sheet: int, max_side: int) -> List[Sheet]:
+    return [build_sheet(frames[i:i + per_sheet], max_side) for i in range(0, len(frames), per_sheet)]
+
+
+async def build_sheet_async(frames: List[Frame], max_side: int) -> Sheet:
+    """`build_sheet` on the event loop, under the ffmpeg cap (see `run_ffmpeg`)."""
+    columns, rows, tile_width, tile_height = _layout(frames, max_side)
+    out = await run_ffmpeg(_sheet_pipe(columns, rows, tile_width, tile_height).compile(),
+                           input=b"".join(f.data for f in frames))
+    return Sheet(out, [f.timestamp for f in frames], columns, rows, columns * tile_width, rows * tile_height)
+
+
+async def build_sheets_async(frames: List[Frame], per_sheet: int, max_side: int,
+                             timeout: float = DECODE_TIMEOUT_SECONDS) -> List[Sheet]:
+    """
+    `build_sheets` on the event loop; past `timeout` for all the sheets,
+    ffmpeg is killed and TimeoutError raised.
+    """
+    try:
+        async with asyncio.timeout(timeout):
+            return [await build_sheet_async(frames[i:i + per_sheet], max_side)
+                    for i in range(0, len(frames), per_sheet)]
+    except TimeoutError:
+        raise TimeoutError(f"Building contact sheets took over {timeout:g}s") from None
@@ -0,0 +1,160 @@
+import asyncio
+import ffmpeg
+from typing import List, NamedTuple, Optional
+from app.metrics import span, count
+from app.video.extractor import Frame, probe_async, run_ffmpeg, duration_from_probe
+from app.config import (
+    PROBE_TIMEOUT_SECONDS, DECODE_TIMEOUT_SECONDS, PRESCREEN_MIN_SECONDS, PRESCREEN_COVERAGE, PRESCREEN_FROZEN,
+)
+
+# Sampled frames are scaled to this width: enough to keep sparse pen
+# strokes on a whiteboard.
+SIGNAL_WIDTH = 128
+# A frame whose edge map (edgedetect, then entropy in bits) is below this
+# has no edges at all: one flat colour, compression noise included. A single
+# short stroke scores well above it.
+BLANK_EDGE_ENTROPY = 0.001
+# Frames whose mean absolute luma difference from the previous one
+# (signalstats YDIF) is below this show the same picture.
+FROZEN_LUMA_DIFF = 0.5
+
+
+class Screen(NamedTuple):
+    verdict: Optional[dict]  # set when the video was resolved locally
+    info: Optional[dict]     # ffprobe output, to sample frames without probing again
+
+
+def screen_result(status: str, reason: str) -> dict:
+    """A verdict settled without the model, shaped like one from it."""
+    return {
+        "moderationStatus": status, "reason": reason, "explicitContent": None, "stemContent": None,
+        "piiDetected": None, "copyrightRisk": None, "detectedObjects": [], "detectedKeywords": [],
+        "totalTokens": 0, "framesSampled": 0, "prescreened": True,
+    }
+
+
+def _signal_args() -> List[str]:
+    # The sampled JPEGs arrive on stdin, one per second of output timeline.
+    # signalstats reads the picture before edgedetect replaces it with its
+    # edge map.
+    return (
+        ffmpeg.input("pipe:", format="image2pipe", vcodec="mjpeg", framerate=1).video
+        .filter("scale", SIGNAL_WIDTH, -2)
+        .filter("blackdetect", d=0, pix_th=0.1)
+        .filter("signalstats")
+        .filter("edgedetect")
+        .filter("entropy")
+        .filter("metadata", mode="print", file="-")
+        .output("-", format="null")
+        .global_args("-loglevel", "error", "-nostats")
+        .compile()
+    )
+
+
+def _frames(text: str) -> List[dict]:
+    """Per-frame metadata printed by the metadata filter, with `pts_time`."""
+    frames = []
+    for line in text.splitlines():
+        if line.startswith("frame:"):
+            fields = dict(field.split(":", 1) for field in line.split())
+            frames.append({"pts_time": float(fields["pts_time"])})
+        elif "=" in line and frames:
+            key, value = line.split("=", 1)
+            frames[-1][key] = value
+    return frames
+
+
+def _share(frames: List[dict], start_key: str, end_key: str) -> float:
+    """Share of frames inside the [start, end) intervals marked by `start_key`/`end_key`."""
+    intervals, start = [], None
+    for frame in frames:
+        if start_key in frame:
+            start = float(frame[start_key])
+        if end_key in frame and start is not None:
+            intervals.append((start, float(frame[end_key])))
+            start = None
+    if start is not None:
+        intervals.append((start, float("inf")))
+    inside = sum(any(a <= f["pts_time"] < b for a, b in intervals) for f in frames)
+    return inside / len(frames)
+
+
+def _stat(frame: dict, name: str) -> float:
+    return float(frame.get(f"lavfi.signalstats.{name}", 0))
+
+
+def _edge_entropy(frame: dict) -> float:
+    # Missing means unmeasured, never blank.
+    return float(frame.get("lavfi.entropy.entropy.normal.Y", "inf"))
+
+
+def classify(frames: List[dict], coverage: float = PRESCREEN_COVERAGE) -> Optional[str]:
+    """The reason code for frame statistics that need no model, or None."""
+    if not frames:
+        return "unprocessable_video"
+    if _share(frames, "lavfi.black_start", "lavfi.black_end") >= coverage:
+        return "black_video"
+    flat = sum(_edge_entropy(f) < BLANK_EDGE_ENTROPY for f in frames)
+    if flat / len(frames) >= coverage:
+        return "blank_video"
+    # freezedetect reads the gap between sparse samples as a freeze, so
+    # compare consecutive frames directly.
+    still = sum(_stat(f, "YDIF") < FROZEN_LUMA_DIFF for f in frames[1:])
+    if len(frames) > 1 and still / (len(frames) - 1) >= coverage:
+        return "frozen_video"
+    return None
+
+
+async def prescreen(video_path: str, min_seconds: float = PRESCREEN_MIN_SECONDS) -> Screen:
+    """
+    Resolves videos not worth sampling from ffprobe metadata alone:
+    audio-only and near-empty videos go to `needsManualReview` with the
+    matching reason. Black, blank and frozen videos are caught later from
+    the sampled frames (see `prescreen_frames`). ffprobe errors raise, so an
+    expired signed URL or a corrupt upload fails the attempt (and the job
+    journal dead-letters it, see `journal.is_poison`) instead of storing a
+    verdict.
+    """
+    with span("prescreen"):
+        info = await probe_async(video_path, PROBE_TIMEOUT_SECONDS)
+
+    streams = [s for s in info.get("streams", [])
+               if s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic")]
+    if not streams:
+        return Screen(_settled("needsManualReview", "no_video_stream"), info)
+    duration = duration_from_probe(info)
+    if duration is not None and duration < min_seconds:
+        return Screen(_settled("needsManualReview", "near_zero_duration"), info)
+    return Screen(None, info)
+
+
+async def prescreen_frames(frames: List[Frame], frozen_action: str = PRESCREEN_FROZEN,
+                        coverage: float = PRESCREEN_COVERAGE) -> Optional[dict]:
+    """
+    Settles a video from the frames already sampled for the model, so the
+    check reads nothing more from the source: one ffmpeg run over the
+    in-memory JPEGs (blackdetect, signalstats, edge entropy). Videos with no
+    decodable frame are `rejected` as `unprocessable_video`; black, blank
+    and (if `frozen_action` is "review") frozen videos go to
+    `needsManualReview` with the matching reason. Returns None when the
+    video needs the model.
+    """
+    if not frames:
+        return _settled("rejected", "unprocessable_video")
+    with span("prescreen"):
+        try:
+            async with asyncio.timeout(DECODE_TIMEOUT_SECONDS):
+                out = await run_ffmpeg(_signal_args(), input=b"".join(f.data for f in frames))
+        except TimeoutError:
+            raise TimeoutError(f"Pre-screen took over {DECODE_TIMEOUT_SECONDS:g}s") from None
+    reason = classify(_frames(out.decode(errors="replace")), coverage)
+    if reason == "frozen_video" and frozen_action != "review":
+        reason = None
+    if reason is None:
+        return None
+    return dict(_settled("needsManualReview", reason), framesSampled=len(frames))
+
+
+def _settled(status: str, reason: str) -> dict:
+    count("prescreen", 1, reason=reason)
+    return screen_result(status, reason)
@@ -2,41 +2,67 @@ import sys
 import os
 import csv
 import requests
-import concurrent.futures
 from pathlib import Path
 import asyncio  # FIX: Import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
 import time # ⭐️ Added for timestamp
 import uuid # ⭐️ Added for random string
-from itertools import islice
+import json
 # Use typing and import shared Firestore initialization from app.firestore
-from typing import Iterable, List, Any
+from typing import Iterable
 from google.api_core.exceptions import DeadlineExceeded
-from .firestore import db, SERVER_TIMESTAMP as server_timestamp, SOURCE_INFO as sourceInfo
+from .firestore import stream_failed_videos, update_video_result, result_update, result_sink, lease_manager
 
 # --- Local Imports ---
-# FIX: Use a relative import, assuming the file is in the same 'POCs' directory
-from pipeline import moderate_video
+from .pipeline import (
+    prepare_video_async, moderate_prepared, cached_result, plan_from_probe, predict_tokens, TokenBudget,
+)
+from .video.prescreen import prescreen
+from .video.extractor import probe_async
+from .scheduler import run_sliding_window, batched, run_stages, Stage, Finished
+from .packing import moderate_packed
+from .eligibility import skip_reason
+from .offline import OfflineJob, run_offline_job
+from .ai.client import get_client
+from .ai.schema import ModerationResult
+from .config import (
+    INGEST_MODE, WRITE_BATCH_SIZE, OFFLINE_JOB_DIR, PACK_MAX_VIDEOS, PACK_MAX_WAIT_SECONDS, BATCH_SIZE, FRAME_MODE, MODERATION_MODE,
+    DOWNLOAD_CONCURRENCY, EXTRACT_WORKERS, FFMPEG_CONCURRENCY, MODEL_CONCURRENCY, WRITE_CONCURRENCY, STAGE_QUEUE_SIZE, LEASE_SECONDS,
+    PRESCREEN, VIDEO_TOKEN_BUDGET, BATCH_TOKEN_BUDGET,
+)
+from .cache import get_cache, video_cache_key
+from .near_dup import get_near_dup_index
+from .journal import get_journal
+from .ai.ratelimit import get_rate_limiter
+from .ai.hedging import get_hedger
+from . import metrics
+from .config import METRICS_PATH, METRICS_PORT
 
 # Firestore client and constants are imported from app.firestore above
 
 # --- Directory Setup ---
+# Created when first written to, so importing the worker leaves no trace.
 LOCAL_VIDEO_DIR = Path("downloaded_videos")
-LOCAL_VIDEO_DIR.mkdir(exist_ok=True)
 ERROR_CSV_DIR = Path("batch_errors")
-ERROR_CSV_DIR.mkdir(exist_ok=True)
 
 
 def download_video(video_url: str, file_name: str) -> str:
     """
     Downloads video from URL and stores locally.
     """
+    LOCAL_VIDEO_DIR.mkdir(exist_ok=True)
     local_path = LOCAL_VIDEO_DIR / file_name
     try:
-        response = requests.get(video_url, stream=True, timeout=60)
-        response.raise_for_status()
-        with open(local_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        with metrics.span("download"):
+            response = requests.get(video_url, stream=True, timeout=60)
+            response.raise_for_status()
+            with open(local_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    f.write(chunk)
+        metrics.count("bytes", os.path.getsize(local_path), "downloadBytes", kind="downloaded")
         return str(local_path)
     except Exception as e:
         # Clean up partially downloaded file on failure
@@ -45,260 +71,466 @@ def download_video(video_url: str, file_name: str) -> str:
         raise RuntimeError(f"❌ Failed to download video: {e}")
 
 
-# FIX: This is now the ASYNC worker containing the core logic
-async def process_video_async(doc_snapshot):
+async def _write_result(doc_id: str, moderation_result: dict, sink=None, journal=None):
+    with metrics.span("write"):
+        if sink is not None:
+            await sink.add(doc_id, result_update(moderation_result))
+        else:
+            await asyncio.to_thread(update_video_result, doc_id, moderation_result)
+            if journal is not None:
+                journal.written([doc_id])
+
+
+async def process_pack_async(doc_snapshots, sink=None, leases=None):
     """
-    Processes one Firestore document asynchronously.
+    Processes a group of documents, packing the videos that still need the
+    model into shared requests (see app.packing). As in the staged pipeline,
+    videos go through the pre-screen and the near-duplicate index first and
+    are planned to VIDEO_TOKEN_BUDGET. With `leases`, documents another
+    worker holds are skipped, and a document whose lease was lost while the
+    pack was moderated fails instead of being written. Returns one result
+    per document; a failed request fails its own documents, not the group.
     """
-    doc_id = doc_snapshot.id
-    data = doc_snapshot.to_dict()
-    video_url = data.get("videoUrl")
-    aiVideoModerationStatus = data.get("aiVideoModerationStatus")
-    initialSize = data.get("initialSize")
-    isDeleted = data.get("isDeleted")
-    local_path = None # Ensure local_path is defined for the finally block
-    if aiVideoModerationStatus == "failed" or None:
-        if isDeleted is False:
-            if initialSize != 0:
-                if video_url is not None:
-
-                    try:
-                        file_name = f"{doc_id}.mp4"
-                        local_path = download_video(video_url, file_name)
-
-                        moderation_result = await moderate_video(local_path)
-                        moderation_status = moderation_result["moderationStatus"]
-
-                        # FIX: Removed the redundant if/else block
-                        db.collection("UserVideos").document(doc_id).update({
-                            "aiVideoModerationOutput": moderation_result,
-                            "aiVideoModerationStatus": moderation_status,
-                            "updatedAt": server_timestamp,
-                            **sourceInfo
-                        })
-
-                        return {"id": doc_id, "status": "success", "moderation": moderation_result}
-                    except Exception as e:
-                        return {"id": doc_id, "status": "failed", "error": str(e)}
-                    finally:
-                        # Ensure temporary video file is always cleaned up
-                        if local_path and os.path.exists(local_path):
-                            os.remove(local_path)
-                else:
-                    return {"id": doc_id, "status": "failed", "error": "video Url not present"}
-            else:
-                return {"id": doc_id, "status": "failed", "error": "initial size is 0"}
-        else:
-            return {"id": doc_id, "status": "failed", "error": "deleted"}
-    
-        
-    else:
-        return {"id": doc_id, "status": "failed", "error": "Already Processed"}
+    cache = get_cache()
+    local_paths = []
+    plans = {}
+
+    async def _prepare(doc_snapshot):
+        doc_id = doc_snapshot.id
+        data = doc_snapshot.to_dict()
+        reason = skip_reason(data)
+        if reason is not None:
+            return {"id": doc_id, "status": "failed", "error": reason}
+        if leases is not None:
+            reason = await asyncio.to_thread(leases.claim, doc_snapshot)
+            if reason is not None:
+                return {"id": doc_id, "status": "skipped", "error": reason}
+        video_url = data.get("videoUrl")
+        try:
+            cache_key = None
+            if cache is not None:
+                cache_key = await asyncio.to_thread(video_cache_key, video_url)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    cached = cached_result(cached)
+                    await _write_result(doc_id, cached, sink)
+                    return {"id": doc_id, "status": "success", "moderation": cached}
+            source = video_url
+            if INGEST_MODE == "download":
+                source = await asyncio.to_thread(download_video, video_url, f"{doc_id}.mp4")
+                local_paths.append(source)
+            info = None
+            if PRESCREEN == "on":
+                screen = await prescreen(source)
+                if screen.verdict is not None:
+                    await _write_result(doc_id, screen.verdict, sink)
+                    return {"id": doc_id, "status": "success", "moderation": screen.verdict}
+                info = screen.info
+            if VIDEO_TOKEN_BUDGET > 0 and FRAME_MODE == "frames":
+                info = info or await probe_async(source)
+                plans[doc_id] = plan_from_probe(info, VIDEO_TOKEN_BUDGET, MODERATION_MODE)
+            return (doc_id, source, cache_key)
+        except Exception as e:
+            return {"id": doc_id, "status": "failed", "error": str(e)}
 
+    try:
+        with metrics.video() as stats:
+            prepared = await asyncio.gather(*(_prepare(doc) for doc in doc_snapshots))
+            results = [p for p in prepared if isinstance(p, dict)]
+            moderated = await moderate_packed([p for p in prepared if isinstance(p, tuple)], plans=plans,
+                                              screen=PRESCREEN == "on")
+        for doc_id, outcome in moderated.items():
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                if leases is not None and not leases.holds(doc_id):
+                    # Held too long without renewal and claimed by another worker.
+                    raise RuntimeError("lease lost")
+                await _write_result(doc_id, outcome, sink)
+                results.append({"id": doc_id, "status": "success", "moderation": outcome})
+            except Exception as e:
+                results.append({"id": doc_id, "status": "failed", "error": str(e)})
+        # The pack's timings and spend are shared evenly by its documents.
+        for r in results:
+            r["metrics"] = stats.as_row(share=1 / len(results))
+        return results
+    finally:
+        if leases is not None:
+            for doc_snapshot in doc_snapshots:
+                leases.release(doc_snapshot.id)
+        for local_path in local_paths:
+            if os.path.exists(local_path):
+                os.remove(local_path)
 
 
-# FIX: This is the SYNCHRONOUS wrapper for the ThreadPoolExecutor
-def process_video_sync_wrapper(doc_snapshot):
+@contextlib.contextmanager
+def extraction_pool(workers: int = EXTRACT_WORKERS):
     """
-    Runs the async video processing task within a new asyncio event loop.
+    Processes for frame hashing and encoding, or None to run them on
+    threads. Spawned rather than forked: the parent already has threads.
     """
-    return asyncio.run(process_video_async(doc_snapshot))
+    if workers < 1:
+        yield None
+        return
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
 
 
-def chunk_iterable(iterable: Iterable, size: int) -> Iterable[List[Any]]:
+def process_videos_staged(docs, sink=None, pool=None, model_concurrency: int = MODEL_CONCURRENCY, leases=None,
+                          budget: TokenBudget = None):
     """
-    Yields successive n-sized chunks from an iterable.
-    This is memory-efficient as it doesn't load the whole iterable into memory.
+    Moderates documents through four stages connected by bounded queues:
+    fetch (eligibility, lease claim, result cache, download), extraction
+    (after the local pre-screen, which may settle the video), the model call
+    and the result write. ffmpeg runs as asyncio subprocesses
+    (killed if its deadline passes) and hashing and image encoding run on
+    `pool`, so CPU work overlaps the network waits without blocking the loop.
+    Yields one result per document; with
+    `leases`, documents another worker holds come back `skipped`.
+
+    Progress is recorded in the job journal (see app.journal): documents
+    waiting out a retry backoff or dead-lettered come back `skipped`, and a
+    verdict that was never written is written without asking the model
+    again. The sink should report its commits to `journal.written`.
+
+    With a VIDEO_TOKEN_BUDGET or a batch `budget`, each video's frames are
+    planned to fit (see `plan_frames`); once the batch budget cannot pay for
+    even the cheapest request, the remaining documents come back `skipped`.
     """
-    iterator = iter(iterable)
-    while True:
-        chunk = list(islice(iterator, size))
-        if not chunk:
-            return
-        yield chunk
-
-# def process_batch_incrementally(batch_size: int = 8):
-#     """
-#     Fetch documents, process them in parallel chunks, and create a separate CSV
-#     report for each completed chunk.
-#     """
-#     query = db.collection("UserVideos").where("status", "==", "WAITING") #.limit(50)
-    
-#     # Wrap the document stream generation in a try-except block
-#     try:
-#         docs_stream = query.stream()
-        
-#         # ⭐️ 1. Process the document stream in chunks
-#         for i, doc_chunk in enumerate(chunk_iterable(docs_stream, batch_size)):
-#             batch_number = i + 1
-#             print(f"--- Processing Batch #{batch_number} ({len(doc_chunk)} documents) ---")
-            
-#             batch_results = []
-#             # ⭐️ 2. The ThreadPoolExecutor now processes only one chunk at a time
-#             with concurrent.futures.ThreadPoolExecutor(max_workers=batch_size) as executor:
-#                 futures = [executor.submit(process_video_sync_wrapper, doc) for doc in doc_chunk]
-#                 for future in concurrent.futures.as_completed(futures):
-#                     batch_results.append(future.result())
-
-#             if not batch_results:
-#                 print(f"Batch #{batch_number} completed with no results to report.")
-#                 continue # Move to the next chunk
-
-#             # --- CSV Reporting for the current batch ---
-#             report_rows = []
-#             for r in batch_results:
-#                 row = {"id": r.get("id"), "status": r.get("status")}
-#                 if r.get("status") == "success":
-#                     moderation_data = r.get("moderation", {})
-#                     row.update(moderation_data)
-#                 else:
-#                     row["error"] = r.get("error")
-#                 report_rows.append(row)
-
-#             all_headers = set()
-#             for row in report_rows:
-#                 all_headers.update(row.keys())
-            
-#             ordered_headers = sorted(list(all_headers))
-#             # Ensure critical columns are first for readability
-#             for col in ["id", "status", "error", "moderationStatus", "reason"]:
-#                 if col in ordered_headers:
-#                     ordered_headers.remove(col)
-#                     ordered_headers.insert(0, col)
-
-#             # ⭐️ 3. Create a unique CSV file for each chunk
-#             timestamp_ms = int(time.time() * 1000)
-#             unique_file_name = f"batch_report_part_{batch_number}_{timestamp_ms}.csv"
-#             batch_file = ERROR_CSV_DIR / unique_file_name
-
-#             with open(batch_file, "w", newline="", encoding="utf-8") as csvfile:
-#                 writer = csv.DictWriter(csvfile, fieldnames=ordered_headers)
-#                 writer.writeheader()
-#                 writer.writerows(report_rows)
-            
-#             print(f"✅ Batch #{batch_number} Completed. Report saved to {batch_file}")
-    
-#     except DeadlineExceeded as e:
-#         # Create a report for the failed query and then exit the function.
-#         print(f"🚨 A query deadline was exceeded. The Firestore query timed out: {e}")
-        
-#         # Create a report to log the error.
-#         timestamp_ms = int(time.time() * 1000)
-#         error_file_name = f"query_error_report_{timestamp_ms}.csv"
-#         error_file = ERROR_CSV_DIR / error_file_name
-        
-#         report_row = {
-#             "error_type": "Query Deadline Exceeded",
-#             "message": str(e),
-#             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-#         }
-        
-#         with open(error_file, "w", newline="", encoding="utf-8") as csvfile:
-#             writer = csv.DictWriter(csvfile, fieldnames=report_row.keys())
-#             writer.writeheader()
-#             writer.writerow(report_row)
-            
-#         print(f"📄 An error report has been saved to {error_file}")
-        
-#     except Exception as e:
-#         # A catch-all for any other unexpected errors.
-#         print(f"🚨 An unexpected error occurred: {e}")
-#         # Optionally, create a general error report here as well.
-#         # ...
-        
-#     finally:
-#         print("\n🎉 Process completed. Check reports for details.")
-def process_batch_incrementally(batch_size: int = 8):
+    cache = get_cache()
+    journal = get_journal()
+    need_hashes = get_near_dup_index() is not None
+    planned = (VIDEO_TOKEN_BUDGET > 0 or budget is not None) and FRAME_MODE == "frames"
+    # One low-detail frame: what every video is sure to cost.
+    cheapest = predict_tokens(1, None, None, detail="low")
+
+    def _settle(job):
+        if budget is not None and "reserved" in job:
+            counts = job["stats"].counts
+            budget.settle(job.pop("reserved"), int(counts["promptTokens"] + counts["completionTokens"]))
+
+    def _failed(job, error: Exception):
+        _settle(job)
+        if leases is not None:
+            leases.release(job["id"])
+        result = {"id": job["id"], "status": "failed", "error": str(error), "metrics": job["stats"].as_row()}
+        if journal is not None and journal.failed(job["id"], error):
+            result["deadLettered"] = True
+        return Finished(result)
+
+    def _stage(job, stage):
+        if journal is not None:
+            journal.stage(job["id"], stage)
+
+    async def _fetch(doc_snapshot):
+        job = {"id": doc_snapshot.id, "stats": metrics.VideoStats(), "cache_key": None, "local_path": None}
+        data = doc_snapshot.to_dict()
+        reason = skip_reason(data)
+        if reason is not None:
+            return Finished({"id": job["id"], "status": "failed", "error": reason})
+        video_url = data.get("videoUrl")
+        if journal is not None:
+            reason = journal.skip_reason(job["id"], video_url)
+            if reason is not None:
+                return Finished({"id": job["id"], "status": "skipped", "error": reason})
+        if leases is not None:
+            reason = await asyncio.to_thread(leases.claim, doc_snapshot)
+            if reason is not None:
+                return Finished({"id": job["id"], "status": "skipped", "error": reason})
+        if budget is not None:
+            if not budget.claim(cheapest):
+                if leases is not None:
+                    leases.release(job["id"])
+                return Finished({"id": job["id"], "status": "skipped", "error": "batch token budget spent"})
+            job["reserved"] = cheapest
+        with metrics.video(job["stats"]):
+            try:
+                if journal is not None:
+                    unwritten = journal.start(job["id"], video_url)
+                    if unwritten is not None:
+                        job["result"] = unwritten
+                        return job
+                if cache is not None:
+                    job["cache_key"] = await asyncio.to_thread(video_cache_key, video_url)
+                    cached = cache.get(job["cache_key"])
+                    if cached is not None:
+                        job["result"] = cached_result(cached)
+                        return job
+                job["source"] = video_url
+                if INGEST_MODE == "download":
+                    job["source"] = job["local_path"] = await asyncio.to_thread(
+                        download_video, video_url, f"{job['id']}.mp4")
+                return job
+            except Exception as e:
+                return _failed(job, e)
+
+    async def _extract(job):
+        if "result" in job:
+            return job
+        _stage(job, "extract")
+        with metrics.video(job["stats"]):
+            try:
+                info = None
+                if PRESCREEN == "on":
+                    screen = await prescreen(job["source"])
+                    if screen.verdict is not None:
+                        job["result"] = screen.verdict
+                        return job
+                    info = screen.info
+                plan = None
+                if planned:
+                    info = info or await probe_async(job["source"])
+                    token_budget = VIDEO_TOKEN_BUDGET or float("inf")
+                    if budget is not None:
+                        token_budget = min(token_budget, budget.available + job["reserved"])
+                    plan = plan_from_probe(info, token_budget, MODERATION_MODE)
+                    if budget is not None:
+                        job["reserved"] = budget.resize(job["reserved"], plan.tokens)
+                job["prepared"] = await prepare_video_async(
+                    job["source"], FRAME_MODE, MODERATION_MODE, need_hashes, pool, info, plan, PRESCREEN == "on")
+                if job["prepared"].verdict is not None:
+                    job["result"] = job.pop("prepared").verdict
+                return job
+            except Exception as e:
+                return _failed(job, e)
+            finally:
+                # The frames are in memory now; the download is done with.
+                if job["local_path"] and os.path.exists(job["local_path"]):
+                    os.remove(job["local_path"])
+
+    def _lost(job) -> bool:
+        # Held too long without renewal and claimed by another worker.
+        return leases is not None and not leases.holds(job["id"])
+
+    async def _moderate(job):
+        if "result" in job:
+            return job
+        if _lost(job):
+            return _failed(job, RuntimeError("lease lost"))
+        _stage(job, "model")
+        with metrics.video(job["stats"]):
+            try:
+                job["result"] = await moderate_prepared(
+                    job.pop("prepared"), MODERATION_MODE, job["cache_key"], job["id"])
+            except Exception as e:
+                return _failed(job, e)
+        if journal is not None and journal.moderated(job["id"], job["result"]):
+            job["deadLettered"] = True
+        return job
+
+    async def _write(job):
+        if _lost(job):
+            return _failed(job, RuntimeError("lease lost")).result
+        _stage(job, "write")
+        with metrics.video(job["stats"]):
+            try:
+                await _write_result(job["id"], job["result"], sink, journal)
+            except Exception as e:
+                return _failed(job, e).result
+        _settle(job)
+        if leases is not None:
+            leases.release(job["id"])
+        result = {"id": job["id"], "status": "success", "moderation": job["result"], "metrics": job["stats"].as_row()}
+        if job.get("deadLettered"):
+            result["deadLettered"] = True
+        return result
+
+    stages = [
+        Stage("fetch", _fetch, DOWNLOAD_CONCURRENCY),
+        # One ffmpeg at a time per video, FFMPEG_CONCURRENCY in all.
+        Stage("extract", _extract, FFMPEG_CONCURRENCY),
+        Stage("model", _moderate, model_concurrency),
+        Stage("write", _write, WRITE_CONCURRENCY),
+    ]
+    return run_stages(docs, stages, STAGE_QUEUE_SIZE)
+
+
+async def _flatten(groups):
+    async for group in groups:
+        for result in group:
+            yield result
+
+
+# Per-video instrumentation columns (see app.metrics).
+METRIC_COLUMNS = [
+    "downloadSeconds", "extractSeconds", "hashSeconds", "encodeSeconds", "modelSeconds", "writeSeconds",
+    "downloadBytes", "framesExtracted", "imageBytes", "plannedTokens", "predictedPromptTokens", "promptTokens", "completionTokens", "costUsd",
+]
+# Columns of the streamed batch report; moderation fields follow the schema.
+REPORT_HEADERS = ["id", "status", "error", *ModerationResult.model_fields, *METRIC_COLUMNS]
+
+
+async def process_batch_async(docs: Iterable, concurrency: int = None, report_path: Path = None,
+                              offline_job: OfflineJob = None) -> dict:
     """
-    Fetch documents, process them in parallel chunks, and create a separate CSV
-    report for each completed chunk.
+    Moderates every document on a single event loop through the staged
+    pipeline (`process_videos_staged`, with `concurrency` videos at the model
+    stage), appending each result to one CSV report as it finishes. With an
+    `offline_job` the videos go through the Batch API instead (and
+    `concurrency` only bounds frame extraction); with PACK_MAX_VIDEOS > 1
+    short videos share requests, `concurrency` at a time. Those two default
+    `concurrency` to BATCH_SIZE, the staged pipeline to MODEL_CONCURRENCY.
+    Unless LEASE_SECONDS is 0 (or the run is offline), each document is
+    claimed before it is processed, so several workers can share a backlog;
+    documents claimed by another worker are reported `skipped`. The staged
+    pipeline also keeps the job journal (JOURNAL_PATH), so a rerun skips
+    finished work, retries transient failures after a backoff and leaves
+    dead-lettered videos alone. BATCH_TOKEN_BUDGET caps the staged
+    pipeline's predicted spend (see `TokenBudget`).
+    Result writes go through a write-behind sink unless WRITE_BATCH_SIZE <= 1;
+    writes that still fail after the sink's retries are appended to the report
+    once it has flushed.
+    Stage timings, bytes, tokens and cost are exported in the Prometheus text
+    format (METRICS_PATH, METRICS_PORT) and their aggregates are saved next
+    to the report as `<report>_summary.json`.
     """
-    # NOTE: Using .get() is suitable for smaller result sets.
-    # If the number of 'WAITING' videos can be very large, this may cause memory issues.
-    query = db.collection("UserVideos").where("aiVideoModerationStatus", "==", "failed") #.limit(50)
-    
-    docs_list = None
-    max_retries = 3
-    retry_delay_seconds = 5
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempting to fetch documents from Firestore (Attempt {attempt + 1}/{max_retries})...")
-            docs_list = list(query.get()) # Use .get() and convert to a list
-            print(f"✅ Successfully fetched {len(docs_list)} documents from Firestore.")
-            break  # Exit the retry loop on success
-            
-        except DeadlineExceeded as e:
-            # .get() will raise this error directly on a timeout.
-            print(f"🚨 A DeadlineExceeded error occurred: {e}")
-            if attempt < max_retries - 1:
-                print(f"⏳ Retrying in {retry_delay_seconds} seconds...")
-                time.sleep(retry_delay_seconds)
-            else:
-                print("❌ Max retries reached. Giving up.")
-                _create_error_report("Firestore .get() Failed", str(e))
-                return
-        
-        except Exception as e:
-            # Catch-all for any other unexpected errors during the fetch
-            print(f"🚨 An unexpected error occurred: {e}")
-            _create_error_report("Unexpected .get() Error", str(e))
-            return
-
-    # Check if we got a list of documents before proceeding
-    if docs_list is None:
-        print("🛑 Could not fetch documents from Firestore after multiple retries. Exiting.")
-        return
+    if report_path is None:
+        timestamp_ms = int(time.time() * 1000)
+        ERROR_CSV_DIR.mkdir(exist_ok=True)
+        report_path = ERROR_CSV_DIR / f"batch_report_{timestamp_ms}.csv"
+
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+    exporter = asyncio.create_task(metrics.export_periodically(METRICS_PATH)) if METRICS_PATH else None
+
+    counts = {"total": 0, "success": 0, "failed": 0, "skipped": 0, "deadLettered": 0, "prescreened": 0, "framesSampled": 0, "framesSent": 0, "tokensSavedByDedup": 0, "nearDuplicates": 0, "cached": 0, "totalTokens": 0}
+    staged = offline_job is None and PACK_MAX_VIDEOS <= 1
+    model_videos = 0  # results that took model tokens
+    with open(report_path, "w", newline="", encoding="utf-8") as csvfile, \
+            (extraction_pool() if staged else contextlib.nullcontext()) as pool:
+        writer = csv.DictWriter(csvfile, fieldnames=REPORT_HEADERS, extrasaction="ignore")
+        writer.writeheader()
 
-    # --- The rest of your processing logic is now simplified ---
-    # The chunking and parallel processing can now work directly on the list.
-    try:
-        for i, doc_chunk in enumerate(chunk_iterable(docs_list, batch_size)):
-            batch_number = i + 1
-            print(f"--- Processing Batch #{batch_number} ({len(doc_chunk)} documents) ---")
-            
-            # The rest of your code for processing, thread pooling, and reporting
-            batch_results = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=batch_size) as executor:
-                futures = [executor.submit(process_video_sync_wrapper, doc) for doc in doc_chunk]
-                for future in concurrent.futures.as_completed(futures):
-                    batch_results.append(future.result())
-
-            if not batch_results:
-                print(f"Batch #{batch_number} completed with no results to report.")
-                continue
-
-            report_rows = []
-            for r in batch_results:
+        # Leaving the block flushes every queued write, even on an error.
+        use_leases = LEASE_SECONDS > 0 and offline_job is None
+        journal = get_journal() if staged else None
+        budget = TokenBudget(BATCH_TOKEN_BUDGET) if staged and BATCH_TOKEN_BUDGET > 0 else None
+        sink_options = {"on_commit": journal.written} if journal is not None else {}
+        async with (result_sink(**sink_options) if WRITE_BATCH_SIZE > 1 else contextlib.nullcontext()) as sink, \
+                (lease_manager() if use_leases else contextlib.nullcontext()) as leases:
+            if offline_job is not None:
+                results = run_offline_job(
+                    docs, offline_job, get_client(), functools.partial(_write_result, sink=sink),
+                    flush=sink.flush if sink is not None else None, concurrency=concurrency or BATCH_SIZE,
+                )
+            elif PACK_MAX_VIDEOS > 1:
+                # `concurrency` still bounds the videos in flight.
+                results = _flatten(run_sliding_window(
+                    batched(docs, PACK_MAX_VIDEOS, PACK_MAX_WAIT_SECONDS),
+                    functools.partial(process_pack_async, sink=sink, leases=leases),
+                    max(1, (concurrency or BATCH_SIZE) // PACK_MAX_VIDEOS),
+                ))
+            else:
+                results = process_videos_staged(docs, sink, pool, concurrency or MODEL_CONCURRENCY, leases, budget)
+            async for r in results:
                 row = {"id": r.get("id"), "status": r.get("status")}
                 if r.get("status") == "success":
-                    moderation_data = r.get("moderation", {})
-                    row.update(moderation_data)
+                    row.update(r.get("moderation", {}))
                 else:
                     row["error"] = r.get("error")
-                report_rows.append(row)
-
-            all_headers = set()
-            for row in report_rows:
-                all_headers.update(row.keys())
-            
-            ordered_headers = sorted(list(all_headers))
-            for col in ["id", "status", "error", "moderationStatus", "reason"]:
-                if col in ordered_headers:
-                    ordered_headers.remove(col)
-                    ordered_headers.insert(0, col)
-
-            timestamp_ms = int(time.time() * 1000)
-            unique_file_name = f"batch_report_part_{batch_number}_{timestamp_ms}.csv"
-            batch_file = ERROR_CSV_DIR / unique_file_name
-
-            with open(batch_file, "w", newline="", encoding="utf-8") as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=ordered_headers)
-                writer.writeheader()
-                writer.writerows(report_rows)
-            
-            print(f"✅ Batch #{batch_number} Completed. Report saved to {batch_file}")
+                row.update(r.get("metrics", {}))
+                writer.writerow(row)
+                csvfile.flush()
+
+                counts["total"] += 1
+                counts[r.get("status") if r.get("status") in ("success", "skipped") else "failed"] += 1
+                for key in ("framesSampled", "framesSent", "tokensSavedByDedup", "totalTokens"):
+                    counts[key] += row.get(key) or 0
+                counts["nearDuplicates"] += bool(row.get("nearDuplicateOf"))
+                counts["cached"] += bool(row.get("cached"))
+                counts["deadLettered"] += bool(r.get("deadLettered"))
+                counts["prescreened"] += bool(row.get("prescreened"))
+                model_videos += bool(row.get("totalTokens"))
+                metrics.count("videos", 1, status=r.get("status"))
+                # Run metrics the stored verdict leaves out (see `result_update`).
+                metrics.count("frames", row.get("framesSent") or 0, kind="sent")
+                metrics.count("dedup_saved_tokens", row.get("tokensSavedByDedup") or 0)
+                for key, source in (("cached", "cache"), ("nearDuplicateOf", "near_duplicate"),
+                                    ("prescreened", "prescreen")):
+                    if row.get(key):
+                        metrics.count("settled_without_model", 1, source=source)
+                print(f"[{counts['total']}] {row['id']}: {row.get('moderationStatus') or row['error']}")
+
+        if sink is not None:
+            for doc_id, error in sink.failed.items():
+                writer.writerow({"id": doc_id, "status": "failed", "error": f"result write failed: {error}"})
+                counts["success"] -= 1
+                counts["failed"] += 1
+            print(f"💾 Wrote {sink.written} results in {sink.batches} batches, {len(sink.failed)} failed")
+        if leases is not None:
+            print(f"🔒 Leases: {leases.stats()}")
+        if journal is not None:
+            print(f"📒 Journal: {journal.stats()} ({counts['deadLettered']} dead-lettered this run)")
+        if budget is not None:
+            print(f"🎯 Batch token budget: {budget.stats()}")
+
+    if exporter is not None:
+        exporter.cancel()
+        await asyncio.to_thread(metrics.write_textfile, METRICS_PATH)
+    summary = metrics.registry.summary()
+    summary_path = Path(report_path).with_name(f"{Path(report_path).stem}_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"✅ Processed {counts['total']} documents. Report saved to {report_path}")
+    cache = get_cache()
+    if cache is not None:
+        print(f"🗃️ Result cache: {cache.stats()}, {counts['cached']} videos answered from it without a model call")
+    print(f"🚦 Model calls: {get_rate_limiter().stats()}")
+    hedger = get_hedger()
+    if hedger is not None:
+        print(f"⏩ Hedging: {hedger.stats()}")
+    print(f"🪙 {counts['totalTokens']} tokens, {counts['totalTokens'] / max(1, counts['success']):.0f} per moderated video")
+    print(f"🪞 {counts['nearDuplicates']} videos resolved as near-duplicates without a model call")
+    if counts["prescreened"]:
+        # At least one request each; priced at this batch's tokens per model-moderated video.
+        per_video = counts["totalTokens"] / max(1, model_videos)
+        print(f"🧹 Pre-screen settled {counts['prescreened']} videos locally: {counts['prescreened']}+ model calls "
+              f"and ~{counts['prescreened'] * per_video:.0f} tokens saved")
+    print(f"🧮 Dedup sent {counts['framesSent']}/{counts['framesSampled']} sampled frames, "
+          f"saving ~{counts['tokensSavedByDedup']} image tokens")
+    predicted = summary["counters"].get("moderation_predicted_tokens_total_prompt", 0)
+    if predicted:
+        billed = summary["counters"].get("moderation_tokens_total_prompt", 0)
+        print(f"📐 Prompt tokens billed {billed:.0f} vs {predicted:.0f} predicted ({billed / predicted:.0%})")
+    cost = summary["counters"].get("moderation_cost_usd_total", 0)
+    print(f"💵 ~${cost:.4f} estimated model spend, ${cost / max(1, counts['success']):.5f} per moderated video")
+    print(f"⏱️ {'stage':18s} {'count':>6s} {'mean s':>8s} {'p95 s':>8s} {'total s':>9s}")
+    for stage, row in summary["stages"].items():
+        print(f"   {stage:18s} {row['count']:6d} {row['meanSeconds']:8.3f} {row['p95Seconds']:8.3f} {row['totalSeconds']:9.1f}")
+    return counts
+
+
+def process_batch_offline(batch_size: int = BATCH_SIZE, job_dir: str = OFFLINE_JOB_DIR):
+    """
+    Nightly variant of `process_batch_incrementally`: builds Batch API request
+    shards for the `failed` backlog, submits them and writes the answers back
+    once the batches finish. Re-running resumes an interrupted job.
+    """
+    try:
+        return asyncio.run(process_batch_async(stream_failed_videos(), batch_size, offline_job=OfflineJob(job_dir)))
+    except Exception as e:
+        print(f"🚨 Offline batch stopped: {e}. Re-run to resume it.")
+        _create_error_report("Offline Batch Error", str(e))
+
 
+def process_batch_incrementally(batch_size: int = None):
+    """
+    Stream `failed` documents page by page and moderate them through the
+    staged pipeline (`batch_size` overrides MODEL_CONCURRENCY), writing
+    results into a CSV report as they finish. An interrupted scan resumes
+    from its checkpoint.
+    """
+    try:
+        return asyncio.run(process_batch_async(stream_failed_videos(), batch_size))
+    except DeadlineExceeded as e:
+        # Pages are retried individually; this is only reached once one
+        # has failed every retry. The checkpoint lets the next run resume.
+        print(f"❌ Firestore page fetch kept timing out: {e}")
+        _create_error_report("Firestore page fetch Failed", str(e))
     except Exception as e:
         print(f"🚨 A critical error occurred during batch processing: {e}")
         _create_error_report("Critical Processing Error", str(e))
@@ -309,6 +541,7 @@ def process_batch_incrementally(batch_size: int = 8):
 def _create_error_report(error_type, error_message):
     timestamp_ms = int(time.time() * 1000)
     error_file_name = f"error_report_{timestamp_ms}.csv"
+    ERROR_CSV_DIR.mkdir(exist_ok=True)
     error_file = ERROR_CSV_DIR / error_file_name
     
     report_row = {
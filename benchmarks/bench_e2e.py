@@ -0,0 +1,191 @@
+"""
+End-to-end throughput of `app.worker.process_batch_async`: synthetic videos
+of varying length and resolution served over local HTTP, the fake model
+server, and `app.firestore.db` swapped for the in-memory fake.
+
+Reports videos/sec, p50/p95/p99 per stage, peak RSS and CPU utilization;
+`--json` writes the same numbers for comparing runs:
+
+    python -m benchmarks.bench_e2e --docs 64 --concurrency 8
+    python -m benchmarks.bench_e2e --docs 200 --error-rate 0.02 --json before.json
+    python -m benchmarks.bench_e2e --extract-workers 0   # extraction on threads
+
+Extraction, hashing and encoding run in worker processes, so their
+percentiles come from the `app.metrics` histogram (bucket upper bounds).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import functools
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI, lognormal
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+# (source, seconds, size): short phone clips up to a long lecture.
+VIDEO_SET = [
+    ("testsrc2", 10, "320x240"),
+    ("testsrc", 45, "640x360"),
+    ("smptebars", 30, "1920x1080"),
+    ("testsrc2", 120, "1280x720"),
+    ("rgbtestsrc", 300, "854x480"),
+    ("color=c=white", 60, "640x480"),
+]
+
+
+def _videos(directory: Path) -> list:
+    names = []
+    for source, seconds, size in VIDEO_SET:
+        name = f"{source.split('=')[0]}-{seconds}s-{size}.mp4"
+        if not (directory / name).exists():
+            make_video(str(directory / name), seconds, size, source=source)
+        names.append(name)
+    return names
+
+
+def _instrument(timings: dict, owner, name: str, stage: str):
+    """Replaces `owner.name` with a wrapper recording its duration under `stage`."""
+    original = getattr(owner, name)
+    if asyncio.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+    setattr(owner, name, wrapper)
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end worker benchmark on local fakes")
+    parser.add_argument("--docs", type=int, default=48, help="UserVideos documents to moderate")
+    parser.add_argument("--concurrency", type=int, default=8, help="Videos in flight at the model stage")
+    parser.add_argument("--extract-workers", type=int, help="Extraction processes (0 = threads)")
+    parser.add_argument("--median", type=float, default=1.0, help="Median fake model latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal sigma of the model latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of model calls answered 500")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="Fake Firestore round trip (s)")
+    parser.add_argument("--ingest", choices=["stream", "download"], default="stream")
+    # Off by default: the static test patterns in VIDEO_SET would be settled
+    # as frozen without reaching the model.
+    parser.add_argument("--prescreen", choices=["on", "off"], default="off", help="Local pre-screen")
+    parser.add_argument("--video-dir", help="Where to generate/reuse the synthetic videos")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Configure before anything imports app.config.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["INGEST_MODE"] = args.ingest
+    os.environ["PRESCREEN"] = args.prescreen
+    if args.extract_workers is not None:
+        os.environ["EXTRACT_WORKERS"] = str(args.extract_workers)
+    for name in ("RESULT_CACHE_PATH", "NEAR_DUP_INDEX_PATH", "SCAN_CHECKPOINT_PATH", "JOURNAL_PATH", "OPENAI_TPM"):
+        os.environ.setdefault(name, "" if name != "OPENAI_TPM" else "0")
+
+    from openai import AsyncOpenAI
+    from app import firestore, metrics, pipeline, scan, worker
+    from app.ai import client
+    from app.sink import ResultSink
+
+    video_dir = Path(args.video_dir or tempfile.mkdtemp())
+    video_dir.mkdir(parents=True, exist_ok=True)
+    names = _videos(video_dir)
+
+    timings = defaultdict(list)
+    _instrument(timings, scan, "_fetch_page", "scan page")
+    _instrument(timings, pipeline, "call_model", "model call")
+    _instrument(timings, ResultSink, "_commit", "write batch")
+
+    rng = random.Random(0)
+    with VideoServer(str(video_dir)) as videos, FakeOpenAI(
+        latency=lognormal(args.median, args.sigma, rng), error_rate=args.error_rate
+    ) as model:
+        db = FakeFirestore()
+        collection = db.collection("UserVideos")
+        for i in range(args.docs):
+            collection.document(f"doc-{i:05d}").set({
+                "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1,
+                "videoUrl": videos.url(names[i % len(names)]),
+            })
+        db.latency = args.firestore_latency
+        firestore.db = db
+        client.client = AsyncOpenAI(base_url=model.base_url)
+
+        report = Path(tempfile.mkdtemp()) / "report.csv"
+        cpu_before, start = os.times(), time.perf_counter()
+        counts = asyncio.run(worker.process_batch_async(firestore.stream_failed_videos(), args.concurrency, report))
+        wall = time.perf_counter() - start
+        cpu_after = os.times()
+
+    cpu = (cpu_after.user - cpu_before.user + cpu_after.system - cpu_before.system
+           + cpu_after.children_user - cpu_before.children_user
+           + cpu_after.children_system - cpu_before.children_system)
+    results = {
+        "docs": args.docs,
+        "success": counts["success"],
+        "failed": counts["failed"],
+        "wallSeconds": round(wall, 2),
+        "videosPerSecond": round(args.docs / wall, 2),
+        "cpuUtilization": round(cpu / wall / os.cpu_count(), 3),
+        "cpuCores": round(cpu / wall, 2),
+        # ru_maxrss is in KiB on Linux; children is the largest ffmpeg.
+        "peakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peakChildRssMb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50": round(statistics.median(values), 4),
+                "p95": round(_percentile(values, 0.95), 4),
+                "p99": round(_percentile(values, 0.99), 4),
+            }
+            for stage, values in timings.items()
+        },
+    }
+    for stage in ("extract", "hash", "encode"):
+        row = metrics.registry.summary()["stages"].get(stage)
+        if row:
+            results["stages"][stage] = {
+                "count": row["count"],
+                "p50": round(metrics.registry._quantile(stage, 0.5), 4),
+                "p95": row["p95Seconds"],
+                "p99": round(metrics.registry._quantile(stage, 0.99), 4),
+            }
+
+    print(f"\n{results['docs']} docs ({results['success']} ok, {results['failed']} failed) in "
+          f"{results['wallSeconds']}s: {results['videosPerSecond']} videos/s")
+    print(f"CPU {results['cpuCores']} cores ({results['cpuUtilization']:.0%} of {os.cpu_count()}), "
+          f"peak RSS {results['peakRssMb']} MB, largest ffmpeg {results['peakChildRssMb']} MB")
+    print(f"{'stage':14s} {'count':>6s} {'p50 s':>8s} {'p95 s':>8s} {'p99 s':>8s}")
+    for stage, row in results["stages"].items():
+        print(f"{stage:14s} {row['count']:6d} {row['p50']:8.3f} {row['p95']:8.3f} {row['p99']:8.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Tail latency and extra tokens of hedged model calls (app.ai.hedging) on the
+fake server with a heavy-tailed latency: most calls take around `--median`
+seconds, `--tail-share` of them `--tail-factor` times longer.
+
+    python -m benchmarks.bench_hedging --calls 400 --concurrency 16
+    python -m benchmarks.bench_hedging --percentile 0.9 --budget 0.2
+
+Each mode moderates the same synthetic frame `--calls` times through
+`pipeline.call_model`; extra tokens are what the server answered, so a
+cancelled hedge loser counts in full.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+# Fake tokens are free; don't let the TPM budget pace the comparison.
+os.environ.setdefault("OPENAI_TPM", "0")
+os.environ.setdefault("OPENAI_RPM", "0")
+
+from benchmarks.fake_openai import FakeOpenAI, heavy_tail
+from benchmarks.synthetic import make_video
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _run(content: list, calls: int, concurrency: int) -> list:
+    from app import pipeline
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one():
+        async with slots:
+            start = time.perf_counter()
+            await pipeline.call_model(content)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(_one() for _ in range(calls)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged vs unhedged model call latency")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--median", type=float, default=0.2, help="Median fake model latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.3, help="Lognormal sigma of the latency")
+    parser.add_argument("--tail-share", type=float, default=0.03, help="Share of calls in the slow tail")
+    parser.add_argument("--tail-factor", type=float, default=15, help="How much slower tail calls are")
+    parser.add_argument("--percentile", type=float, default=0.95, help="Hedge after this latency percentile")
+    parser.add_argument("--budget", type=float, default=0.1, help="Hedges per call at most")
+    args = parser.parse_args()
+
+    from openai import AsyncOpenAI
+    from app import pipeline
+    from app.ai import client, hedging
+    from app.video.extractor import sample_frames
+
+    video = make_video(str(Path(tempfile.mkdtemp()) / "clip.mp4"), 2, "640x360")
+    content, _ = pipeline.build_content(sample_frames(video, max_frames=1))
+
+    rows = []
+    for name, hedger in (("unhedged", None),
+                         ("hedged", hedging.Hedger(args.percentile, args.budget, min_samples=20))):
+        latency = heavy_tail(args.median, args.sigma, args.tail_share, args.tail_factor, random.Random(0))
+        with FakeOpenAI(latency=latency) as server:
+            client.client = AsyncOpenAI(base_url=server.base_url)
+            hedging._hedger = hedger
+            latencies = asyncio.run(_run(content, args.calls, args.concurrency))
+            # Let cancelled losers finish server-side so their tokens count.
+            while server.in_flight:
+                time.sleep(0.05)
+        rows.append((name, latencies, server.requests, server.tokens_served, hedger))
+
+    base_tokens = rows[0][3]
+    print(f"{'mode':9s} {'p50 s':>7s} {'p95 s':>7s} {'p99 s':>7s} {'max s':>7s} {'requests':>9s} "
+          f"{'tokens':>8s} {'extra':>7s}")
+    for name, latencies, requests, tokens, hedger in rows:
+        print(f"{name:9s} {_percentile(latencies, 0.5):7.3f} {_percentile(latencies, 0.95):7.3f} "
+              f"{_percentile(latencies, 0.99):7.3f} {max(latencies):7.3f} {requests:9d} {tokens:8d} "
+              f"{(tokens - base_tokens) / base_tokens:7.1%}")
+        if hedger is not None:
+            print(f"          {hedger.stats()}")
+
+
+if __name__ == "__main__":
+    main()
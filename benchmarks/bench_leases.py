@@ -0,0 +1,89 @@
+"""
+Several worker processes sharing one backlog through lease claims: every
+worker runs `app.worker.process_batch_async` over the same `failed` scan
+against a file-backed fake Firestore (shared across processes) and the
+fake model server. Reports throughput per worker count and checks that no
+video was moderated twice (one model request and one result write each).
+
+    python -m benchmarks.bench_leases --docs 96 --workers 1 2 4
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI, lognormal
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+
+def run_worker(db_path: str, model_url: str, report_path: str, concurrency: int = 4) -> dict:
+    """One worker process: moderates whatever it can claim from the shared fake."""
+    # Configure before anything imports app.config.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ.update(EXTRACT_WORKERS="0", OPENAI_TPM="0", RESULT_CACHE_PATH="", NEAR_DUP_INDEX_PATH="",
+                      SCAN_CHECKPOINT_PATH="", JOURNAL_PATH="", WRITE_BATCH_SIZE="10", WRITE_FLUSH_SECONDS="0.2",
+                      # A worker holds claims for everything in its pipeline;
+                      # keep that small next to the backlog.
+                      DOWNLOAD_CONCURRENCY="2", STAGE_QUEUE_SIZE="2", SCAN_PAGE_SIZE="20")
+    from openai import AsyncOpenAI
+    from app import firestore, worker
+    from app.ai import client
+
+    firestore.db = FakeFirestore(db_path)
+    client.client = AsyncOpenAI(base_url=model_url)
+    return asyncio.run(worker.process_batch_async(firestore.stream_failed_videos(), concurrency, report_path))
+
+
+def seed(db_path: str, docs: int, url: str):
+    videos = FakeFirestore(db_path).collection("UserVideos")
+    for i in range(docs):
+        videos.document(f"doc-{i:05d}").set({
+            "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1, "videoUrl": url,
+        })
+
+
+def run_workers(workers: int, db_path: str, model_url: str, report_dir: str, concurrency: int = 4) -> list:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(run_worker, db_path, model_url, str(Path(report_dir) / f"worker-{i}.csv"), concurrency)
+            for i in range(workers)
+        ]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lease-shared backlog across worker processes")
+    parser.add_argument("--docs", type=int, default=96)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=4, help="Videos at the model stage per worker")
+    parser.add_argument("--median", type=float, default=1.0, help="Median fake model latency (s)")
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp())
+    make_video(str(directory / "clip.mp4"), duration=10)
+    rng = random.Random(0)
+    with VideoServer(str(directory)) as videos, FakeOpenAI(latency=lognormal(args.median, 0.3, rng)) as model:
+        print(f"{'workers':>7s} {'seconds':>8s} {'videos/s':>9s} {'requests':>9s} {'skipped':>8s} {'rewritten':>9s}")
+        for workers in args.workers:
+            db_path = str(directory / f"db-{workers}.sqlite3")
+            seed(db_path, args.docs, videos.url("clip.mp4"))
+            before = model.requests
+            start = time.perf_counter()
+            counts = run_workers(workers, db_path, model.base_url, tempfile.mkdtemp(), args.concurrency)
+            elapsed = time.perf_counter() - start
+            snapshots = FakeFirestore(db_path).collection("UserVideos").get()
+            rewritten = sum(1 for doc in snapshots if (doc.get("version") or 0) > 1)
+            print(f"{workers:7d} {elapsed:8.2f} {args.docs / elapsed:9.2f} {model.requests - before:9d} "
+                  f"{sum(c['skipped'] for c in counts):8d} {rewritten:9d}")
+
+
+if __name__ == "__main__":
+    main()
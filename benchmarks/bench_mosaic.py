@@ -0,0 +1,84 @@
+"""
+Per-frame vs contact-sheet (mosaic) requests on a fixed sample set.
+
+Reports total prompt tokens, latency and how often the mosaic verdict agrees
+with the per-frame verdict. Run against the real API to tune MOSAIC_TILES /
+MOSAIC_MAX_SIDE / MOSAIC_MIN_TILE_SIDE (agreement is meaningless on --fake):
+
+    python -m benchmarks.bench_mosaic --videos path/to/samples
+    python -m benchmarks.bench_mosaic --fake
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic import make_video
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+SYNTHETIC_SET = [
+    ("testsrc2", 60, "1280x720"),
+    ("testsrc", 180, "640x360"),
+    ("color=c=white", 90, "640x480"),
+    ("smptebars", 30, "1920x1080"),
+]
+
+
+async def _run_modes(videos, modes):
+    from app import pipeline
+
+    runs = {}
+    for frame_mode in modes:
+        results = runs[frame_mode] = {}
+        for video in videos:
+            start = time.perf_counter()
+            result = await pipeline.moderate_video(str(video), frame_mode=frame_mode)
+            results[video] = (result, time.perf_counter() - start)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame vs mosaic token/latency/agreement benchmark")
+    parser.add_argument("--videos", help="Directory of sample .mp4 files (default: synthetic set)")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model server")
+    args = parser.parse_args()
+
+    if args.videos:
+        videos = sorted(Path(args.videos).glob("*.mp4"))
+    else:
+        directory = Path(tempfile.mkdtemp())
+        videos = [make_video(str(directory / f"sample{i}.mp4"), duration, size, source=src)
+                  for i, (src, duration, size) in enumerate(SYNTHETIC_SET)]
+
+    server = None
+    if args.fake:
+        from openai import AsyncOpenAI
+        from app.ai import client
+
+        server = FakeOpenAI(latency=lambda body: 0.05)
+        client.client = AsyncOpenAI(base_url=server.start())
+
+    try:
+        runs = asyncio.run(_run_modes(videos, ("frames", "mosaic")))
+    finally:
+        if server:
+            server.stop()
+
+    print(f"{'mode':8s} {'tokens':>9s} {'images':>7s} {'p50 s':>7s} {'max s':>7s} {'agree':>6s}")
+    baseline = runs["frames"]
+    for name, results in runs.items():
+        tokens = sum(r["totalTokens"] for r, _ in results.values())
+        images = sum(r.get("imagesSent") or 0 for r, _ in results.values())
+        latencies = [t for _, t in results.values()]
+        agree = sum(results[v][0]["moderationStatus"] == baseline[v][0]["moderationStatus"] for v in videos)
+        print(f"{name:8s} {tokens:9d} {images:7d} {statistics.median(latencies):7.2f} "
+              f"{max(latencies):7.2f} {agree / len(videos):6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Insert and query latency of the near-duplicate index at scale.
+
+    python -m benchmarks.bench_near_dup --videos 1000000
+"""
+import time
+import random
+import argparse
+import resource
+import statistics
+
+from app.near_dup import NearDupIndex
+
+VERDICT = {"moderationStatus": "approved"}
+
+
+def _flip(value, rng, bits):
+    for position in rng.sample(range(64), bits):
+        value ^= 1 << position
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate index insert/query benchmark")
+    parser.add_argument("--videos", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--signature", type=int, default=8)
+    parser.add_argument("--path", default=":memory:", help="SQLite file backing the index")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = NearDupIndex(args.path, capacity=args.videos, signature_size=args.signature)
+
+    signatures = []
+    start = time.perf_counter()
+    for i in range(args.videos):
+        hashes = [rng.getrandbits(64) for _ in range(args.signature)]
+        index.add(f"video-{i}", hashes, VERDICT)
+        if i % (args.videos // args.queries or 1) == 0:
+            signatures.append(hashes)
+    insert_seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    hit_latencies, miss_latencies, found = [], [], 0
+    for hashes in signatures[:args.queries]:
+        variant = [_flip(h, rng, 3) for h in hashes]
+        start = time.perf_counter()
+        found += index.query(variant) is not None
+        hit_latencies.append(time.perf_counter() - start)
+
+        unrelated = [rng.getrandbits(64) for _ in range(args.signature)]
+        start = time.perf_counter()
+        index.query(unrelated)
+        miss_latencies.append(time.perf_counter() - start)
+
+    print(f"videos indexed      {index.size}")
+    print(f"insert              {insert_seconds / args.videos * 1e6:8.1f} us/video")
+    print(f"query (near-dup)    p50 {statistics.median(hit_latencies) * 1e6:8.1f} us   "
+          f"p99 {statistics.quantiles(hit_latencies, n=100)[98] * 1e6:8.1f} us   recall {found / len(hit_latencies):.1%}")
+    print(f"query (unrelated)   p50 {statistics.median(miss_latencies) * 1e6:8.1f} us   "
+          f"p99 {statistics.quantiles(miss_latencies, n=100)[98] * 1e6:8.1f} us")
+    print(f"peak RSS growth     {(rss_after - rss_before) / 1024:8.1f} MiB "
+          f"({(rss_after - rss_before) * 1024 / args.videos:.0f} bytes/video)")
+
+
+if __name__ == "__main__":
+    main()
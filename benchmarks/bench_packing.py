@@ -0,0 +1,78 @@
+"""
+Effective tokens per video with and without packing short clips into shared
+requests. Without `--fake` the real API is used (OPENAI_API_KEY):
+
+    python -m benchmarks.bench_packing --fake --videos 24 --pack 6
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+# Every run must reach the model.
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+os.environ.setdefault("NEAR_DUP_INDEX_PATH", "")
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic import make_video
+
+SOURCES = ["testsrc2", "testsrc", "smptebars", "rgbtestsrc", "color=c=white"]
+
+
+async def _run(videos, pack, budget):
+    from app import pipeline
+    from app.packing import moderate_packed
+
+    start = time.perf_counter()
+    unpacked = await asyncio.gather(*(pipeline.moderate_video(v) for v in videos))
+    unpacked_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed = await moderate_packed([(f"clip{i}", v, None) for i, v in enumerate(videos)],
+                                   token_budget=budget, max_videos=pack)
+    packed_s = time.perf_counter() - start
+    return unpacked, unpacked_s, list(packed.values()), packed_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packed vs unpacked tokens per video")
+    parser.add_argument("--videos", type=int, default=24)
+    parser.add_argument("--duration", type=float, default=12, help="Clip length (s)")
+    parser.add_argument("--pack", type=int, default=6, help="Max videos per packed request")
+    parser.add_argument("--budget", type=int, default=200000, help="Pack token budget")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model server")
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp())
+    videos = [make_video(str(directory / f"clip{i}.mp4"), args.duration, "640x360", source=SOURCES[i % len(SOURCES)])
+              for i in range(args.videos)]
+
+    server = None
+    if args.fake:
+        # Fake tokens are free; don't let the TPM budget pace the comparison.
+        os.environ.setdefault("OPENAI_TPM", "0")
+        from openai import AsyncOpenAI
+        from app.ai import client
+
+        server = FakeOpenAI(latency=lambda body: 0.1)
+        client.client = AsyncOpenAI(base_url=server.start())
+
+    try:
+        unpacked, unpacked_s, packed, packed_s = asyncio.run(_run(videos, args.pack, args.budget))
+    finally:
+        if server:
+            server.stop()
+
+    print(f"{'mode':9s} {'requests':>9s} {'tokens':>9s} {'per video':>10s} {'wall s':>7s} {'failed':>7s}")
+    for name, results, elapsed in (("unpacked", unpacked, unpacked_s), ("packed", packed, packed_s)):
+        tokens = sum(r["totalTokens"] for r in results)
+        requests = sum(1 / (r.get("packSize") or 1) for r in results)
+        failed = sum(r["moderationStatus"] == "failed" for r in results)
+        print(f"{name:9s} {requests:9.0f} {tokens:9d} {tokens / len(results):10.0f} {elapsed:7.2f} {failed:7d}")
+
+
+if __name__ == "__main__":
+    main()
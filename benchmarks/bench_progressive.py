@@ -0,0 +1,121 @@
+"""
+Single-request vs progressive (screen first, escalate when unsure)
+moderation on a labeled sample set.
+
+Reports tokens, latency, how often the screening stage settled the video and
+how often each mode's verdict matches the label. `--videos` takes a directory
+of .mp4 files plus a labels.csv with `file,label` rows; without it a small
+synthetic set is labeled at random. With `--fake` the model answers with the
+label, except that screening requests are unsure `--screen-unsure` of the time:
+
+    python -m benchmarks.bench_progressive --videos path/to/labeled_samples
+    python -m benchmarks.bench_progressive --fake --screen-unsure 0.3
+"""
+import os
+import csv
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+
+from benchmarks.fake_openai import FakeOpenAI, APPROVED
+from benchmarks.synthetic import make_video
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+# Every run must reach the model.
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+os.environ.setdefault("NEAR_DUP_INDEX_PATH", "")
+
+SYNTHETIC_SET = [
+    ("testsrc2", 60, "1280x720"),
+    ("testsrc", 180, "640x360"),
+    ("color=c=white", 90, "640x480"),
+    ("smptebars", 30, "1920x1080"),
+    ("rgbtestsrc", 120, "640x360"),
+    ("color=c=black", 45, "640x480"),
+]
+LABELS = ["approved", "approved", "approved", "rejected", "needsManualReview"]
+
+
+def _load_labels(directory: Path) -> dict:
+    with open(directory / "labels.csv", newline="", encoding="utf-8") as f:
+        return {directory / row["file"]: row["label"] for row in csv.DictReader(f)}
+
+
+def _fake_verdict(current: dict, rng: random.Random, screen_unsure: float):
+    def verdict(body):
+        label = current["label"]
+        screening = any(
+            p.get("type") == "image_url" and p["image_url"]["detail"] == "low"
+            for p in body["messages"][1]["content"]
+        )
+        if screening and (label == "needsManualReview" or rng.random() < screen_unsure):
+            label = "needsManualReview"
+        return dict(APPROVED, moderationStatus=label)
+    return verdict
+
+
+async def _run_modes(labeled: dict, current: dict):
+    from app import pipeline
+
+    runs = {}
+    for mode in ("single", "progressive"):
+        results = runs[mode] = {}
+        for video, label in labeled.items():
+            current["label"] = label
+            start = time.perf_counter()
+            result = await pipeline.moderate_video(str(video), moderation_mode=mode)
+            results[video] = (result, time.perf_counter() - start)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single vs progressive moderation cost/agreement benchmark")
+    parser.add_argument("--videos", help="Directory of .mp4 files with a labels.csv (default: synthetic set)")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model server")
+    parser.add_argument("--screen-unsure", type=float, default=0.3,
+                        help="With --fake, share of clear videos the screening stage is unsure about")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    if args.videos:
+        labeled = _load_labels(Path(args.videos))
+    else:
+        directory = Path(tempfile.mkdtemp())
+        labeled = {
+            Path(make_video(str(directory / f"sample{i}.mp4"), duration, size, source=src)): rng.choice(LABELS)
+            for i, (src, duration, size) in enumerate(SYNTHETIC_SET)
+        }
+
+    current = {}
+    server = None
+    if args.fake:
+        from openai import AsyncOpenAI
+        from app.ai import client
+
+        server = FakeOpenAI(latency=lambda body: 0.05, verdict=_fake_verdict(current, rng, args.screen_unsure))
+        client.client = AsyncOpenAI(base_url=server.start())
+
+    try:
+        runs = asyncio.run(_run_modes(labeled, current))
+    finally:
+        if server:
+            server.stop()
+
+    print(f"{'mode':12s} {'tokens':>9s} {'saved':>6s} {'p50 s':>7s} {'screened':>9s} {'agree':>6s}")
+    baseline = sum(r["totalTokens"] for r, _ in runs["single"].values())
+    for name, results in runs.items():
+        tokens = sum(r["totalTokens"] for r, _ in results.values())
+        latencies = [t for _, t in results.values()]
+        screened = sum(len(r.get("stages") or []) == 1 and r["stages"][0]["stage"] == "screen"
+                       for r, _ in results.values())
+        agree = sum(results[v][0]["moderationStatus"] == label for v, label in labeled.items())
+        print(f"{name:12s} {tokens:9d} {1 - tokens / baseline:6.0%} {statistics.median(latencies):7.2f} "
+              f"{screened:9d} {agree / len(labeled):6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Throughput of the sliding-window scheduler against the old chunked mode.
+
+The chunked mode is reproduced as it used to run in `app/worker.py`: chunks
+of `BATCH_SIZE` documents, one thread per document, a fresh `asyncio.run`
+(and therefore a fresh client and connection pool) per document, and a
+barrier at the end of every chunk.
+
+    python -m benchmarks.bench_scheduler --videos 64 --concurrency 8
+"""
+import os
+import time
+import asyncio
+import argparse
+import concurrent.futures
+from itertools import islice
+
+from benchmarks.fake_openai import FakeOpenAI, lognormal
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+
+async def _moderate(client, index):
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": f"video-{index}"}],
+        max_tokens=500,
+    )
+    return response.usage.total_tokens
+
+
+def run_chunked(base_url: str, videos: int, concurrency: int) -> float:
+    from openai import AsyncOpenAI
+
+    async def job(index):
+        async with AsyncOpenAI(base_url=base_url) as client:
+            return await _moderate(client, index)
+
+    iterator = iter(range(videos))
+    start = time.perf_counter()
+    while True:
+        chunk = list(islice(iterator, concurrency))
+        if not chunk:
+            break
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(asyncio.run, job(i)) for i in chunk]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+    return time.perf_counter() - start
+
+
+def run_sliding(base_url: str, videos: int, concurrency: int) -> float:
+    from openai import AsyncOpenAI
+    from app.scheduler import run_sliding_window
+
+    async def _main():
+        async with AsyncOpenAI(base_url=base_url) as shared:
+            async def job(index):
+                return await _moderate(shared, index)
+
+            async for _ in run_sliding_window(range(videos), job, concurrency):
+                pass
+
+    start = time.perf_counter()
+    asyncio.run(_main())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked vs sliding-window scheduler throughput")
+    parser.add_argument("--videos", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median", type=float, default=0.2, help="Median fake model latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.8, help="Lognormal sigma of the latency")
+    args = parser.parse_args()
+
+    for name, runner in (("chunked", run_chunked), ("sliding", run_sliding)):
+        # Same seed for both modes so they see the same latency sequence.
+        with FakeOpenAI(latency=lognormal(args.median, args.sigma)) as server:
+            elapsed = runner(server.base_url, args.videos, args.concurrency)
+            print(f"{name:8s} {args.videos} videos in {elapsed:6.2f}s  "
+                  f"{args.videos / elapsed:6.2f} videos/s  max in flight {server.max_in_flight}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Cold-start cost of the entry points: each module is imported in a fresh
+interpreter, and the median wall time is reported along with the heavy
+SDKs the import pulled in.
+
+    python -m benchmarks.bench_startup --runs 7
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+MODULES = ["app.pipeline", "app.worker", "app.daemon", "scripts.run_single", "scripts.run_batch"]
+SDKS = ["openai", "firebase_admin", "google.cloud.firestore"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start, "sdks": [m for m in {sdks!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str) -> dict:
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-fake"))
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, sdks=SDKS)],
+                         capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the entry points")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'module':22s} {'median s':>9s}  SDKs loaded")
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.runs)]
+        failed = [r["error"] for r in runs if "error" in r]
+        if failed:
+            results[module] = {"error": failed[0]}
+            print(f"{module:22s} {'failed':>9s}  {failed[0]}")
+            continue
+        seconds = statistics.median(r["seconds"] for r in runs)
+        results[module] = {"medianSeconds": round(seconds, 3), "sdks": runs[0]["sdks"]}
+        print(f"{module:22s} {seconds:9.3f}  {', '.join(runs[0]['sdks']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Result-write throughput and event-loop stalls: one blocking update() per
+video on the loop, one update() per video on a thread, and the batched
+write-behind sink, against a fake Firestore with a fixed round-trip latency.
+
+    python -m benchmarks.bench_writes --videos 2000 --latency 0.02
+"""
+import time
+import asyncio
+import argparse
+
+from app.sink import ResultSink
+from app.scheduler import run_sliding_window
+from benchmarks.fake_firestore import FakeFirestore
+
+RESULT = {"aiVideoModerationStatus": "approved", "aiVideoModerationOutput": {"moderationStatus": "approved"}}
+
+
+async def _monitor(stalls, interval=0.001):
+    # Anything beyond the requested sleep is time the loop could not run us.
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def _run(mode, db, args):
+    collection = db.collection("UserVideos")
+
+    async def inline(doc_id):
+        await asyncio.sleep(args.work)
+        collection.document(doc_id).update(RESULT)
+
+    async def threaded(doc_id):
+        await asyncio.sleep(args.work)
+        await asyncio.to_thread(collection.document(doc_id).update, RESULT)
+
+    async def batched(doc_id):
+        await asyncio.sleep(args.work)
+        await sink.add(doc_id, RESULT)
+
+    stalls = []
+    monitor = asyncio.create_task(_monitor(stalls))
+    ids = [f"doc-{i:06d}" for i in range(args.videos)]
+    start = time.perf_counter()
+    if mode == "sink":
+        async with ResultSink(db, max_batch=args.batch_size, flush_interval=args.flush_seconds) as sink:
+            async for _ in run_sliding_window(ids, batched, args.concurrency):
+                pass
+    else:
+        worker = inline if mode == "inline" else threaded
+        async for _ in run_sliding_window(ids, worker, args.concurrency):
+            pass
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    return elapsed, sum(stalls), max(stalls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-video vs batched Firestore result writes")
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake Firestore round trip (s)")
+    parser.add_argument("--work", type=float, default=0.005, help="Simulated moderation time per video (s)")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-seconds", type=float, default=2)
+    args = parser.parse_args()
+
+    for mode in ("inline", "thread", "sink"):
+        db = FakeFirestore()
+        collection = db.collection("UserVideos")
+        for i in range(args.videos):
+            collection.document(f"doc-{i:06d}").set({"aiVideoModerationStatus": "failed"})
+        db.latency, round_trips = args.latency, sum(db.calls.values())
+
+        elapsed, stalled, worst = asyncio.run(_run(mode, db, args))
+        round_trips = sum(db.calls.values()) - round_trips
+        print(f"{mode:>7}: {args.videos / elapsed:8.1f} writes/s  {round_trips:5d} round trips  "
+              f"loop stalled {stalled:6.2f}s total, worst {worst * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+The local store (`app.local_store`) with simulated network round trips and
+injected failures, standing in for Firestore in benchmarks and tests.
+"""
+import time
+
+from app.local_store import LocalFirestore
+
+
+class FakeFirestore(LocalFirestore):
+    """
+    `latency` seconds are slept on every read, write and batch commit to
+    mimic network round trips. `fail_next(op, exc, times)` makes the next
+    calls of `op` ("query", "get", "write", "commit") raise `exc`.
+    """
+
+    def __init__(self, path: str = ":memory:", latency: float = 0.0):
+        super().__init__(path)
+        self.latency = latency
+        self._failures = {}
+
+    def fail_next(self, op, exc, times=1):
+        self._failures[op] = (exc, times)
+
+    def _call(self, op):
+        super()._call(op)
+        if self.latency:
+            time.sleep(self.latency)
+        exc, times = self._failures.get(op, (None, 0))
+        if times:
+            self._failures[op] = (exc, times - 1)
+            raise exc
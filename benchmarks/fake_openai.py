@@ -0,0 +1,314 @@
+"""
+A local stand-in for the OpenAI chat completions, files and batches
+endpoints, used by the benchmarks and tests. It runs an aiohttp server on its own thread so both
+single-loop and thread-per-loop callers can hit it.
+"""
+import re
+import json
+import math
+import base64
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from aiohttp import web
+
+APPROVED = {
+    "moderationStatus": "approved",
+    "reason": "Educational STEM content",
+    "explicitContent": False,
+    "stemContent": True,
+    "piiDetected": False,
+    "copyrightRisk": False,
+    "detectedObjects": ["whiteboard"],
+    "detectedKeywords": ["physics", "audio is not provided, analyze visuals only"],
+}
+
+
+def lognormal(median: float, sigma: float, rng: random.Random = None):
+    """Returns a latency sampler with a heavy right tail."""
+    rng = rng or random.Random(0)
+    mu = math.log(median)
+    return lambda body: rng.lognormvariate(mu, sigma)
+
+
+def heavy_tail(median: float, sigma: float, tail_share: float, tail_factor: float, rng: random.Random = None):
+    """
+    Lognormal latencies where `tail_share` of requests take `tail_factor`
+    times longer, like calls that land on an overloaded replica.
+    """
+    rng = rng or random.Random(0)
+    base = lognormal(median, sigma, rng)
+    return lambda body: base(body) * (tail_factor if rng.random() < tail_share else 1)
+
+
+def _parts(body: dict):
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            yield from content
+        elif isinstance(content, str):
+            yield {"type": "text", "text": content}
+
+
+def video_ids(body: dict) -> list:
+    """Ids from the "Video <id>:" lines of a packed request."""
+    return [
+        match.group(1) for part in _parts(body)
+        if part.get("type") == "text" and (match := re.fullmatch(r"Video (.+):", part.get("text", "")))
+    ]
+
+
+def pack_aware(verdict):
+    """Answers packed requests with one `verdict` per video, keyed by videoId."""
+    def answer(body):
+        ids = video_ids(body)
+        if not ids:
+            return verdict(body)
+        return [dict(verdict(body), videoId=video_id) for video_id in ids]
+    return answer
+
+
+class FakeOpenAI:
+    """
+    Fake chat completions server.
+
+    `latency` and `verdict` are callables taking the parsed request body, so a
+    benchmark can make them deterministic per video. `error_rate` requests
+    fail with `error_status`. `tokens_served` totals the usage of every
+    answered request, including ones the client stopped waiting for.
+
+    Rate limits answer 429 with a `Retry-After` header (unless
+    `send_retry_after` is off): more than `rpm` requests or `tpm` tokens
+    within `window` seconds, or more than `max_in_flight_allowed` concurrent
+    requests. `throttle_next(times)` forces the next 429s.
+
+    The files and batches endpoints run a batch `batch_delay` seconds after
+    it is created, answering each line like a chat completion; uploaded and
+    generated files are kept in `files`.
+    """
+
+    def __init__(self, latency=None, verdict=None, error_rate: float = 0.0,
+                 error_status: int = 500, seed: int = 0, rpm: int = None, tpm: int = None,
+                 window: float = 60.0, max_in_flight_allowed: int = None, send_retry_after: bool = True,
+                 batch_delay: float = 0.2):
+        self.latency = latency or (lambda body: 0.0)
+        self.verdict = verdict or pack_aware(lambda body: APPROVED)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.tokens_served = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.max_in_flight_allowed = max_in_flight_allowed
+        self.send_retry_after = send_retry_after
+        self.throttled = 0
+        self._forced = []
+        self._history = deque()  # (time, tokens) of accepted requests
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self.batch_polls = 0
+        self.base_url = None
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    def _usage(self, body: dict) -> dict:
+        # Roughly four characters per text token; images are billed by the
+        # same tiling rules the pipeline estimates with, so detail matters.
+        # Imported here so importing the fake doesn't load app.config before
+        # a benchmark has set its environment.
+        from app.ai.tokens import image_tokens
+        from app.video.extractor import jpeg_size
+
+        prompt_tokens = 0
+        for part in _parts(body):
+            if part.get("type") == "image_url":
+                image = part["image_url"]
+                data = base64.b64decode(image["url"].split(",", 1)[1])
+                prompt_tokens += image_tokens(*jpeg_size(data), image.get("detail", "auto"), body.get("model"))
+            else:
+                prompt_tokens += len(part.get("text", "")) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": 60,
+                "total_tokens": prompt_tokens + 60}
+
+    def throttle_next(self, times: int = 1, retry_after: float = 0.1):
+        self._forced.extend([retry_after] * times)
+
+    def _retry_after(self, tokens: int):
+        """Seconds until the request fits, or None when it may go ahead."""
+        if self._forced:
+            return self._forced.pop(0)
+        now = time.monotonic()
+        while self._history and self._history[0][0] <= now - self.window:
+            self._history.popleft()
+        if self.max_in_flight_allowed is not None and self.in_flight > self.max_in_flight_allowed:
+            return 0.05
+        used = sum(t for _, t in self._history)
+        if (self.rpm is not None and len(self._history) >= self.rpm) or \
+                (self.tpm is not None and used + tokens > self.tpm):
+            return self._history[0][0] + self.window - now if self._history else self.window
+        self._history.append((now, tokens))
+        return None
+
+    def _throttle(self, retry_after: float) -> web.Response:
+        self.throttled += 1
+        headers = {"retry-after-ms": str(int(retry_after * 1000))} if self.send_retry_after else {}
+        return web.json_response(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status=429, headers=headers,
+        )
+
+    async def _chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            retry_after = self._retry_after(self._usage(body)["total_tokens"])
+            if retry_after is not None:
+                return self._throttle(retry_after)
+            await asyncio.sleep(self.latency(body))
+            status, payload = self._complete(body)
+            return web.json_response(payload, status=status)
+        finally:
+            self.in_flight -= 1
+
+    def _complete(self, body: dict):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self.error_status, {"error": {"message": "fake failure", "type": "server_error"}}
+        usage = self._usage(body)
+        self.tokens_served += usage["total_tokens"]
+        return 200, {
+            "id": f"chatcmpl-fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(self.verdict(body))},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    # --- Files and Batch API ---
+
+    def _file(self, data: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-fake-{len(self.files) + 1}"
+        self.files[file_id] = {
+            "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed", "data": data,
+        }
+        return self.files[file_id]
+
+    @staticmethod
+    def _public(record: dict) -> dict:
+        return {k: v for k, v in record.items() if k != "data"}
+
+    async def _upload_file(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form["file"]
+        return web.json_response(self._public(self._file(upload.file.read(), upload.filename, form["purpose"])))
+
+    async def _file_content(self, request: web.Request) -> web.Response:
+        record = self.files.get(request.match_info["file_id"])
+        if record is None:
+            return web.json_response({"error": {"message": "No such file"}}, status=404)
+        return web.Response(body=record["data"], content_type="application/jsonl")
+
+    async def _create_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        batch_id = f"batch-fake-{len(self.batches) + 1}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "validating", "created_at": int(time.time()), "output_file_id": None,
+            "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        asyncio.get_running_loop().create_task(self._run_batch(batch_id))
+        return web.json_response(self.batches[batch_id])
+
+    async def _run_batch(self, batch_id: str):
+        batch = self.batches[batch_id]
+        lines = self.files[batch["input_file_id"]]["data"].decode().splitlines()
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(lines)
+        await asyncio.sleep(self.batch_delay)
+        output, errors = [], []
+        for n, line in enumerate(lines):
+            item = json.loads(line)
+            self.requests += 1
+            status, payload = self._complete(item["body"])
+            record = {
+                "id": f"batch_req_{batch_id}_{n}", "custom_id": item["custom_id"],
+                "response": {"status_code": status, "request_id": f"req-{n}", "body": payload}, "error": None,
+            }
+            (output if status == 200 else errors).append(json.dumps(record))
+        if output:
+            batch["output_file_id"] = self._file(("\n".join(output) + "\n").encode(), "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._file(("\n".join(errors) + "\n").encode(), "errors.jsonl", "batch_output")["id"]
+        batch["request_counts"].update(completed=len(output), failed=len(errors))
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    async def _get_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "No such batch"}}, status=404)
+        self.batch_polls += 1
+        return web.json_response(batch)
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        app.router.add_post("/v1/files", self._upload_file)
+        app.router.add_get("/v1/files/{file_id}/content", self._file_content)
+        app.router.add_post("/v1/batches", self._create_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self._get_batch)
+        return app
+
+    def start(self) -> str:
+        ready = threading.Event()
+
+        async def _serve():
+            self._runner = web.AppRunner(self.build_app())
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.base_url = f"http://127.0.0.1:{port}/v1"
+            ready.set()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(_serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,118 @@
+"""
+A local static file server with HTTP Range support, for exercising the
+streaming ingest path the way a storage bucket would serve uploads.
+"""
+import os
+import re
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files from the server's directory, honouring single byte ranges,
+    with an nginx-style ETag (mtime-size) when the server has `etag` set.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        self.server.requests.append({"method": self.command, "path": self.path, "range": self.headers.get("Range")})
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = _RANGE.fullmatch(self.headers.get("Range", "").strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        f = open(path, "rb")
+        f.seek(start)
+        self._remaining = end - start + 1
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(self._remaining))
+        self.send_header("Accept-Ranges", "bytes")
+        if self.server.etag:
+            self.send_header("ETag", f'"{int(os.path.getmtime(path)):x}-{size:x}"')
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = self._remaining
+        try:
+            while remaining > 0:
+                chunk = source.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                remaining -= len(chunk)
+                self.server.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg drops the connection as soon as it has what it needs.
+            pass
+
+
+class VideoServer:
+    """Serves `directory` on a random local port from a background thread."""
+
+    def __init__(self, directory: str, etag: bool = False):
+        self.directory = directory
+        self.etag = etag
+        self.httpd = None
+        self._thread = None
+
+    @property
+    def requests(self) -> list:
+        return self.httpd.requests
+
+    @property
+    def bytes_sent(self) -> int:
+        return self.httpd.bytes_sent
+
+    def url(self, name: str) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=self.directory, **kwargs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.requests = []
+        self.httpd.bytes_sent = 0
+        self.httpd.etag = self.etag
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self._thread.join()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
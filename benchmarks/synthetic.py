@@ -0,0 +1,26 @@
+"""
+Synthetic test videos generated with ffmpeg's lavfi sources, so tests and
+benchmarks need no checked-in media.
+"""
+import ffmpeg
+
+
+def make_video(path: str, duration: float, size: str = "320x240", rate: int = 25,
+               source: str = "testsrc2", faststart: bool = False) -> str:
+    """
+    Writes an H.264 MP4 of `duration` seconds to `path`. Without `faststart`
+    the moov atom sits at the end of the file, like most phone uploads, so
+    streaming readers have to seek to find it.
+    """
+    separator = ":" if "=" in source else "="
+    output_kwargs = {"vcodec": "libx264", "preset": "ultrafast", "pix_fmt": "yuv420p", "g": rate * 2}
+    if faststart:
+        output_kwargs["movflags"] = "+faststart"
+    (
+        ffmpeg
+        .input(f"{source}{separator}size={size}:rate={rate}:duration={duration}", f="lavfi")
+        .output(path, **output_kwargs)
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
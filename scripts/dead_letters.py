@@ -0,0 +1,20 @@
+import sys
+from app.journal import get_journal
+
+
+def main():
+    # Lists dead-lettered videos; pass document ids to requeue them.
+    journal = get_journal()
+    if journal is None:
+        print("JOURNAL_PATH is empty; there is no journal.")
+        return
+    for doc_id in sys.argv[1:]:
+        print(f"{doc_id}: {'requeued' if journal.requeue(doc_id) else 'not dead-lettered'}")
+    if not sys.argv[1:]:
+        for letter in journal.dead_letters():
+            kind = "poison" if letter["poison"] else f"{letter['attempts']} attempts"
+            print(f"{letter['id']} [{letter['stage']}, {kind}] {letter['videoUrl']}\n    {letter['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from app.firestore import fetch_failed_videos
-from app.worker import process_video
-from app.config import BATCH_SIZE
+from app.firestore import stream_failed_videos
+from app.worker import process_batch_async
 
 
 def main():
-    docs = fetch_failed_videos()
+    docs = stream_failed_videos()
 
-    with ThreadPoolExecutor(max_workers=BATCH_SIZE) as executor:
-        for doc in docs:
-            executor.submit(asyncio.run, process_video(doc))
+    # One event loop and one shared OpenAI client for the whole run.
+    asyncio.run(process_batch_async(docs))
 
 
 if __name__ == "__main__":
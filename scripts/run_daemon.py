@@ -0,0 +1,11 @@
+import asyncio
+from app.daemon import serve
+
+
+def main():
+    # Runs until Ctrl+C / SIGTERM, then drains the videos in flight.
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
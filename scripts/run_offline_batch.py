@@ -0,0 +1,11 @@
+from app.worker import process_batch_offline
+from app.config import BATCH_SIZE, OFFLINE_JOB_DIR
+
+
+def main():
+    # Safe to re-run: an unfinished job in OFFLINE_JOB_DIR is resumed.
+    process_batch_offline(BATCH_SIZE, OFFLINE_JOB_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import sys
+from app.config import STORE, STORE_PATH
+from app.firestore import get_db
+
+
+def main():
+    # Adds the given video URLs or paths to the local store as `failed`
+    # UserVideos documents, for run_batch.py to moderate without Firebase.
+    if STORE != "sqlite":
+        print("Set STORE=sqlite to seed a local store that run_batch.py can read.")
+        return
+    videos = get_db().collection("UserVideos")
+    for source in sys.argv[1:]:
+        doc_id = os.path.splitext(os.path.basename(source))[0]
+        size = os.path.getsize(source) if os.path.exists(source) else 1
+        videos.document(doc_id).set({
+            "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": size, "videoUrl": source,
+        })
+        print(f"{doc_id}: {source}")
+    print(f"🗄️ {len(sys.argv) - 1} videos added to {STORE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
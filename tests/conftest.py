@@ -0,0 +1,16 @@
+import os
+
+# Tests point the OpenAI client at local fakes, which still read a key from
+# the environment; any value will do.
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+# Nothing in the tests reaches Firebase.
+os.environ.setdefault("STORE", "memory")
+# Tests that want a result cache or near-duplicate index build their own.
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+os.environ.setdefault("NEAR_DUP_INDEX_PATH", "")
+# Scans in tests always start from the top.
+os.environ.setdefault("SCAN_CHECKPOINT_PATH", "")
+# The job journal is opened per test where needed.
+os.environ.setdefault("JOURNAL_PATH", "")
+# Tests that want the local pre-screen turn it on themselves.
+os.environ.setdefault("PRESCREEN", "off")
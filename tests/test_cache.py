@@ -0,0 +1,117 @@
+import asyncio
+import shutil
+
+import pytest
+
+from app import cache as cache_module
+from app import pipeline
+from app.cache import ResultCache, hash_video, settings_fingerprint, video_cache_key
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+RESULT = {"moderationStatus": "approved", "reason": "ok"}
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+
+    assert cache.get("a") is None
+    cache.put("a", RESULT)
+    assert cache.get("a") == RESULT
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    ResultCache(path).put("a", RESULT)
+
+    assert ResultCache(path).get("a") == RESULT
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(cache_module.time, "time", lambda: next(clock))
+    cache = ResultCache(":memory:", max_entries=2)
+
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    cache.get("a")
+    cache.put("c", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    assert cache.get("c") == RESULT
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResultCache(":memory:", ttl_seconds=60)
+
+    cache.put("a", RESULT)
+    now[0] += 61
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_prompt_change_changes_the_key(monkeypatch):
+    before = settings_fingerprint()
+    monkeypatch.setattr(cache_module, "SYSTEM_PROMPT", {"role": "system", "content": "new rubric"})
+
+    assert settings_fingerprint() != before
+    assert settings_fingerprint("mosaic") != settings_fingerprint("frames")
+
+
+@pytest.mark.parametrize("name, value", [
+    ("VIDEO_TOKEN_BUDGET", 50000), ("PRESCREEN", "on"), ("PRESCREEN_FROZEN", "review"),
+])
+def test_budget_and_prescreen_settings_change_the_key(monkeypatch, name, value):
+    before = settings_fingerprint()
+    monkeypatch.setattr(cache_module, name, value)
+
+    assert settings_fingerprint() != before
+
+
+def test_url_and_file_hash_the_same_bytes(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(b"\x00" * 3_000_000 + b"tail")
+
+    with VideoServer(str(tmp_path)) as server:
+        assert hash_video(server.url("clip.mp4")) == hash_video(str(tmp_path / "clip.mp4"))
+
+
+def test_url_with_an_etag_is_keyed_without_reading_it(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(b"\x00" * 3_000_000)
+
+    with VideoServer(str(tmp_path), etag=True) as server:
+        key = hash_video(server.url("clip.mp4"))
+        assert hash_video(server.url("clip.mp4") + "?token=resigned") == key
+        assert [r["method"] for r in server.requests] == ["HEAD", "HEAD"]
+        assert server.bytes_sent == 0
+
+        (tmp_path / "clip.mp4").write_bytes(b"\x01" * 3_000_001)
+        assert hash_video(server.url("clip.mp4")) != key
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                    reason="ffmpeg/ffprobe not installed")
+def test_moderate_video_is_served_from_cache(tmp_path, monkeypatch):
+    from openai import AsyncOpenAI
+    from benchmarks.fake_openai import FakeOpenAI
+
+    video = make_video(str(tmp_path / "clip.mp4"), duration=10)
+    cache = ResultCache(":memory:")
+    monkeypatch.setattr(pipeline, "get_cache", lambda: cache)
+
+    with FakeOpenAI() as server:
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=server.base_url))
+
+        async def _twice():
+            return [await pipeline.moderate_video(video) for _ in range(2)]
+
+        first, second = asyncio.run(_twice())
+
+    assert second == dict(first, totalTokens=0, imagesSent=0, cached=True)
+    assert server.requests == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.get(video_cache_key(video)) == first
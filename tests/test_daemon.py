@@ -0,0 +1,127 @@
+import os
+import asyncio
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from openai import AsyncOpenAI
+
+from app import daemon, firestore
+from app.daemon import watch_documents, poll_documents
+from app.lease import LEASE_FIELD
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+FAILED = {"aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1, "videoUrl": "http://x/v.mp4"}
+
+
+async def _take(feed, count, timeout=5):
+    return [await asyncio.wait_for(anext(feed), timeout) for _ in range(count)]
+
+
+def _listen_and_poll(feed_factory):
+    db = FakeFirestore()
+    videos = db.collection("UserVideos")
+    videos.document("backlog").set(FAILED)
+    videos.document("deleted").set(dict(FAILED, isDeleted=True))
+    videos.document("approved").set(dict(FAILED, aiVideoModerationStatus="approved"))
+
+    async def run():
+        stop = asyncio.Event()
+        feed = feed_factory(videos.where("aiVideoModerationStatus", "==", "failed"), stop)
+        seen = [doc.id for doc in await _take(feed, 1)]
+
+        # An upload arriving later, and our own result that is still `failed`.
+        videos.document("new").set(dict(FAILED, updatedAt=firestore.SERVER_TIMESTAMP))
+        videos.document("backlog").update(firestore.result_update({"moderationStatus": "failed"}))
+        videos.document("later").set(dict(FAILED, updatedAt=firestore.SERVER_TIMESTAMP))
+        seen += [doc.id for doc in await _take(feed, 2)]
+
+        stop.set()
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(anext(feed), 5)
+        return seen
+
+    return asyncio.run(run())
+
+
+def test_listener_yields_backlog_then_arrivals_but_not_our_own_writes():
+    seen = _listen_and_poll(watch_documents)
+    assert seen[0] == "backlog" and sorted(seen[1:]) == ["later", "new"]
+
+
+def test_poll_mode_follows_the_updated_at_watermark():
+    seen = _listen_and_poll(lambda query, stop: poll_documents(query, stop, interval=0.05))
+    assert seen == ["backlog", "new", "later"]
+
+
+def test_listener_takes_over_documents_whose_lease_runs_out():
+    videos = FakeFirestore().collection("UserVideos")
+    expiry = datetime.now(timezone.utc) + timedelta(seconds=0.3)
+    videos.document("stranded").set(dict(FAILED, **{LEASE_FIELD: {"owner": "crashed", "expiresAt": expiry}}))
+
+    async def run():
+        stop = asyncio.Event()
+        feed = watch_documents(videos.where("aiVideoModerationStatus", "==", "failed"), stop)
+        doc = (await _take(feed, 1))[0]
+        stop.set()
+        return doc.id
+
+    start = datetime.now(timezone.utc)
+    assert asyncio.run(run()) == "stranded"
+    assert datetime.now(timezone.utc) >= expiry > start
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_serve_moderates_arrivals_and_drains_on_stop(monkeypatch, tmp_path):
+    make_video(str(tmp_path / "clip.mp4"), duration=6)
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore, "db", db)
+    videos = db.collection("UserVideos")
+
+    with VideoServer(str(tmp_path)) as server, FakeOpenAI(latency=lambda body: 0.3) as model:
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=model.base_url, api_key="sk-test"))
+        url = server.url("clip.mp4")
+
+        async def run():
+            stop = asyncio.Event()
+            service = asyncio.create_task(daemon.serve("listen", 2, tmp_path / "report.csv", stop))
+            for i in range(3):
+                videos.document(f"doc-{i}").set(dict(FAILED, videoUrl=url))
+                await asyncio.sleep(0.2)
+            # Stop while the last videos are still with the model.
+            while model.requests < 1:
+                await asyncio.sleep(0.05)
+            stop.set()
+            return await asyncio.wait_for(service, 60)
+
+        counts = asyncio.run(run())
+
+    statuses = [videos.document(f"doc-{i}").get().get("aiVideoModerationStatus") for i in range(3)]
+    # Everything that entered the pipeline was finished and written.
+    assert counts["success"] == statuses.count("approved") >= 1
+    assert counts["failed"] == 0
+
+
+@pytest.mark.skipif(not os.getenv("FIRESTORE_EMULATOR_HOST"), reason="needs the Firestore emulator")
+def test_listener_against_the_emulator():
+    from google.cloud import firestore as google_firestore
+
+    client = google_firestore.Client(project="demo-ai-video-moderation")
+    videos = client.collection("UserVideos")
+    for doc in videos.list_documents():
+        doc.delete()
+    videos.document("backlog").set(FAILED)
+
+    async def run():
+        stop = asyncio.Event()
+        feed = watch_documents(videos.where("aiVideoModerationStatus", "==", "failed"), stop)
+        seen = [doc.id for doc in await _take(feed, 1, timeout=30)]
+        videos.document("new").set(FAILED)
+        seen += [doc.id for doc in await _take(feed, 1, timeout=30)]
+        stop.set()
+        return seen
+
+    assert asyncio.run(run()) == ["backlog", "new"]
@@ -0,0 +1,60 @@
+import asyncio
+import shutil
+
+import pytest
+
+from app.ai.tokens import image_tokens
+from app.video.dedup import dedup_frames, frame_hashes, frame_hashes_async, hamming
+from app.video.extractor import Frame, jpeg_size, sample_frames
+from benchmarks.synthetic import make_video
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg/ffprobe not installed"
+)
+
+
+def test_dedup_keeps_first_of_each_group():
+    frames = [Frame(float(t), b"") for t in range(5)]
+    hashes = [0b0000, 0b0001, 0xFF00, 0b0011, 0xFF01]
+
+    kept = dedup_frames(frames, hashes, max_distance=2)
+
+    assert [f.timestamp for f in kept] == [0.0, 2.0]
+
+
+def test_negative_distance_disables_dedup():
+    frames = [Frame(0.0, b""), Frame(1.0, b"")]
+    assert dedup_frames(frames, [7, 7], max_distance=-1) == frames
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b0001) == 2
+
+
+def test_image_tokens_follow_tiling_rules():
+    assert image_tokens(1024, 1024, "low", model="gpt-4o") == 85
+    assert image_tokens(1024, 1024, "high", model="gpt-4o") == 85 + 170 * 4
+    assert image_tokens(2048, 4096, "high", model="gpt-4o") == 85 + 170 * 6
+    assert image_tokens(512, 288, "high", model="gpt-4o") == 85 + 170
+    assert image_tokens(512, 288, "high", model="gpt-4o-mini") == 2833 + 5667
+
+
+@needs_ffmpeg
+def test_static_video_collapses_to_one_frame(tmp_path):
+    video = make_video(str(tmp_path / "slide.mp4"), duration=40, source="color=c=navy")
+    frames = sample_frames(video, max_frames=4, frame_rate=1)
+    hashes = frame_hashes([f.data for f in frames])
+
+    assert len(set(hashes)) == 1
+    assert len(dedup_frames(frames, hashes, max_distance=4)) == 1
+    assert jpeg_size(frames[0].data) == (320, 240)
+
+
+@needs_ffmpeg
+def test_changing_video_keeps_distinct_frames(tmp_path):
+    video = make_video(str(tmp_path / "moving.mp4"), duration=40, source="testsrc")
+    frames = sample_frames(video, max_frames=4, frame_rate=1)
+    hashes = frame_hashes([f.data for f in frames])
+
+    assert len(dedup_frames(frames, hashes, max_distance=0)) > 1
+    assert asyncio.run(frame_hashes_async([f.data for f in frames])) == hashes
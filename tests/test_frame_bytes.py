@@ -0,0 +1,44 @@
+import shutil
+
+import pytest
+
+from app.video.extractor import extract_frame_bytes, extract_frames, iter_frame_bytes
+from benchmarks.synthetic import make_video
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    return make_video(str(tmp_path_factory.mktemp("videos") / "clip.mp4"), duration=5)
+
+
+def test_frames_are_complete_jpegs(video):
+    frames = extract_frame_bytes(video, frame_rate=1)
+
+    assert frames
+    for frame in frames:
+        assert frame[:2] == b"\xff\xd8"
+        assert frame[-2:] == b"\xff\xd9"
+
+
+def test_same_frames_as_the_directory_api(video, tmp_path):
+    files = extract_frames(video, str(tmp_path), frame_rate=2)
+    frames = extract_frame_bytes(video, frame_rate=2)
+
+    assert len(frames) == len(files)
+
+
+def test_iterator_can_stop_early(video):
+    iterator = iter_frame_bytes(video, frame_rate=5)
+    first = next(iterator)
+    iterator.close()  # kills ffmpeg instead of decoding the rest
+
+    assert first[:2] == b"\xff\xd8"
+
+
+def test_bad_input_raises(tmp_path):
+    bogus = tmp_path / "bogus.mp4"
+    bogus.write_bytes(b"not a video")
+    with pytest.raises(RuntimeError, match="FFmpeg failed"):
+        extract_frame_bytes(str(bogus))
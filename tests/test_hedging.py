@@ -0,0 +1,72 @@
+import asyncio
+
+from app.ai.hedging import Hedger
+
+
+def _hedger(**kwargs):
+    hedger = Hedger(percentile=0.9, budget=1, min_samples=5, **kwargs)
+    hedger.latencies.extend([0.01] * 10)
+    return hedger
+
+
+def _attempts(delays, answers=None, cancelled=None, queued=0.0):
+    """
+    `attempt` for Hedger.run: the primary's request takes delays[0], the
+    hedge's delays[1], after `queued` seconds in the rate limiter.
+    """
+    async def attempt(primary, timer):
+        name = "primary" if primary else "hedge"
+        try:
+            await asyncio.sleep(queued)
+            timer.start()
+            await asyncio.sleep(delays[0 if primary else 1])
+            timer.stop(delays[0 if primary else 1])
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(name)
+            raise
+        return (answers or {}).get(name, name)
+    return attempt
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    hedger, cancelled = _hedger(), []
+
+    async def _run():
+        result = await hedger.run(_attempts([1.0, 0.01], cancelled=cancelled))
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(_run()) == "hedge"
+    assert cancelled == ["primary"]
+    assert hedger.stats()["hedged"] == 1 and hedger.stats()["hedgeWins"] == 1
+
+
+def test_no_hedging_until_latencies_are_known_or_without_budget():
+    cold = Hedger(percentile=0.9, budget=1, min_samples=5)
+    assert asyncio.run(cold.run(_attempts([0.05, 0.0]))) == "primary"
+    assert cold.hedged == 0
+
+    broke = _hedger()
+    broke.budget = 0.2
+    assert asyncio.run(broke.run(_attempts([0.05, 0.0]))) == "primary"
+    assert broke.over_budget == 1
+
+
+def test_time_queued_in_the_limiter_does_not_trigger_a_hedge():
+    hedger = _hedger()
+
+    assert asyncio.run(hedger.run(_attempts([0.005, 0.0], queued=0.1))) == "primary"
+    assert hedger.hedged == 0
+    # Only the request itself is recorded, not the queueing.
+    assert hedger.latencies[-1] == 0.005
+
+
+def test_invalid_answer_loses_to_a_valid_one():
+    hedger = _hedger()
+    answers = {"primary": {"moderationStatus": None}, "hedge": {"moderationStatus": "approved"}}
+
+    result = asyncio.run(hedger.run(_attempts([0.05, 0.1], answers),
+                                    valid=lambda answer: answer["moderationStatus"] is not None))
+
+    assert result == {"moderationStatus": "approved"}
@@ -0,0 +1,108 @@
+import asyncio
+import shutil
+
+import pytest
+import requests
+from openai import AsyncOpenAI
+
+from app import firestore, worker
+from app.journal import Journal, is_poison
+from app.pipeline import TIMEOUT_RESULT
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+APPROVED = {"moderationStatus": "approved", "reason": "ok"}
+
+
+def test_errors_are_split_into_poison_and_transient():
+    assert is_poison(RuntimeError("FFprobe failed: clip.mp4: Invalid data found when processing input"))
+    assert is_poison(RuntimeError("❌ Failed to download video: 404 Client Error: Not Found for url: x"))
+    assert not is_poison(RuntimeError("FFprobe failed: Connection refused"))
+    assert not is_poison(RuntimeError("❌ Failed to download video: 429 Client Error: Too Many Requests"))
+    assert not is_poison(requests.ConnectionError("reset by peer"))
+
+
+def test_transient_failures_back_off_then_dead_letter():
+    journal = Journal(":memory:", max_attempts=2, retry_seconds=60)
+    journal.start("doc", "url")
+    assert journal.failed("doc", TimeoutError("slow")) is False
+    assert journal.skip_reason("doc", "url").startswith("retry backoff until")
+
+    journal.retry_seconds = 0
+    journal._backoff("doc", "slow")
+    assert journal.skip_reason("doc", "url") is None
+    journal.start("doc", "url")
+    assert journal.failed("doc", TimeoutError("slow again")) is True
+    assert journal.skip_reason("doc", "url") == "dead-lettered: slow again"
+    assert [d["attempts"] for d in journal.dead_letters()] == [2]
+
+    # A new upload, or an explicit requeue, gets a fresh start.
+    assert journal.skip_reason("doc", "new-url") is None
+    journal.start("other", "url")
+    journal.failed("other", RuntimeError("Invalid data found when processing input"))
+    assert journal.requeue("other") and journal.skip_reason("other", "url") is None
+
+
+def test_videos_that_keep_timing_out_are_dead_lettered():
+    journal = Journal(":memory:", max_attempts=3, retry_seconds=0)
+    outcomes = []
+    for _ in range(3):
+        assert journal.skip_reason("doc", "url") is None
+        assert journal.start("doc", "url") is None
+        outcomes.append(journal.moderated("doc", TIMEOUT_RESULT))
+        # The `failed` verdict is written back, so the document returns.
+        journal.written(["doc"])
+
+    assert outcomes == [False, False, True]
+    assert journal.skip_reason("doc", "url").startswith("dead-lettered")
+    assert [d["attempts"] for d in journal.dead_letters()] == [3]
+
+
+def test_unwritten_verdicts_are_reused_until_written():
+    journal = Journal(":memory:")
+    assert journal.start("doc", "url") is None
+    journal.moderated("doc", APPROVED)
+    # Crashed before the write: the next run writes the same verdict.
+    assert journal.start("doc", "url") == APPROVED
+    journal.written(["doc"])
+    # Written, yet back in the backlog: it has been reset, so start over.
+    assert journal.start("doc", "url") is None
+    assert journal.stats() == {"fetch": 1, "deadLetters": 0}
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_reruns_skip_dead_letters_and_back_off_transient_failures(monkeypatch, tmp_path):
+    make_video(str(tmp_path / "clip.mp4"), duration=4)
+    (tmp_path / "broken.mp4").write_bytes(b"not a video" * 100)
+    journal = Journal(str(tmp_path / "journal.sqlite3"), retry_seconds=3600)
+    monkeypatch.setattr(worker, "get_journal", lambda: journal)
+    # Failed documents keep their lease until it expires; not what is tested here.
+    monkeypatch.setattr(worker, "LEASE_SECONDS", 0)
+
+    with VideoServer(str(tmp_path)) as videos, FakeOpenAI() as model:
+        db = FakeFirestore()
+        monkeypatch.setattr(firestore, "db", db)
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=model.base_url, api_key="sk-test"))
+        for doc_id, url in (("good", videos.url("clip.mp4")), ("broken", videos.url("broken.mp4")),
+                            ("offline", "http://127.0.0.1:9/clip.mp4")):
+            db.collection("UserVideos").document(doc_id).set({
+                "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1, "videoUrl": url})
+
+        def run(name):
+            return asyncio.run(worker.process_batch_async(
+                firestore.stream_failed_videos(), 2, report_path=tmp_path / f"{name}.csv"))
+
+        first = run("first")
+        assert (first["success"], first["failed"], first["deadLettered"]) == (1, 2, 1)
+        assert [d["id"] for d in journal.dead_letters()] == ["broken"]
+
+        second = run("second")
+        assert (second["total"], second["skipped"]) == (2, 2)
+        assert model.requests == 1
+
+        journal.retry_seconds = 0
+        journal._backoff("offline", "retry now")
+        third = run("third")
+        assert (third["failed"], third["skipped"]) == (1, 1)
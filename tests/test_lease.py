@@ -0,0 +1,81 @@
+import asyncio
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import firestore
+from app.lease import LeaseManager, LEASE_FIELD, lease_holder
+from benchmarks import bench_leases
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+FAILED = {"aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1, "videoUrl": "http://x/v.mp4"}
+
+
+@pytest.fixture
+def videos():
+    videos = FakeFirestore().collection("UserVideos")
+    videos.document("doc").set(FAILED)
+    return videos
+
+
+def test_only_one_of_two_racing_workers_wins_the_claim(videos):
+    snapshot = videos.document("doc").get()
+    first, second = LeaseManager(videos._db, owner="a"), LeaseManager(videos._db, owner="b")
+
+    # Both read the document before either wrote its lease.
+    assert first.claim(snapshot) is None
+    assert second.claim(snapshot) == "leased by a"
+    assert lease_holder(videos.document("doc").get().to_dict()) == "a"
+
+
+def test_expired_leases_are_reclaimed_and_live_ones_respected(videos):
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    videos.document("doc").update({LEASE_FIELD: {"owner": "crashed", "expiresAt": past}})
+    videos.document("busy").set(dict(FAILED, **{
+        LEASE_FIELD: {"owner": "alive", "expiresAt": past + timedelta(minutes=5)}}))
+    leases = LeaseManager(videos._db, owner="me")
+
+    assert leases.claim(videos.document("doc").get()) is None
+    assert leases.claim(videos.document("busy").get()) == "leased by alive"
+    assert leases.claim(videos.document("doc").get()) == "already claimed by this worker"
+
+
+def test_renewal_extends_the_lease_until_someone_takes_it_over(videos):
+    leases = LeaseManager(videos._db, owner="me", ttl_seconds=60)
+    assert leases.claim(videos.document("doc").get()) is None
+    expiry = videos.document("doc").get().get(LEASE_FIELD)["expiresAt"]
+
+    asyncio.run(leases.renew())
+    assert videos.document("doc").get().get(LEASE_FIELD)["expiresAt"] > expiry
+
+    videos.document("doc").update({LEASE_FIELD: {"owner": "other", "expiresAt": expiry}})
+    asyncio.run(leases.renew())
+    assert not leases.holds("doc") and leases.lost == 1
+
+
+def test_result_write_clears_the_lease(videos):
+    leases = LeaseManager(videos._db, owner="me")
+    assert leases.claim(videos.document("doc").get()) is None
+    videos.document("doc").update(firestore.result_update({"moderationStatus": "approved"}))
+    assert videos.document("doc").get().get(LEASE_FIELD) is None
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_worker_processes_sharing_a_backlog_moderate_each_video_once(tmp_path):
+    make_video(str(tmp_path / "clip.mp4"), duration=4)
+    db_path = str(tmp_path / "firestore.sqlite3")
+    with VideoServer(str(tmp_path)) as server, FakeOpenAI(latency=lambda body: 0.2) as model:
+        bench_leases.seed(db_path, 30, server.url("clip.mp4"))
+        counts = bench_leases.run_workers(3, db_path, model.base_url, str(tmp_path), concurrency=2)
+
+    assert sum(c["success"] for c in counts) == 30
+    assert sum(c["skipped"] for c in counts) == 60
+    assert model.requests == 30
+    for doc in FakeFirestore(db_path).collection("UserVideos").get():
+        assert doc.get("aiVideoModerationStatus") == "approved"
+        assert doc.get("version") == 1  # exactly one result write
+        assert doc.get(LEASE_FIELD) is None
@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+from app import firestore
+from app.local_store import LocalFirestore
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_sqlite_store_serves_the_scan_and_result_writes(tmp_path, monkeypatch):
+    path = str(tmp_path / "store" / "store.sqlite3")
+    monkeypatch.setattr(firestore, "STORE", "sqlite")
+    monkeypatch.setattr(firestore, "STORE_PATH", path)
+    monkeypatch.setattr(firestore, "db", None)
+    videos = firestore.get_db().collection("UserVideos")
+    for doc_id, status in (("a", "failed"), ("b", "approved"), ("c", "failed")):
+        videos.document(doc_id).set({"aiVideoModerationStatus": status, "isDeleted": False, "videoUrl": doc_id})
+
+    assert [doc.id for doc in firestore.fetch_failed_videos(page_size=1)] == ["a", "c"]
+    firestore.update_video_result("a", {"moderationStatus": "approved"})
+
+    # Another process opening the file sees the write.
+    doc = LocalFirestore(path).collection("UserVideos").document("a").get()
+    assert doc.get("aiVideoModerationStatus") == "approved"
+    assert doc.get("version") == 1 and isinstance(doc.get("updatedAt"), datetime)
+
+
+def test_importing_entry_points_loads_no_sdk_and_writes_nothing(tmp_path):
+    probe = (
+        "import sys, json, app.worker, app.daemon, scripts.run_single\n"
+        "print(json.dumps([m for m in ('openai', 'firebase_admin', 'google.cloud.firestore') if m in sys.modules]))"
+    )
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = str(ROOT)
+
+    out = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True)
+
+    assert json.loads(out.stdout) == []
+    assert not any(tmp_path.iterdir())
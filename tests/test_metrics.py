@@ -0,0 +1,57 @@
+import urllib.request
+
+from app import metrics
+from app.metrics import Registry
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = Registry()
+    registry.inc("moderation_tokens_total", 120, kind="prompt")
+    registry.inc("moderation_tokens_total", 30, kind="completion")
+    registry.observe("model", 0.3)
+    registry.observe("model", 2.0)
+
+    text = registry.render()
+
+    assert "# TYPE moderation_tokens_total counter" in text
+    assert 'moderation_tokens_total{kind="prompt"} 120' in text
+    assert '# TYPE moderation_stage_seconds histogram' in text
+    assert 'moderation_stage_seconds_bucket{stage="model",le="0.25"} 0' in text
+    assert 'moderation_stage_seconds_bucket{stage="model",le="0.5"} 1' in text
+    assert 'moderation_stage_seconds_bucket{stage="model",le="+Inf"} 2' in text
+    assert 'moderation_stage_seconds_count{stage="model"} 2' in text
+    summary = registry.summary()
+    assert summary["stages"]["model"]["count"] == 2
+    assert summary["stages"]["model"]["p95Seconds"] == 2.0
+    assert summary["counters"]["moderation_tokens_total_prompt"] == 120
+
+
+def test_spans_and_counts_are_recorded_per_video(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", Registry())
+
+    with metrics.video() as stats:
+        with metrics.span("extract"):
+            pass
+        metrics.count("tokens", 100, "promptTokens", kind="prompt")
+        metrics.count("cost_usd", 0.0015, "costUsd")
+    # Outside a video only the process-wide registry sees it.
+    metrics.count("tokens", 50, "promptTokens", kind="prompt")
+
+    row = stats.as_row()
+    assert "extractSeconds" in row and row["promptTokens"] == 100 and row["costUsd"] == 0.0015
+    assert stats.as_row(share=0.5)["promptTokens"] == 50
+    assert metrics.registry.summary()["counters"]["moderation_tokens_total_prompt"] == 150
+
+
+def test_textfile_and_http_export(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "registry", Registry())
+    metrics.count("videos", 3, status="success")
+    path = tmp_path / "metrics" / "moderation.prom"
+
+    metrics.write_textfile(str(path))
+    server = metrics.start_http_server(0)
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+        served = response.read().decode()
+
+    assert 'moderation_videos_total{status="success"} 3' in path.read_text()
+    assert served == path.read_text()
@@ -0,0 +1,78 @@
+import asyncio
+import shutil
+
+import pytest
+
+from app import pipeline
+from app.video.extractor import jpeg_size, sample_frames
+from app.video import extractor
+from app.video.mosaic import Sheet, build_sheet, build_sheets, build_sheets_async, grid_shape
+from benchmarks.synthetic import make_video
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg/ffprobe not installed"
+)
+
+
+def test_grid_shape():
+    assert grid_shape(1) == (1, 1)
+    assert grid_shape(3) == (2, 2)
+    assert grid_shape(4) == (2, 2)
+    assert grid_shape(6) == (3, 2)
+    assert grid_shape(9) == (3, 3)
+
+
+def test_sheet_detail_depends_on_tile_size():
+    two_by_two = Sheet(b"", [], 2, 2, 1024, 768)
+    four_by_four = Sheet(b"", [], 4, 4, 1024, 768)
+
+    assert pipeline.sheet_detail(two_by_two) == "low"
+    assert pipeline.sheet_detail(four_by_four) == "high"
+
+
+@pytest.fixture(scope="module")
+def frames(tmp_path_factory):
+    video = make_video(str(tmp_path_factory.mktemp("videos") / "clip.mp4"), duration=50, size="640x360")
+    return sample_frames(video, max_frames=5, frame_rate=1)
+
+
+@needs_ffmpeg
+def test_sheet_tiles_frames_into_one_image(frames):
+    sheet = build_sheet(frames[:4], max_side=1024)
+
+    assert (sheet.columns, sheet.rows) == (2, 2)
+    assert jpeg_size(sheet.data) == (sheet.width, sheet.height) == (1024, 576)
+    assert sheet.timestamps == [f.timestamp for f in frames[:4]]
+
+
+@needs_ffmpeg
+def test_partial_last_sheet(frames):
+    sheets = build_sheets(frames, per_sheet=4, max_side=512)
+
+    assert [len(s.timestamps) for s in sheets] == [4, 1]
+    assert jpeg_size(sheets[1].data) == (512, 288)
+
+
+@needs_ffmpeg
+def test_mosaic_content_lists_timestamps(frames):
+    sheets = build_sheets(frames, per_sheet=4, max_side=512)
+    content, images = pipeline.build_content(frames, frame_mode="mosaic", sheets=sheets)
+
+    assert images == 2
+    assert "tile 1 at 00:05" in content[1]["text"]
+    assert content[2]["image_url"]["detail"] in ("low", "high")
+
+
+@needs_ffmpeg
+def test_async_sheets_run_under_the_ffmpeg_cap(frames, monkeypatch):
+    monkeypatch.setattr(extractor, "FFMPEG_CONCURRENCY", 1)
+    spawned = []
+    spawn = extractor._spawn
+    monkeypatch.setattr(extractor, "_spawn", lambda args, stdin: spawned.append(args[0]) or spawn(args, stdin))
+
+    sheets = asyncio.run(build_sheets_async(frames, per_sheet=4, max_side=512))
+
+    assert spawned == ["ffmpeg", "ffmpeg"]
+    assert [s[1:] for s in sheets] == [s[1:] for s in build_sheets(frames, per_sheet=4, max_side=512)]
+    with pytest.raises(TimeoutError):
+        asyncio.run(build_sheets_async(frames, per_sheet=4, max_side=512, timeout=0))
@@ -0,0 +1,166 @@
+import asyncio
+import random
+import shutil
+
+import pytest
+
+from app import pipeline
+from app.near_dup import NearDupIndex, video_signature
+
+VERDICT = {
+    "moderationStatus": "rejected",
+    "reason": "explicitContent",
+    "explicitContent": True,
+    "stemContent": False,
+    "piiDetected": False,
+    "copyrightRisk": False,
+    "detectedObjects": [],
+    "detectedKeywords": [],
+    "totalTokens": 900,
+}
+
+
+def _random_hashes(rng, count=8):
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+def _flip(value, rng, bits):
+    for position in rng.sample(range(64), bits):
+        value ^= 1 << position
+    return value
+
+
+def test_signature_skips_flat_and_repeated_hashes():
+    rng = random.Random(0)
+    a, b = _random_hashes(rng, 2)
+    assert video_signature([0, a, a, 2**64 - 1, b, 1]) == [a, b]
+
+
+def test_signature_is_spread_and_capped():
+    rng = random.Random(1)
+    hashes = _random_hashes(rng, 30)
+    signature = video_signature(hashes, size=8)
+
+    assert len(signature) == 8
+    assert signature[0] == hashes[0]
+
+
+def test_reencoded_variant_matches_within_three_bits():
+    rng = random.Random(2)
+    index = NearDupIndex(capacity=100)
+    for i in range(50):
+        index.add(f"other-{i}", _random_hashes(rng), VERDICT)
+    original = _random_hashes(rng)
+    index.add("original", original, VERDICT)
+
+    variant = [_flip(h, rng, 3) for h in original]
+    match = index.query(variant)
+
+    assert match.video_id == "original"
+    assert match.score == 1.0
+    assert match.verdict == VERDICT
+
+
+def test_trimmed_variant_matches_on_the_frames_it_keeps():
+    rng = random.Random(3)
+    index = NearDupIndex(capacity=10)
+    original = _random_hashes(rng)
+    index.add("original", original, VERDICT)
+
+    assert index.query(original[2:] + [rng.getrandbits(64)], threshold=0.8).video_id == "original"
+    assert index.query(original[:4] + _random_hashes(rng, 4), threshold=0.8) is None
+
+
+def test_unrelated_video_does_not_match():
+    rng = random.Random(4)
+    index = NearDupIndex(capacity=10)
+    index.add("original", _random_hashes(rng), VERDICT)
+
+    assert index.query(_random_hashes(rng)) is None
+
+
+def test_full_index_reuses_the_oldest_slot():
+    rng = random.Random(5)
+    index = NearDupIndex(capacity=2)
+    first, second, third = (_random_hashes(rng) for _ in range(3))
+    for name, hashes in (("first", first), ("second", second), ("third", third)):
+        index.add(name, hashes, VERDICT)
+
+    assert index.size == 2
+    assert index.query(first) is None
+    assert index.query(third).video_id == "third"
+    assert sum(len(bucket) for band in index.bands for bucket in band.values()) == 2 * 8 * 4
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    rng = random.Random(6)
+    path = str(tmp_path / "near_dup.sqlite3")
+    hashes = _random_hashes(rng)
+    NearDupIndex(path, capacity=10).add("original", hashes, VERDICT)
+
+    reopened = NearDupIndex(path, capacity=10)
+
+    assert reopened.query(hashes).video_id == "original"
+    assert reopened.next_slot == 1
+
+
+def test_verdicts_given_under_other_settings_are_not_reused(tmp_path):
+    rng = random.Random(7)
+    path = str(tmp_path / "near_dup.sqlite3")
+    hashes = _random_hashes(rng)
+    NearDupIndex(path, capacity=10).add("original", hashes, VERDICT, fingerprint="old-prompt")
+
+    reopened = NearDupIndex(path, capacity=10)
+
+    assert reopened.query(hashes) is None
+    assert reopened.query(hashes, fingerprint="old-prompt").video_id == "original"
+
+
+def test_fingerprints_take_no_memory_per_video():
+    rng = random.Random(8)
+    index = NearDupIndex(capacity=100)
+    for i in range(50):
+        # A fresh but equal string per video, as settings_fingerprint() returns.
+        index.add(f"video-{i}", _random_hashes(rng), VERDICT, fingerprint="".join(["new", "-prompt"]))
+
+    assert index.fingerprint_ids == {"": 0, "new-prompt": 1}
+    assert index.fingerprints.itemsize == 4 and len(index.fingerprints) == 100
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                    reason="ffmpeg/ffprobe not installed")
+def test_reencoded_upload_skips_the_model(tmp_path, monkeypatch):
+    from openai import AsyncOpenAI
+    from benchmarks.fake_openai import FakeOpenAI
+    from benchmarks.synthetic import make_video
+
+    original = make_video(str(tmp_path / "original.mp4"), duration=60, size="640x360", source="testsrc")
+    reupload = make_video(str(tmp_path / "reupload.mp4"), duration=60, size="480x270", source="testsrc")
+    index = NearDupIndex(capacity=10)
+    monkeypatch.setattr(pipeline, "get_near_dup_index", lambda: index)
+
+    with FakeOpenAI() as server:
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=server.base_url))
+
+        async def _both():
+            first = await pipeline.moderate_video(original, video_id="doc-1")
+            second = await pipeline.moderate_video(reupload, video_id="doc-2")
+            return first, second
+
+        first, second = asyncio.run(_both())
+
+    assert server.requests == 1
+    assert second["nearDuplicateOf"] == "doc-1"
+    assert second["moderationStatus"] == first["moderationStatus"]
+    assert second["totalTokens"] == 0
+
+
+def test_flag_action_sends_match_to_manual_review():
+    from app.near_dup import Match
+
+    result = pipeline.near_duplicate_result(Match("doc-1", 0.9, VERDICT), action="flag")
+
+    assert result["moderationStatus"] == "needsManualReview"
+    assert "doc-1" in result["reason"]
+    assert result["nearDuplicateOf"] == "doc-1"
+    assert result["totalTokens"] == 0
@@ -0,0 +1,116 @@
+import os
+import asyncio
+import shutil
+
+import pytest
+from openai import AsyncOpenAI
+
+from app import offline
+from app.cache import ResultCache
+from app.offline import OfflineJob, prepare_shards, submit_shards, run_offline_job
+from app.sink import ResultSink
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic import make_video
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    return make_video(str(tmp_path_factory.mktemp("videos") / "clip.mp4"), duration=10)
+
+
+@pytest.fixture
+def db(video):
+    db = FakeFirestore()
+    videos = db.collection("UserVideos")
+    for i in range(3):
+        videos.document(f"doc-{i}").set(
+            {"aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 10, "videoUrl": video})
+    videos.document("gone").set({"aiVideoModerationStatus": "failed", "isDeleted": True, "videoUrl": video})
+    return db
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAI(batch_delay=0.1) as server:
+        yield server
+
+
+def _docs(db):
+    return db.collection("UserVideos").order_by("__name__").get()
+
+
+def _status(db, doc_id):
+    return db.collection("UserVideos").document(doc_id).get().get("aiVideoModerationStatus")
+
+
+async def _run(db, job, server, docs=None, **kwargs):
+    client = AsyncOpenAI(base_url=server.base_url, api_key="sk-test")
+    async with ResultSink(db, flush_interval=60) as sink:
+        async def write(doc_id, result):
+            await sink.add(doc_id, {"aiVideoModerationStatus": result["moderationStatus"]})
+
+        return [r async for r in run_offline_job(
+            _docs(db) if docs is None else docs, job, client, write, sink.flush, poll_seconds=0.05, **kwargs)]
+
+
+def test_offline_job_end_to_end(db, server, tmp_path):
+    job = OfflineJob(str(tmp_path / "job"))
+
+    results = asyncio.run(_run(db, job, server, max_requests=2))
+
+    by_id = {r["id"]: r for r in results}
+    assert by_id["gone"] == {"id": "gone", "status": "failed", "error": "deleted"}
+    assert all(by_id[f"doc-{i}"]["status"] == "success" for i in range(3))
+    assert by_id["doc-0"]["moderation"]["framesSampled"] > 0
+    assert len(server.batches) == 2
+    assert [_status(db, f"doc-{i}") for i in range(3)] == ["approved"] * 3
+    assert not os.path.exists(job.job_dir)
+
+
+def test_batch_answers_fill_the_result_cache(db, server, tmp_path, monkeypatch):
+    cache = ResultCache(":memory:")
+    monkeypatch.setattr(offline, "get_cache", lambda: cache)
+    asyncio.run(_run(db, OfflineJob(str(tmp_path / "first")), server))
+    for i in range(3):
+        db.collection("UserVideos").document(f"doc-{i}").update({"aiVideoModerationStatus": "failed"})
+
+    results = asyncio.run(_run(db, OfflineJob(str(tmp_path / "second")), server))
+
+    assert len(server.batches) == 1
+    assert all(r["status"] == "success" for r in results if r["id"].startswith("doc-"))
+    assert cache.stats()["entries"] == 1 and cache.stats()["hits"] == 3
+
+
+def test_interrupted_job_resumes_without_resubmitting(db, server, tmp_path):
+    job_dir = str(tmp_path / "job")
+
+    async def first_run():
+        job = OfflineJob(job_dir)
+        client = AsyncOpenAI(base_url=server.base_url, api_key="sk-test")
+        [r async for r in prepare_shards(_docs(db), job, write=None, concurrency=2)]
+        await submit_shards(client, job)
+        # ...and the process dies while the batch is running.
+
+    asyncio.run(first_run())
+    uploads = len(server.files)
+
+    results = asyncio.run(_run(db, OfflineJob(job_dir), server, docs=[]))
+
+    assert sorted(r["id"] for r in results) == ["doc-0", "doc-1", "doc-2"]
+    assert len(server.batches) == 1
+    assert len(server.files) == uploads + 1  # only the batch output
+    assert _status(db, "doc-2") == "approved"
+
+
+def test_failed_answers_leave_documents_for_the_next_run(db, server, tmp_path):
+    server.error_rate = 1.0
+
+    results = asyncio.run(_run(db, OfflineJob(str(tmp_path / "job")), server))
+
+    failed = [r for r in results if r["id"].startswith("doc-")]
+    assert len(failed) == 3
+    assert all(r["status"] == "failed" and "Batch request failed" in r["error"] for r in failed)
+    assert _status(db, "doc-0") == "failed"
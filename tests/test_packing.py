@@ -0,0 +1,87 @@
+import asyncio
+import shutil
+
+import pytest
+from openai import AsyncOpenAI, BadRequestError
+
+from app.packing import PackItem, moderate_packed, plan_packs
+from benchmarks.fake_openai import APPROVED, FakeOpenAI, video_ids
+from benchmarks.synthetic import make_video
+
+ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+def _item(video_id, tokens):
+    return PackItem(video_id, None, [], [], 0, [], 1, tokens)
+
+
+def test_plan_packs_respects_budget_and_size():
+    items = [_item("a", 400), _item("b", 400), _item("c", 300), _item("d", 2000), _item("e", 100)]
+
+    packs = plan_packs(items, token_budget=1000, max_videos=2)
+
+    assert [[i.video_id for i in pack] for pack in packs] == [["a", "b"], ["c"], ["d"], ["e"]]
+
+
+@pytest.fixture(scope="module")
+def clips(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("clips")
+    return [make_video(str(directory / f"clip{i}.mp4"), duration=8) for i in range(3)]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with FakeOpenAI() as server:
+        seen = []
+        verdict = server.verdict
+        server.verdict = lambda body: seen.append(body) or verdict(body)
+        server.seen = seen
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=server.base_url, api_key="sk-test"))
+        yield server
+
+
+def _videos(clips):
+    return [(f"vid-{i}", clip, None) for i, clip in enumerate(clips)]
+
+
+@ffmpeg
+def test_short_videos_share_one_request(clips, server):
+    results = asyncio.run(moderate_packed(_videos(clips), token_budget=10 ** 6, max_videos=8))
+
+    assert len(server.seen) == 1
+    assert video_ids(server.seen[0]) == ["vid-0", "vid-1", "vid-2"]
+    assert all(r["moderationStatus"] == "approved" and r["packSize"] == 3 for r in results.values())
+    assert all(r["totalTokens"] > 0 and r["framesSent"] >= 1 for r in results.values())
+
+
+@ffmpeg
+def test_missing_or_invalid_answers_fall_back_to_single_requests(clips, server):
+    def verdict(body):
+        server.seen.append(body)
+        ids = video_ids(body)
+        if not ids:
+            return APPROVED
+        # vid-1 is left out and vid-2's answer fails validation.
+        return [dict(APPROVED, videoId="vid-0"), {"videoId": "vid-2", "moderationStatus": "approved"}]
+
+    server.verdict = verdict
+
+    results = asyncio.run(moderate_packed(_videos(clips), token_budget=10 ** 6, max_videos=8))
+
+    assert len(server.seen) == 3
+    assert results["vid-0"]["packSize"] == 3
+    assert results["vid-1"]["packSize"] == results["vid-2"]["packSize"] == 1
+    assert all(r["moderationStatus"] == "approved" for r in results.values())
+
+
+@ffmpeg
+def test_a_failed_request_fails_only_the_videos_it_carried(clips, server):
+    complete = server._complete
+    server._complete = lambda body: (
+        (400, {"error": {"message": "bad pack", "type": "invalid_request_error"}}) if video_ids(body) else complete(body)
+    )
+
+    results = asyncio.run(moderate_packed(_videos(clips), token_budget=10 ** 6, max_videos=2))
+
+    assert all(isinstance(results[v], BadRequestError) for v in ("vid-0", "vid-1"))
+    assert results["vid-2"]["moderationStatus"] == "approved"
@@ -0,0 +1,142 @@
+import asyncio
+import shutil
+
+import pytest
+from openai import AsyncOpenAI
+
+from app import metrics, pipeline
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic import make_video
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    return make_video(str(tmp_path_factory.mktemp("videos") / "clip.mp4"), duration=30)
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    with FakeOpenAI() as server:
+        seen = []
+        verdict = server.verdict
+        server.verdict = lambda body: seen.append(body) or verdict(body)
+        server.seen = seen
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=server.base_url, api_key="sk-test"))
+        yield server
+
+
+def _images(body):
+    return [p for p in body["messages"][1]["content"] if p["type"] == "image_url"]
+
+
+def test_moderate_video_end_to_end(video, fake_openai):
+    result = asyncio.run(pipeline.moderate_video(video))
+
+    assert result["moderationStatus"] == "approved"
+    assert result["totalTokens"] > 0
+    body = fake_openai.seen[0]
+    assert body["messages"][0]["role"] == "system"
+    assert isinstance(body["messages"][0]["content"], str)
+    assert _images(body)
+    assert all(p["image_url"]["url"].startswith("data:image/jpeg;base64,/9j/") for p in _images(body))
+
+
+def test_static_frames_are_sent_once(tmp_path, fake_openai):
+    video = make_video(str(tmp_path / "slide.mp4"), duration=40, source="color=c=white")
+
+    result = asyncio.run(pipeline.moderate_video(video))
+
+    assert result["framesSampled"] == 4
+    assert result["framesSent"] == 1
+    assert result["tokensSavedByDedup"] > 0
+    assert len(_images(fake_openai.seen[0])) == 1
+
+
+def test_rate_limited_call_is_retried(video, fake_openai):
+    fake_openai.throttle_next(2, retry_after=0.05)
+
+    result = asyncio.run(pipeline.moderate_video(video))
+
+    assert result["moderationStatus"] == "approved"
+    assert fake_openai.throttled == 2
+
+
+def test_progressive_accepts_a_confident_screening_verdict(video, fake_openai):
+    result = asyncio.run(pipeline.moderate_video(video, moderation_mode="progressive"))
+
+    assert result["moderationStatus"] == "approved"
+    assert len(fake_openai.seen) == 1
+    images = _images(fake_openai.seen[0])
+    assert len(images) <= 4 and all(p["image_url"]["detail"] == "low" for p in images)
+    assert [s["stage"] for s in result["stages"]] == ["screen"]
+
+
+def test_progressive_escalates_when_screening_is_unsure(video, fake_openai):
+    from benchmarks.fake_openai import APPROVED
+
+    def verdict(body):
+        fake_openai.seen.append(body)
+        low = any(p["image_url"]["detail"] == "low" for p in _images(body))
+        return dict(APPROVED, moderationStatus="needsManualReview") if low else APPROVED
+
+    fake_openai.verdict = verdict
+
+    result = asyncio.run(pipeline.moderate_video(video, moderation_mode="progressive"))
+
+    screen, full = result["stages"]
+    assert (screen["stage"], screen["moderationStatus"]) == ("screen", "needsManualReview")
+    assert (full["stage"], full["moderationStatus"]) == ("full", "approved")
+    assert full["framesSent"] == result["framesSent"] >= screen["framesSent"]
+    assert _images(fake_openai.seen[1])[0]["image_url"]["detail"] == "auto"
+    assert result["totalTokens"] == screen["totalTokens"] + full["totalTokens"]
+    assert result["imagesSent"] == len(_images(fake_openai.seen[0])) + len(_images(fake_openai.seen[1]))
+
+
+def test_plan_keeps_every_frame_before_dropping_any():
+    # A 5-minute 720p upload samples 30 frames.
+    def plan(budget):
+        return pipeline.plan_frames(300, 1280, 720, budget, "single")
+
+    full = plan(10**7)
+    assert (full.frames, full.max_side, full.detail) == (30, 768, "auto")
+    assert plan(full.tokens) == full
+    smaller = plan(full.tokens - 1)
+    assert (smaller.frames, smaller.max_side, smaller.detail) == (30, 512, "auto")
+    low = plan(smaller.tokens - 1)
+    assert (low.frames, low.detail) == (30, "low")
+    fewer = plan(low.tokens - 1)
+    assert fewer.frames < 30 and fewer.detail == "low" and fewer.tokens <= low.tokens - 1
+    assert plan(0).frames == 1
+
+
+def test_budgeted_video_is_billed_as_predicted(video, fake_openai, monkeypatch):
+    # The fake bills by the same tiling rules, so prediction and usage agree.
+    budget = pipeline.predict_tokens(3, 320, 240, detail="low", moderation_mode="single")
+    monkeypatch.setattr(pipeline, "VIDEO_TOKEN_BUDGET", budget)
+
+    with metrics.video() as stats:
+        result = asyncio.run(pipeline.moderate_video(video))
+
+    assert result["moderationStatus"] == "approved"
+    assert all(p["image_url"]["detail"] == "low" for p in _images(fake_openai.seen[0]))
+    assert result["totalTokens"] <= budget
+    assert stats.counts["plannedTokens"] == budget
+    assert stats.counts["predictedPromptTokens"] == stats.counts["promptTokens"] > 0
+
+
+def test_staged_preparation_runs_every_ffmpeg_under_the_cap(video, monkeypatch):
+    from app.video import extractor
+    monkeypatch.setattr(extractor, "FFMPEG_CONCURRENCY", 1)
+    spawned = []
+    spawn = extractor._spawn
+    monkeypatch.setattr(extractor, "_spawn",
+                        lambda args, stdin=None: spawned.append(" ".join(args)) or spawn(args, stdin))
+
+    prepared = asyncio.run(pipeline.prepare_video_async(video, frame_mode="mosaic", need_hashes=True))
+
+    assert len(prepared.hashes) == prepared.frames_sampled
+    assert prepared.plans[-1].images >= 1
+    assert any("scale=9:8" in args for args in spawned)
+    assert any("tile=" in args for args in spawned)
@@ -0,0 +1,132 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+from openai import AsyncOpenAI
+
+from app import firestore, worker
+from app.video.extractor import sample_frames_async
+from app.video.prescreen import classify, prescreen, prescreen_frames
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+def _frame(t, black=None, edges=0.2, diff=5.0):
+    frame = {"pts_time": t, "lavfi.entropy.entropy.normal.Y": edges, "lavfi.signalstats.YDIF": diff}
+    if black is not None:
+        frame[f"lavfi.black_{black}"] = t
+    return frame
+
+
+def test_keyframe_statistics_are_classified():
+    moving = [_frame(t) for t in range(0, 20, 2)]
+    assert classify(moving) is None
+    assert classify([_frame(0, black="start")] + [_frame(t) for t in range(2, 20, 2)]) == "black_video"
+    assert classify([_frame(t, edges=0) for t in range(0, 20, 2)]) == "blank_video"
+    assert classify([_frame(t, diff=0.1) for t in range(0, 20, 2)]) == "frozen_video"
+    # A few pen strokes on a white board are content, not a blank picture.
+    assert classify([_frame(t, edges=0.02, diff=0.1) for t in range(0, 20, 2)]) == "frozen_video"
+    # A black intro alone doesn't settle anything.
+    assert classify([_frame(0, black="start"), _frame(2, black="end")] + moving[2:]) is None
+    assert classify([]) == "unprocessable_video"
+
+
+@pytest.fixture(scope="module")
+def videos(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("videos")
+    make_video(str(directory / "moving.mp4"), 20)
+    make_video(str(directory / "black.mp4"), 20, source="color=c=black")
+    make_video(str(directory / "white.mp4"), 20, source="color=c=white")
+    make_video(str(directory / "smptebars.mp4"), 20, source="smptebars")
+    make_video(str(directory / "short.mp4"), 0.4)
+    (directory / "corrupt.mp4").write_bytes(b"not a video" * 100)
+    strokes = "drawbox=x=100:y=100:w=200:h=2:color=black:t=fill,drawbox=x=120:y=140:w='40+t*20':h=2:color=blue:t=fill"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "color=c=white:size=640x360:duration=20",
+                    "-vf", strokes, "-pix_fmt", "yuv420p", "-g", "50", str(directory / "whiteboard.mp4")], check=True)
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=d=5", str(directory / "audio.m4a")],
+                   check=True)
+    return directory
+
+
+def _screen(path, **kwargs):
+    async def _run():
+        return await prescreen_frames(await sample_frames_async(path, max_frames=10, frame_rate=1), **kwargs)
+    return asyncio.run(_run())
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("name, reason", [
+    ("moving.mp4", None),
+    ("short.mp4", "near_zero_duration"),
+    ("audio.m4a", "no_video_stream"),
+])
+def test_prescreen_settles_videos_from_their_metadata(videos, name, reason):
+    screen = asyncio.run(prescreen(str(videos / name)))
+
+    if reason is None:
+        assert screen.verdict is None and screen.info["streams"]
+    else:
+        assert (screen.verdict["moderationStatus"], screen.verdict["reason"]) == ("needsManualReview", reason)
+        assert screen.verdict["prescreened"] and screen.verdict["totalTokens"] == 0
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("name, reason", [
+    ("moving.mp4", None),
+    ("black.mp4", "black_video"),
+    ("white.mp4", "blank_video"),
+    ("smptebars.mp4", "frozen_video"),
+    ("whiteboard.mp4", "frozen_video"),
+])
+def test_sampled_frames_settle_junk_videos(videos, name, reason):
+    verdict = _screen(str(videos / name), frozen_action="review")
+
+    if reason is None:
+        assert verdict is None
+    else:
+        assert (verdict["moderationStatus"], verdict["reason"]) == ("needsManualReview", reason)
+        assert verdict["prescreened"] and verdict["totalTokens"] == 0 and verdict["framesSampled"] == 10
+
+
+def test_no_sampled_frames_is_unprocessable():
+    verdict = asyncio.run(prescreen_frames([]))
+
+    assert (verdict["moderationStatus"], verdict["reason"]) == ("rejected", "unprocessable_video")
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("name", ["smptebars.mp4", "whiteboard.mp4"])
+def test_frozen_videos_go_to_the_model_by_default(videos, name):
+    assert _screen(str(videos / name)) is None
+
+
+@needs_ffmpeg
+def test_unreadable_videos_raise_instead_of_getting_a_verdict(videos):
+    with pytest.raises(RuntimeError, match="Invalid data found"):
+        asyncio.run(prescreen(str(videos / "corrupt.mp4")))
+
+
+@needs_ffmpeg
+def test_batch_skips_the_model_for_prescreened_videos(videos, monkeypatch, tmp_path):
+    monkeypatch.setattr(worker, "PRESCREEN", "on")
+    with VideoServer(str(videos)) as server, FakeOpenAI() as model:
+        db = FakeFirestore()
+        monkeypatch.setattr(firestore, "db", db)
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=model.base_url, api_key="sk-test"))
+        for name in ("moving.mp4", "black.mp4", "corrupt.mp4"):
+            db.collection("UserVideos").document(name).set({
+                "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1,
+                "videoUrl": server.url(name)})
+
+        counts = asyncio.run(worker.process_batch_async(
+            firestore.stream_failed_videos(), 2, report_path=tmp_path / "report.csv"))
+
+        assert (counts["success"], counts["failed"], counts["prescreened"]) == (2, 1, 1)
+        assert model.requests == 1
+        black = db.collection("UserVideos").document("black.mp4").get()
+        assert black.get("aiVideoModerationStatus") == "needsManualReview"
@@ -0,0 +1,125 @@
+import time
+import asyncio
+
+import pytest
+from openai import AsyncOpenAI, BadRequestError, RateLimitError
+
+from app.ai.ratelimit import RateLimiter, TokenBucket
+from benchmarks.fake_openai import FakeOpenAI
+
+
+def _request(server):
+    client = AsyncOpenAI(base_url=server.base_url, api_key="sk-test", max_retries=0)
+    return lambda: client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}], max_tokens=10
+    )
+
+
+def test_honors_retry_after():
+    with FakeOpenAI() as server:
+        server.throttle_next(2, retry_after=0.2)
+        limiter = RateLimiter(rpm=0, tpm=0)
+
+        start = time.monotonic()
+        response = asyncio.run(limiter.call(_request(server), estimated_tokens=100))
+
+    assert response.choices[0].message.content
+    assert time.monotonic() - start >= 0.4
+    assert limiter.throttled == 2 and limiter.calls == 1
+
+
+def test_backs_off_without_retry_after_and_gives_up():
+    with FakeOpenAI(send_retry_after=False) as server:
+        server.throttle_next(3, retry_after=0)
+        limiter = RateLimiter(rpm=0, tpm=0, max_retries=2, base_delay=0.01)
+
+        with pytest.raises(RateLimitError):
+            asyncio.run(limiter.call(_request(server), estimated_tokens=100))
+
+    assert server.requests == 3
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(per_minute=600, burst_seconds=0.1)  # 10/s, no burst
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire(1)
+        return time.monotonic() - start
+
+    assert 0.35 <= asyncio.run(run()) < 1.0
+
+
+def test_estimate_is_reconciled_with_usage():
+    with FakeOpenAI() as server:
+        limiter = RateLimiter(rpm=0, tpm=60000)  # 10k-token bucket
+        asyncio.run(limiter.call(_request(server), estimated_tokens=8000))
+
+    assert limiter.tokens_estimated == 8000
+    assert limiter.tokens_used < 100
+    # The unused reservation went back into the bucket.
+    assert limiter.tokens.level > 9000
+
+
+def test_adapts_concurrency_to_server_limit():
+    with FakeOpenAI(latency=lambda body: 0.05, max_in_flight_allowed=4) as server:
+        limiter = RateLimiter(rpm=0, tpm=0, max_concurrency=32, decrease_cooldown=0.05)
+        request = _request(server)
+
+        async def run():
+            return await asyncio.gather(*(limiter.call(request, 100) for _ in range(80)))
+
+        responses = asyncio.run(run())
+
+    assert len(responses) == 80
+    assert server.throttled > 0
+    assert limiter.concurrency < 8
+
+
+def test_retries_server_errors_without_throttling_others():
+    with FakeOpenAI() as server:
+        complete, failures = server._complete, [500, 503]
+        server._complete = lambda body: (
+            (failures.pop(0), {"error": {"message": "fake failure", "type": "server_error"}}) if failures
+            else complete(body)
+        )
+        limiter = RateLimiter(rpm=0, tpm=0, base_delay=0.01)
+        concurrency = limiter.concurrency
+
+        response = asyncio.run(limiter.call(_request(server), estimated_tokens=100))
+
+    assert response.choices[0].message.content
+    assert server.requests == 3
+    assert (limiter.retried, limiter.throttled) == (2, 0)
+    assert limiter.concurrency > concurrency and limiter._paused_until == 0.0
+
+
+def test_client_errors_are_not_retried():
+    with FakeOpenAI() as server:
+        server._complete = lambda body: (400, {"error": {"message": "bad request", "type": "invalid_request_error"}})
+        limiter = RateLimiter(rpm=0, tpm=0, base_delay=0.01)
+
+        with pytest.raises(BadRequestError):
+            asyncio.run(limiter.call(_request(server), estimated_tokens=100))
+
+    assert server.requests == 1
+
+
+def test_a_cancelled_request_keeps_its_token_reservation():
+    limiter = RateLimiter(rpm=0, tpm=60000)  # 10k-token bucket
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.ensure_future(limiter.call(slow, estimated_tokens=4000))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert limiter.cancelled == 1 and limiter.tokens_used == 4000
+    assert limiter.tokens.level < 7000
@@ -0,0 +1,178 @@
+import time
+import shutil
+import asyncio
+
+import pytest
+
+from app.video import extractor
+from app.video.extractor import format_timestamp, probe_duration, sample_frames, sample_timestamps
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg/ffprobe not installed"
+)
+
+
+def test_timestamps_follow_frame_rate_for_short_videos():
+    assert sample_timestamps(30, max_frames=30, frame_rate=0.1) == [5.0, 15.0, 25.0]
+
+
+def test_timestamps_are_capped_and_spread_for_long_videos():
+    timestamps = sample_timestamps(20 * 60, max_frames=30, frame_rate=0.1)
+
+    assert len(timestamps) == 30
+    assert timestamps[0] == 20.0
+    assert timestamps[-1] == 1180.0
+
+
+def test_stratified_timestamps_stay_in_their_slice():
+    timestamps = sample_timestamps(100, max_frames=10, frame_rate=1, mode="stratified", seed=1)
+
+    assert [int(t // 10) for t in timestamps] == list(range(10))
+
+
+def test_very_short_video_still_gets_a_frame():
+    assert sample_timestamps(0.4, max_frames=30, frame_rate=0.1) == [0.2]
+
+
+def test_format_timestamp():
+    assert format_timestamp(5.9) == "00:05"
+    assert format_timestamp(754) == "12:34"
+    assert format_timestamp(3723) == "1:02:03"
+
+
+@pytest.fixture(scope="module")
+def long_video(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("videos")
+    make_video(str(directory / "long.mp4"), duration=120, size="1280x720", rate=10)
+    return directory
+
+
+@needs_ffmpeg
+def test_sample_frames_honours_max_frames(long_video):
+    video = str(long_video / "long.mp4")
+    frames = sample_frames(video, max_frames=4, frame_rate=1)
+
+    assert abs(probe_duration(video) - 120) < 0.5
+    assert [f.timestamp for f in frames] == [15.0, 45.0, 75.0, 105.0]
+    assert all(f.data[:2] == b"\xff\xd8" for f in frames)
+
+
+@needs_ffmpeg
+def test_frames_are_scaled_in_the_decode_graph(long_video):
+    frame = sample_frames(str(long_video / "long.mp4"), max_frames=1, max_side=320)[0]
+    # SOF0 marker: height and width follow the precision byte.
+    sof = frame.data.index(b"\xff\xc0")
+    height = int.from_bytes(frame.data[sof + 5:sof + 7], "big")
+    width = int.from_bytes(frame.data[sof + 7:sof + 9], "big")
+
+    assert (width, height) == (320, 180)
+
+
+@needs_ffmpeg
+def test_keyframe_seeks_report_the_keyframes_own_timestamp(long_video):
+    video = str(long_video / "long.mp4")  # a keyframe every 2 seconds
+    frames = sample_frames(video, max_frames=4, frame_rate=1, seek_mode="keyframe")
+    streamed = asyncio.run(extractor.sample_frames_async(video, max_frames=4, frame_rate=1, seek_mode="keyframe"))
+
+    assert [f.timestamp for f in frames] == [14.0, 44.0, 74.0, 104.0]
+    assert [f.timestamp for f in streamed] == [f.timestamp for f in frames]
+
+
+@needs_ffmpeg
+def test_keyframe_sampling_over_http_seeks_with_range_requests(long_video):
+    with VideoServer(str(long_video)) as server:
+        frames = sample_frames(server.url("long.mp4"), max_frames=3, seek_mode="keyframe")
+        size = (long_video / "long.mp4").stat().st_size
+        starts = [int(r["range"][6:].split("-")[0]) for r in server.requests if r["range"]]
+
+    assert len(frames) == 3
+    # Jumps straight into the middle of the mdat instead of reading up to it.
+    assert any(0.3 * size < start < 0.9 * size for start in starts)
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """Every process the extractor starts on the event loop."""
+    processes = []
+    create = asyncio.create_subprocess_exec
+
+    async def _create(*args, **kwargs):
+        processes.append(await create(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", _create)
+    return processes
+
+
+@needs_ffmpeg
+def test_cancelling_mid_decode_kills_ffmpeg(long_video, spawned):
+    async def _decode_all(frames):
+        async for frame in extractor.aiter_frame_bytes(str(long_video / "long.mp4"), frame_rate=10):
+            frames.append(frame)
+
+    async def _run():
+        frames = []
+        task = asyncio.create_task(_decode_all(frames))
+        while not frames:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return frames
+
+    frames = asyncio.run(_run())
+
+    assert 0 < len(frames) < 1200
+    assert len(spawned) == 1 and spawned[0].returncode == -9
+
+
+@needs_ffmpeg
+def test_decode_deadline_kills_ffmpeg_without_stalling_the_loop(long_video, spawned):
+    gaps = []
+
+    async def _heartbeat():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            gaps.append(time.perf_counter() - start)
+
+    async def _run():
+        heartbeat = asyncio.create_task(_heartbeat())
+        try:
+            await extractor.sample_frames_async(str(long_video / "long.mp4"), max_frames=200, frame_rate=2,
+                                                decode_timeout=0.5)
+        finally:
+            heartbeat.cancel()
+
+    with pytest.raises(TimeoutError, match="Decoding frames took over 0.5s"):
+        asyncio.run(_run())
+
+    assert len(spawned) > 2 and all(p.returncode is not None for p in spawned)
+    assert max(gaps) < 0.1
+
+
+@needs_ffmpeg
+def test_concurrent_ffmpeg_processes_are_capped(long_video, spawned, monkeypatch):
+    monkeypatch.setattr(extractor, "FFMPEG_CONCURRENCY", 2)
+    running = []
+
+    async def _watch():
+        while True:
+            running.append(sum(p.returncode is None for p in spawned))
+            await asyncio.sleep(0.002)
+
+    async def _run():
+        watcher = asyncio.create_task(_watch())
+        try:
+            return await asyncio.gather(*(
+                extractor.sample_frames_async(str(long_video / "long.mp4"), max_frames=3, frame_rate=1)
+                for _ in range(4)))
+        finally:
+            watcher.cancel()
+
+    results = asyncio.run(_run())
+
+    assert [len(frames) for frames in results] == [3, 3, 3, 3]
+    assert len(spawned) == 16 and max(running) == 2
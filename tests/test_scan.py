@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import DeadlineExceeded
+
+from app.scan import ScanCheckpoint, aiter_documents, iter_documents
+from app.scheduler import run_sliding_window
+from benchmarks.fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    videos = db.collection("UserVideos")
+    for i in range(25):
+        videos.document(f"doc-{i:02d}").set({"aiVideoModerationStatus": "failed"})
+    for i in range(5):
+        videos.document(f"ok-{i}").set({"aiVideoModerationStatus": "approved"})
+    return db
+
+
+def _query(db):
+    return db.collection("UserVideos").where("aiVideoModerationStatus", "==", "failed")
+
+
+def test_pages_through_every_match_in_id_order(db):
+    ids = [doc.id for doc in iter_documents(_query(db), page_size=10)]
+
+    assert ids == [f"doc-{i:02d}" for i in range(25)]
+    assert db.calls["query"] == 3
+
+
+def test_interrupted_scan_resumes_after_checkpoint(db, tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path / "scan.json"))
+
+    scan = iter_documents(_query(db), page_size=10, checkpoint=checkpoint)
+    first_run = [next(scan).id for _ in range(12)]
+    scan.close()  # the run dies mid-way through the second page
+
+    assert checkpoint.load() == "doc-09"
+    resumed = [doc.id for doc in iter_documents(_query(db), page_size=10, checkpoint=checkpoint)]
+
+    assert first_run[-1] == "doc-11"
+    assert resumed == [f"doc-{i:02d}" for i in range(10, 25)]
+    # A completed scan starts from the top next time.
+    assert checkpoint.load() is None
+
+
+def test_deadline_exceeded_retries_only_the_page(db):
+    pages = iter_documents(_query(db), page_size=10, retry_delay_seconds=0)
+    first = [next(pages).id for _ in range(10)]
+    db.fail_next("query", DeadlineExceeded("slow"), times=2)
+    rest = [doc.id for doc in pages]
+
+    assert first + rest == [f"doc-{i:02d}" for i in range(25)]
+    assert db.calls["query"] == 5
+
+
+def test_gives_up_after_max_retries(db):
+    db.fail_next("query", DeadlineExceeded("slow"), times=3)
+    with pytest.raises(DeadlineExceeded):
+        list(iter_documents(_query(db), page_size=10, max_retries=3, retry_delay_seconds=0))
+
+
+def test_documents_flow_into_the_scheduler_as_pages_arrive(db):
+    async def worker(doc):
+        await asyncio.sleep(0)
+        return doc.id
+
+    async def _main():
+        docs = aiter_documents(_query(db), page_size=10)
+        return [r async for r in run_sliding_window(docs, worker, concurrency=4)]
+
+    assert sorted(asyncio.run(_main())) == [f"doc-{i:02d}" for i in range(25)]
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+from app.scheduler import run_sliding_window, batched, run_stages, Stage, Finished
+
+
+def _collect(items, worker, concurrency):
+    async def _main():
+        return [r async for r in run_sliding_window(items, worker, concurrency)]
+    return asyncio.run(_main())
+
+
+def test_next_item_starts_as_soon_as_a_slot_frees():
+    delays = {"slow": 0.3, "a": 0.05, "b": 0.05, "c": 0.05, "d": 0.05}
+    in_flight = 0
+    peak = 0
+
+    async def worker(name):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(delays[name])
+        in_flight -= 1
+        return name
+
+    start = time.perf_counter()
+    results = _collect(delays, worker, concurrency=2)
+    elapsed = time.perf_counter() - start
+
+    # The four short videos all run in the slot next to the slow one; chunks
+    # of two would take 0.3 + 0.05 + 0.05.
+    assert elapsed < 0.38
+    assert peak == 2
+    # Results stream in completion order, not submission order.
+    assert results[-1] == "slow"
+    assert sorted(results) == sorted(delays)
+
+
+def test_worker_errors_propagate_and_cancel_pending():
+    cancelled = []
+
+    async def worker(i):
+        if i == 0:
+            raise ValueError("boom")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+
+    try:
+        _collect(range(3), worker, concurrency=3)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("worker error was swallowed")
+    assert sorted(cancelled) == [1, 2]
+
+
+def _run_stages(items, stages, queue_size):
+    async def _main():
+        return [r async for r in run_stages(items, stages, queue_size)]
+    return asyncio.run(_main())
+
+
+def test_stages_overlap_and_finished_items_skip_ahead():
+    calls = []
+
+    async def fetch(i):
+        if i == 0:
+            return Finished("skipped")
+        return i
+
+    async def extract(i):
+        calls.append(("extract", i))
+        await asyncio.sleep(0.05)
+        return i * 10
+
+    async def model(i):
+        calls.append(("model", i))
+        await asyncio.sleep(0.05)
+        return i + 1
+
+    stages = [Stage("fetch", fetch, 1), Stage("extract", extract, 2), Stage("model", model, 2)]
+    start = time.perf_counter()
+    results = _run_stages(range(5), stages, queue_size=1)
+    elapsed = time.perf_counter() - start
+
+    assert sorted(results, key=str) == [11, 21, 31, 41, "skipped"]
+    assert ("extract", 0) not in calls
+    # Four items through two 50ms stages, two workers each: stages overlap,
+    # so well under the 0.4s it takes one at a time.
+    assert elapsed < 0.3
+
+
+def test_stage_queues_hold_the_source_back():
+    pulled = []
+
+    def items():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    async def slow(i):
+        await asyncio.sleep(0.01)
+        return i
+
+    async def _main():
+        stream = run_stages(items(), [Stage("slow", slow, 1)], queue_size=2)
+        first = await anext(stream)
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(_main()) == 0
+    # One in the worker, two queued, one waiting on the full queue.
+    assert len(pulled) <= 5
+
+
+def test_stage_errors_propagate():
+    async def worker(i):
+        if i == 2:
+            raise ValueError("boom")
+        return i
+
+    try:
+        _run_stages(range(5), [Stage("one", worker, 2)], queue_size=2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("stage error was swallowed")
+
+
+def test_partial_batches_are_flushed_after_max_wait():
+    async def trickle():
+        yield "a"
+        await asyncio.sleep(0.3)
+        yield "b"
+        yield "c"
+
+    async def _main():
+        start = time.perf_counter()
+        return [(batch, time.perf_counter() - start) async for batch in batched(trickle(), 4, max_wait=0.05)]
+
+    batches = asyncio.run(_main())
+
+    assert [batch for batch, _ in batches] == [["a"], ["b", "c"]]
+    # "a" goes after max_wait, not once "b" shows up.
+    assert batches[0][1] < 0.2
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import Aborted
+
+from app.sink import ResultSink
+from benchmarks.fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    videos = db.collection("UserVideos")
+    for i in range(25):
+        videos.document(f"doc-{i:02d}").set({"aiVideoModerationStatus": "failed"})
+    db.calls.clear()
+    return db
+
+
+def _status(db, doc_id):
+    return db.collection("UserVideos").document(doc_id).get().get("aiVideoModerationStatus")
+
+
+def test_writes_are_committed_in_batches(db):
+    async def run():
+        async with ResultSink(db, max_batch=10, flush_interval=60) as sink:
+            for i in range(25):
+                await sink.add(f"doc-{i:02d}", {"aiVideoModerationStatus": "approved"})
+        return sink
+
+    sink = asyncio.run(run())
+
+    assert sink.written == 25 and sink.batches == 3 and not sink.failed
+    assert db.calls["commit"] == 3 and db.calls["write"] == 0
+    assert all(_status(db, f"doc-{i:02d}") == "approved" for i in range(25))
+
+
+def test_flushes_on_interval_before_the_batch_fills(db):
+    async def run():
+        async with ResultSink(db, max_batch=100, flush_interval=0.05) as sink:
+            await sink.add("doc-00", {"aiVideoModerationStatus": "approved"})
+            await asyncio.sleep(0.2)
+            return sink.written
+
+    assert asyncio.run(run()) == 1
+
+
+def test_failed_batch_is_retried_per_document(db):
+    db.fail_next("commit", Aborted("contention"))
+    db.fail_next("write", Aborted("contention"), times=2)
+
+    async def run():
+        async with ResultSink(db, max_batch=10, flush_interval=60, retry_delay_seconds=0) as sink:
+            for i in range(5):
+                await sink.add(f"doc-{i:02d}", {"aiVideoModerationStatus": "approved"})
+            await sink.add("missing", {"aiVideoModerationStatus": "approved"})
+        return sink
+
+    sink = asyncio.run(run())
+
+    assert sink.written == 5
+    assert list(sink.failed) == ["missing"]
+    assert all(_status(db, f"doc-{i:02d}") == "approved" for i in range(5))
+
+
+def test_failed_batch_is_not_partially_applied(db):
+    db.fail_next("commit", Aborted("contention"))
+    batch = db.batch()
+    batch.update(db.collection("UserVideos").document("doc-00"), {"aiVideoModerationStatus": "approved"})
+
+    with pytest.raises(Aborted):
+        batch.commit()
+    batch = db.batch()
+    batch.update(db.collection("UserVideos").document("doc-00"), {"aiVideoModerationStatus": "approved"})
+    batch.update(db.collection("UserVideos").document("missing"), {"aiVideoModerationStatus": "approved"})
+    with pytest.raises(Exception):
+        batch.commit()
+
+    assert _status(db, "doc-00") == "failed"
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from app.video.extractor import extract_frames
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def server():
+    directory = tempfile.mkdtemp()
+    make_video(os.path.join(directory, "clip.mp4"), duration=6)
+    with VideoServer(directory) as srv:
+        yield srv
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_frames_extracted_straight_from_url(server, tmp_path):
+    frames = extract_frames(server.url("clip.mp4"), str(tmp_path), frame_rate=1)
+
+    assert 5 <= len(frames) <= 8
+    assert all(open(f, "rb").read(2) == b"\xff\xd8" for f in frames)
+    # Only frames were written, never the video itself.
+    assert all(f.endswith(".jpg") for f in os.listdir(tmp_path))
+
+
+def test_trailing_moov_is_reached_with_range_requests(server, tmp_path):
+    del server.requests[:]
+    extract_frames(server.url("clip.mp4"), str(tmp_path), frame_rate=1)
+
+    ranges = [r["range"] for r in server.requests if r["range"]]
+    assert any(not r.startswith("bytes=0-") for r in ranges)
+
+
+def test_missing_video_raises(server, tmp_path):
+    with pytest.raises(RuntimeError, match="FFmpeg failed"):
+        extract_frames(server.url("missing.mp4"), str(tmp_path), frame_rate=1)
@@ -0,0 +1,131 @@
+import csv
+import asyncio
+import shutil
+
+import pytest
+from openai import AsyncOpenAI
+
+from app import cache as cache_module, firestore, metrics, pipeline, worker
+from app.cache import ResultCache
+from app.ai.schema import ModerationVerdict
+from app.lease import LeaseManager
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.http_server import VideoServer
+from benchmarks.synthetic import make_video
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture
+def videos(tmp_path):
+    make_video(str(tmp_path / "clip.mp4"), duration=12)
+    with VideoServer(str(tmp_path)) as server:
+        yield server
+
+
+@pytest.fixture
+def db(monkeypatch, videos):
+    db = FakeFirestore()
+    collection = db.collection("UserVideos")
+    for i in range(4):
+        collection.document(f"doc-{i}").set({
+            "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 1000,
+            "videoUrl": videos.url("clip.mp4"),
+        })
+    collection.document("empty").set({
+        "aiVideoModerationStatus": "failed", "isDeleted": False, "initialSize": 0, "videoUrl": videos.url("clip.mp4"),
+    })
+    monkeypatch.setattr(firestore, "db", db)
+    return db
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    with FakeOpenAI() as server:
+        monkeypatch.setattr("app.ai.client.client", AsyncOpenAI(base_url=server.base_url, api_key="sk-test"))
+        yield server
+
+
+def test_batch_moderates_and_writes_back_end_to_end(db, fake_openai, tmp_path):
+    report = tmp_path / "report.csv"
+
+    counts = asyncio.run(worker.process_batch_async(firestore.stream_failed_videos(), 2, report_path=report))
+
+    assert counts["total"] == 5 and counts["success"] == 4 and counts["failed"] == 1
+    for i in range(4):
+        doc = db.collection("UserVideos").document(f"doc-{i}").get()
+        assert doc.get("aiVideoModerationStatus") == "approved"
+        assert doc.get("aiVideoModerationOutput").keys() == ModerationVerdict.model_fields.keys()
+        assert doc.get("version") == 1
+    assert db.collection("UserVideos").document("empty").get().get("aiVideoModerationStatus") == "failed"
+    with open(report, newline="") as f:
+        rows = {row["id"]: row for row in csv.DictReader(f)}
+    assert rows["empty"]["error"] == "initial size is 0"
+    assert int(rows["doc-0"]["promptTokens"]) > 0 and float(rows["doc-0"]["extractSeconds"]) > 0
+    assert int(rows["doc-0"]["framesSampled"]) >= 1
+    assert (tmp_path / "report_summary.json").exists()
+    assert fake_openai.requests == 4
+
+
+def test_rerun_served_from_cache_reports_no_model_spend(db, fake_openai, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "_cache", ResultCache(":memory:"))
+    asyncio.run(worker.process_batch_async(firestore.stream_failed_videos(), 1, report_path=tmp_path / "first.csv"))
+    requests = fake_openai.requests
+    for i in range(4):
+        db.collection("UserVideos").document(f"doc-{i}").update({"aiVideoModerationStatus": "failed"})
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+    counts = asyncio.run(worker.process_batch_async(
+        firestore.stream_failed_videos(), 1, report_path=tmp_path / "second.csv"))
+
+    assert fake_openai.requests == requests
+    assert counts["success"] == counts["cached"] == 4
+    assert counts["totalTokens"] == 0
+    with open(tmp_path / "second.csv", newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row["status"] == "success"]
+    assert all(row["cached"] == "True" and row["totalTokens"] == "0" for row in rows)
+    assert metrics.registry.summary()["counters"]["moderation_settled_without_model_total_cache"] == 4
+
+
+def test_batch_token_budget_skips_what_it_cannot_pay_for(db, fake_openai, tmp_path, monkeypatch):
+    # Room for the cheapest request of two videos: the other two are turned away.
+    budget = 2 * pipeline.predict_tokens(1, None, None, detail="low") + 100
+    monkeypatch.setattr(worker, "BATCH_TOKEN_BUDGET", budget)
+    report = tmp_path / "report.csv"
+
+    counts = asyncio.run(worker.process_batch_async(firestore.stream_failed_videos(), 1, report_path=report))
+
+    with open(report, newline="") as f:
+        rows = {row["id"]: row for row in csv.DictReader(f)}
+    assert counts["success"] == 2 and counts["skipped"] == 2
+    assert sorted(r["error"] for r in rows.values() if r["status"] == "skipped") == ["batch token budget spent"] * 2
+    assert fake_openai.tokens_served <= budget
+    assert all(int(rows[f"doc-{i}"]["plannedTokens"]) > 0 for i in range(2))
+
+
+def test_pack_fails_documents_whose_lease_was_lost_and_releases_the_rest(db, fake_openai, monkeypatch):
+    leases = LeaseManager(db, owner="me")
+    docs = [db.collection("UserVideos").document(f"doc-{i}").get() for i in range(2)]
+    moderate_packed = worker.moderate_packed
+
+    async def _taken_over(*args, **kwargs):
+        leases.held.discard("doc-0")  # as when renewal finds another owner
+        return await moderate_packed(*args, **kwargs)
+
+    monkeypatch.setattr(worker, "moderate_packed", _taken_over)
+    results = {r["id"]: r for r in asyncio.run(worker.process_pack_async(docs, leases=leases))}
+
+    assert (results["doc-0"]["status"], results["doc-0"]["error"]) == ("failed", "lease lost")
+    assert results["doc-1"]["status"] == "success"
+    assert db.collection("UserVideos").document("doc-0").get().get("aiVideoModerationStatus") == "failed"
+    assert not leases.held
+
+    async def _fails(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(worker, "moderate_packed", _fails)
+    docs = [db.collection("UserVideos").document(f"doc-{i}").get() for i in (2, 3)]
+    with pytest.raises(RuntimeError):
+        asyncio.run(worker.process_pack_async(docs, leases=leases))
+    assert not leases.held